@@ -105,6 +105,7 @@ with DAG(
                 "entryPoint": "s3://power-forecasting-emr-scripts-dev/etl_data.py",
                 "entryPointArguments": ["--dates", "{{ ti.xcom_pull(task_ids='pick_date_range') }}"],
                 "sparkSubmitParameters": (
+                    "--py-files s3://power-forecasting-emr-scripts-dev/power_usage_parser.py "
                     "--conf spark.executor.memory=2g "
                     "--conf spark.executor.cores=1 "
                     "--conf spark.executor.instances=1 "
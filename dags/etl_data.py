@@ -4,10 +4,14 @@ import os
 from typing import List
 
 import boto3
+import numpy as np
 import pandas as pd
 from pyspark.sql import SparkSession, functions
 from pyspark.sql.functions import col
 
+# spark-submitの--py-filesで渡す共通パーサー（src/power_usage_parser.py）
+from power_usage_parser import PowerUsageParseError, load_shape_aggregates, parse_intraday
+
 # zipfileの展開先バケット
 RAW_BUCKET = os.getenv("RAW_BUCKET", "power-forecasting-extract-data-dev")
 # 処理済みデータの保存先バケット
@@ -30,15 +34,15 @@ def parse_arguments() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def read_power_usage_data(date_str: str) -> pd.DataFrame:
+def read_power_usage_data(date_str: str) -> np.ndarray:
     """
-    指定された日付の電力使用量データを読み込み、最大電力を抽出して整形したDataFrameを返す
+    指定された日付の電力使用量データを読み込み、5分間隔の実績値を返す
 
     Args:
         date_str (str): 対象の日付（YYYY-MM-DD形式）
 
     Returns:
-        pd.DataFrame: 最大電力使用量データのDataFrame
+        np.ndarray: 5分間隔の実績値（長さ288）
 
     Raises:
         RuntimeError: データの読み込みに失敗した場合
@@ -47,13 +51,36 @@ def read_power_usage_data(date_str: str) -> pd.DataFrame:
     key = f"raw_power_usage/{yyyymm}/{date_str}/power_usage.csv"
     try:
         body = s3_client.get_object(Bucket=RAW_BUCKET, Key=key)["Body"].read()
-        df = pd.read_csv(io.BytesIO(body), encoding="shift-jis", skiprows=54)
-        max_power = int(df["当日実績(５分間隔値)(万kW)"].max())
-        data = {"date": date_str, "max_power": max_power}
+        values = parse_intraday(body)
     except s3_client.exceptions.NoSuchKey as e:
         msg = f"Power usage data not found for {date_str}"
         raise RuntimeError(msg) from e
-    return pd.DataFrame([data])
+    except PowerUsageParseError as e:
+        msg = f"Malformed power usage data for {date_str}: {e}"
+        raise RuntimeError(msg) from e
+    return values
+
+
+def make_power_usage_df(dates: List[str], intraday: List[np.ndarray]) -> pd.DataFrame:
+    """
+    日ごとの5分間隔値から、最大電力と負荷形状の集計値のDataFrameを作成する
+    全日分を1つの配列にまとめ、集計値を一度にベクトル化して計算する
+
+    Args:
+        dates (List[str]): 日付のリスト（YYYY-MM-DD形式）
+        intraday (List[np.ndarray]): 各日の5分間隔値
+
+    Returns:
+        pd.DataFrame: date, max_power と負荷形状の集計値の列を持つDataFrame
+    """
+    values = np.stack(intraday)
+    return pd.DataFrame(
+        {
+            "date": dates,
+            "max_power": np.nanmax(values, axis=1).astype("int64"),
+            **load_shape_aggregates(values),
+        },
+    )
 
 
 def read_weather_data(date_str: str) -> pd.DataFrame:
@@ -94,7 +121,8 @@ def main(dates: List[str]) -> None:
     Args:
         args (argparse.Namespace): コマンドライン引数
     """
-    power_dfs = []
+    power_dates = []
+    intraday = []
     weather_dfs = []
 
     for d in dates:
@@ -102,10 +130,11 @@ def main(dates: List[str]) -> None:
         weather_data = read_weather_data(d)
 
         if power_data is not None and weather_data is not None:
-            power_dfs.append(power_data)
+            power_dates.append(d)
+            intraday.append(power_data)
             weather_dfs.append(weather_data)
 
-    power_df = spark.createDataFrame(pd.concat(power_dfs).astype({"date": "str"})).withColumn(
+    power_df = spark.createDataFrame(make_power_usage_df(power_dates, intraday)).withColumn(
         "date",
         functions.to_date("date", "yyyy-MM-dd"),
     )
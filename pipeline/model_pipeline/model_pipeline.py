@@ -122,6 +122,10 @@ def get_pipeline(
         name="EMROutputUri",
         default_value=f"s3://power-forecasting-processed-data-{environment}/",
     )
+    window_state_uri = ParameterString(
+        name="WindowStateUri",
+        default_value=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/window_state",
+    )
     sklearn_processor = SKLearnProcessor(
         framework_version="0.23-1",
         instance_type=processing_instance_type,
@@ -144,11 +148,14 @@ def get_pipeline(
         ],
         outputs=[
             ProcessingOutput(output_name="extract_features", source="/opt/ml/processing/extract_features"),
+            ProcessingOutput(output_name="window_state", source="/opt/ml/processing/window_state"),
         ],
         code=str(BASE_DIR / "preprocess.py"),
         job_arguments=[
             "--input-data",
             "/opt/ml/processing/input_data/",
+            "--window-state-uri",
+            window_state_uri,
         ],
         cache_config=cache_config,
     )
@@ -173,6 +180,12 @@ def get_pipeline(
                 source=step_process.properties.ProcessingOutputConfig.Outputs["extract_features"].S3Output.S3Uri,
                 destination="/opt/ml/processing/extract_features",
             ),
+            # 登録が成功した後にwindow_state_uriへ反映する、前処理で更新したstate
+            ProcessingInput(
+                source=step_process.properties.ProcessingOutputConfig.Outputs["window_state"].S3Output.S3Uri,
+                destination="/opt/ml/processing/window_state",
+            ),
+            ProcessingInput(source=str(BASE_DIR), destination="/opt/ml/processing/deps"),
         ],
         outputs=[
             ProcessingOutput(
@@ -186,13 +199,47 @@ def get_pipeline(
             feature_group_name_param,
             "--region",
             region,
+            "--window-state-uri",
+            window_state_uri,
         ],
         cache_config=cache_config,
     )
 
+    # === Offlineストアの最新レコードのスナップショットを更新するステップ ===
+    offline_snapshot_uri = ParameterString(
+        name="OfflineSnapshotUri",
+        default_value=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/offline_snapshot",
+    )
+    compact_proc = ScriptProcessor(
+        image_uri=image_uri,
+        command=["python3"],
+        instance_type=processing_instance_type,
+        instance_count=processing_instance_count,
+        base_job_name=f"{base_job_prefix}/compact-offline-store",
+        sagemaker_session=sagemaker_session,
+        role=role,
+    )
+    step_compact = ProcessingStep(
+        name="CompactOfflineStore",
+        processor=compact_proc,
+        inputs=[
+            ProcessingInput(
+                source=step_ingest.properties.ProcessingOutputConfig.Outputs["offline_uri"].S3Output.S3Uri,
+                destination="/opt/ml/processing/offline_meta",
+            ),
+            ProcessingInput(source=str(BASE_DIR), destination="/opt/ml/processing/deps"),
+        ],
+        code=str(BASE_DIR / "compact_offline_store.py"),
+        job_arguments=[
+            "--snapshot-uri",
+            offline_snapshot_uri,
+        ],
+    )
+
     # === train, testデータの準備ステップ ===
     glue_db = ParameterString("glue_db", default_value="power_features_db")
     glue_table = ParameterString("glue_table", default_value="power_forecast_features")
+    offline_store_backend = ParameterString("OfflineStoreBackend", default_value="athena")
 
     dataprep_proc = ScriptProcessor(
         image_uri=image_uri,
@@ -226,8 +273,15 @@ def get_pipeline(
             glue_table,
             "--region",
             region,
+            "--window-state-uri",
+            window_state_uri,
+            "--offline-store-backend",
+            offline_store_backend,
+            "--snapshot-uri",
+            offline_snapshot_uri,
         ],
         cache_config=cache_config,
+        depends_on=[step_compact],
     )
 
     # === モデルのトレーニングステップ ===
@@ -242,6 +296,8 @@ def get_pipeline(
     )
 
     model_path = f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/Train"
+    # 承認済みのモデルのmodel.tar.gz（指定した場合は追加学習し、空の場合は全期間で学習する）
+    init_model_uri = ParameterString(name="InitModelUri", default_value="")
 
     # SKLearn estimatorを作成
     train_estimator = SKLearn(
@@ -252,7 +308,17 @@ def get_pipeline(
         instance_count=1,  # SKLearnは並列学習をサポートしていないので"1"固定
         framework_version="1.2-1",
         base_job_name=f"{base_job_prefix}/train",
-        hyperparameters={"n_estimators": 100},
+        hyperparameters={
+            "n_estimators": 100,
+            "cv_folds": 5,
+            "init_model_uri": init_model_uri,
+            "dataset_cache_dir": "/opt/ml/checkpoints/dataset_cache",
+            # 0より大きい場合は学習データを全体を読み込まずにバッチごとに学習する（学習インスタンスのメモリに合わせる）
+            "memory_budget_mb": pipeline_config.get("training_memory_budget_mb", 0),
+            "area_mode": pipeline_config.get("training_area_mode", "global"),
+        },
+        # チェックポイントのディレクトリをS3と同期し、ビン分割済みのDatasetのキャッシュを次回の学習で使う
+        checkpoint_s3_uri=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/checkpoints",
         output_path=model_path,
         py_version="py3",
     )
@@ -263,7 +329,7 @@ def get_pipeline(
         inputs={
             "train": TrainingInput(
                 s3_data=step_dataprep.properties.ProcessingOutputConfig.Outputs["train"].S3Output.S3Uri,
-                content_type="text/csv",
+                content_type="application/x-parquet",
             ),
         },
         cache_config=cache_config,
@@ -285,6 +351,8 @@ def get_pipeline(
         role=role,
         entry_point="inference.py",
         source_dir="src",
+        # 推論時のラグ・移動窓特徴量は、前処理が日次で更新する最新のstateから作成する
+        env={"WINDOW_STATE_URI": window_state_uri},
         sagemaker_session=sagemaker_session,
     )
 
@@ -333,7 +401,7 @@ def get_pipeline(
             "--model-path",
             "/opt/ml/processing/model/model.tar.gz",
             "--test-path",
-            "/opt/ml/processing/test/test.csv",
+            "/opt/ml/processing/test/test.parquet",
             "--feature-names-path",
             "/opt/ml/processing/train/features.txt",
             "--output-path",
@@ -353,14 +421,15 @@ def get_pipeline(
         role=role,
     )
 
+    # 評価ステップの予測値・評価指標・特徴量重要度を使い、モデルの読み込みと予測をし直さない
     step_visualization = ProcessingStep(
         name="VisualizeResults",
         processor=visualization_script_processor,
         inputs=[
             ProcessingInput(
-                source=step_train.properties.ModelArtifacts.S3ModelArtifacts,
-                destination="/opt/ml/processing/model",
-                input_name="model",
+                source=step_evaluate.properties.ProcessingOutputConfig.Outputs["evaluation"].S3Output.S3Uri,
+                destination="/opt/ml/processing/evaluation",
+                input_name="evaluation",
             ),
             ProcessingInput(
                 source=step_dataprep.properties.ProcessingOutputConfig.Outputs["train"].S3Output.S3Uri,
@@ -376,10 +445,10 @@ def get_pipeline(
         outputs=[ProcessingOutput(output_name="visualizations", source="/opt/ml/processing/visualizations")],
         code=str(BASE_DIR / "visualization.py"),
         job_arguments=[
-            "--model-path",
-            "/opt/ml/processing/model/model.tar.gz",
+            "--evaluation-path",
+            "/opt/ml/processing/evaluation",
             "--test-path",
-            "/opt/ml/processing/test/test.csv",
+            "/opt/ml/processing/test/test.parquet",
             "--feature-names-path",
             "/opt/ml/processing/train/features.txt",
             "--output-path",
@@ -444,10 +513,23 @@ def get_pipeline(
             training_instance_count,
             feature_group_name_param,
             emr_output_uri,
+            window_state_uri,
             glue_db,
             glue_table,
+            offline_store_backend,
+            offline_snapshot_uri,
+            init_model_uri,
+        ],
+        steps=[
+            step_process,
+            step_ingest,
+            step_compact,
+            step_dataprep,
+            step_train,
+            step_evaluate,
+            step_visualization,
+            step_cond,
         ],
-        steps=[step_process, step_ingest, step_dataprep, step_train, step_evaluate, step_visualization, step_cond],
         sagemaker_session=sagemaker_session,
     )
     return pipeline
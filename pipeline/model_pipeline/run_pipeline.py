@@ -29,6 +29,19 @@ desc = sagemaker_client.describe_feature_group(FeatureGroupName="power_forecast_
 glue_db = desc["OfflineStoreConfig"]["DataCatalogConfig"]["Database"]
 glue_table = desc["OfflineStoreConfig"]["DataCatalogConfig"]["TableName"]
 
+# 最新の承認済みモデルを追加学習の元にする（承認済みのモデルがない場合は全期間で学習する）
+approved = sagemaker_client.list_model_packages(
+    ModelPackageGroupName="PowerForecastPackageGroup",
+    ModelApprovalStatus="Approved",
+    SortBy="CreationTime",
+    SortOrder="Descending",
+    MaxResults=1,
+)["ModelPackageSummaryList"]
+init_model_uri = ""
+if approved:
+    package = sagemaker_client.describe_model_package(ModelPackageName=approved[0]["ModelPackageArn"])
+    init_model_uri = package["InferenceSpecification"]["Containers"][0]["ModelDataUrl"]
+
 pipeline = get_pipeline(
     region=region,
     role=role,
@@ -48,6 +61,7 @@ execution = pipeline.start(
     parameters={
         "glue_db": glue_db,
         "glue_table": glue_table,
+        "InitModelUri": init_model_uri,
     },
 )
 print("Started pipeline execution:")
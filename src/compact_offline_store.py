@@ -0,0 +1,242 @@
+import subprocess
+import sys
+
+# 必要なパッケージをその場でインストール
+subprocess.run([sys.executable, "-m", "pip", "install", "--quiet", "pyarrow"], check=True)
+sys.path.append("/opt/ml/processing/deps")
+
+import argparse
+import datetime
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+from offline_store import (
+    DELETED_COLUMN,
+    OFFLINE_STORE_METADATA_COLUMNS,
+    OFFLINE_STORE_PARTITION_COLUMNS,
+    SNAPSHOT_PARTITION_COLUMN,
+    keep_latest,
+)
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+MANIFEST_FILENAME = "_manifest.json"
+
+
+def partition_key(path: str) -> Tuple[int, ...]:
+    """Offlineストアのファイルのパスから、イベント時刻のパーティション（年・月・日・時）を取り出す
+
+    Args:
+        path: year=/month=/day=/hour=のパーティションを含むファイルのパス
+
+    Returns:
+        Tuple[int, ...]: 年・月・日・時のタプル
+    """
+    values = dict(part.split("=", 1) for part in path.split("/") if "=" in part)
+    return tuple(int(values[column]) for column in OFFLINE_STORE_PARTITION_COLUMNS)
+
+
+def watermark_key(watermark: str) -> Tuple[int, ...]:
+    """イベント時刻（ISO 8601）を、その時刻を含むパーティションの年・月・日・時のタプルに変換する"""
+    timestamp = datetime.datetime.fromisoformat(watermark.replace("Z", "+00:00"))
+    return (timestamp.year, timestamp.month, timestamp.day, timestamp.hour)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    SageMakerから渡される引数をパースする
+
+    Returns:
+        argparse.Namespace: パースされた引数
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--offline-store-uri",
+        type=str,
+        default="",
+        help="Offlineストアのデータのプレフィックス（省略時はIngestToFeatureStoreが出力したURI）",
+    )
+    parser.add_argument("--snapshot-uri", type=str, required=True, help="スナップショットの保存先")
+    return parser.parse_args()
+
+
+class SnapshotCompactor:
+    """Offlineストアに新しく取り込まれたレコードだけを、record_idごとの最新レコードのスナップショットにマージするクラス
+    スナップショットはdateの年月でパーティション分割し、新しいレコードを含む年月のファイルだけを書き換える
+    Offlineストアはウォーターマーク（処理済みの最新のイベント時刻）を含む時間以降のパーティションだけを一覧し、
+    マニフェストにはその時間のパーティションの処理済みファイルだけを記録する（書き込みが遅れたファイルも次回の実行で
+    取り込まれ、一覧の量とマニフェストの大きさは履歴の長さに依存しない）
+    """
+
+    def __init__(self, offline_store_uri: str, snapshot_uri: str) -> None:
+        """
+        Args:
+            offline_store_uri (str): Offlineストアのデータのプレフィックス（s3://）またはローカルのディレクトリ
+            snapshot_uri (str): スナップショットの保存先（s3://）またはローカルのディレクトリ
+        """
+        self.offline_store_uri = offline_store_uri
+        self.offline_fs, self.offline_path = pafs.FileSystem.from_uri(offline_store_uri)
+        self.snapshot_fs, self.snapshot_path = pafs.FileSystem.from_uri(snapshot_uri)
+        self.manifest_path = f"{self.snapshot_path.rstrip('/')}/{MANIFEST_FILENAME}"
+
+    def load_manifest(self) -> Dict:
+        """マニフェストを読み込む（存在しない場合は空のマニフェストを返す）"""
+        if self.snapshot_fs.get_file_info(self.manifest_path).type == pafs.FileType.NotFound:
+            return {"files": [], "watermark": None, "records": 0}
+        with self.snapshot_fs.open_input_stream(self.manifest_path) as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def save_manifest(self, manifest: Dict) -> None:
+        """マニフェストを保存する（スナップショットの書き換えが終わった後に保存して、処理済みのファイルを確定する）"""
+        manifest["updated_at"] = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()  # noqa: UP017
+        with self.snapshot_fs.open_output_stream(self.manifest_path) as f:
+            f.write(json.dumps(manifest, indent=2).encode("utf-8"))
+
+    def list_new_files(self, processed: List[str], watermark: Union[str, None] = None) -> List[str]:
+        """Offlineストアのファイルのうち、処理済みでないファイルのパスを返す
+        ウォーターマークがある場合は、その時間以降のパーティションのディレクトリだけを一覧する
+
+        Args:
+            processed: 処理済みのファイルのパス（ウォーターマークの時間のパーティションのもの）
+            watermark: 処理済みの最新のイベント時刻（Noneの場合は全てのパーティションを一覧する）
+
+        Returns:
+            List[str]: 新しいファイルのパス
+        """
+        lower = None if watermark is None else watermark_key(watermark)
+        processed_set = set(processed)
+        return sorted(
+            path
+            for path in self._list_files(self.offline_path.rstrip("/"), lower, 0)
+            if path.endswith(".parquet") and path not in processed_set
+        )
+
+    def _list_files(self, path: str, lower: Union[Tuple[int, ...], None], level: int) -> List[str]:
+        """パーティションの階層をたどり、lower以降のパーティションのファイルを一覧する
+
+        Args:
+            path: 一覧するディレクトリ
+            lower: 一覧するパーティションの下限（年・月・日・時）。Noneの場合は以下を全て一覧する
+            level: pathのパーティションの階層（0: 年, 1: 月, 2: 日, 3: 時）
+
+        Returns:
+            List[str]: ファイルのパス
+        """
+        if lower is None or level == len(OFFLINE_STORE_PARTITION_COLUMNS):
+            selector = pafs.FileSelector(path, recursive=True, allow_not_found=True)
+            return [info.path for info in self.offline_fs.get_file_info(selector) if info.type == pafs.FileType.File]
+        files = []
+        prefix = f"{OFFLINE_STORE_PARTITION_COLUMNS[level]}="
+        for info in self.offline_fs.get_file_info(pafs.FileSelector(path, allow_not_found=True)):
+            name = info.base_name
+            if info.type != pafs.FileType.Directory or not name.startswith(prefix):
+                continue
+            value = int(name[len(prefix) :])
+            if value > lower[level]:
+                # 下限より後のパーティションは全て新しい
+                files += self._list_files(info.path, None, level + 1)
+            elif value == lower[level]:
+                files += self._list_files(info.path, lower, level + 1)
+        return files
+
+    def read_records(self, files: List[str]) -> pa.Table:
+        """Offlineストアのファイルから、record_idごとの最新レコードを読み込む
+
+        Args:
+            files: 読み込むファイルのパス
+
+        Returns:
+            pa.Table: record_idごとに最新の1行を持つテーブル（is_deleted以外のメタデータの列は除く。
+                スナップショットのレコードを削除できるように、最新のレコードが削除の場合も残す）
+        """
+        dataset = ds.dataset(files, filesystem=self.offline_fs, format="parquet")
+        schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()])
+        excluded = set(OFFLINE_STORE_METADATA_COLUMNS + OFFLINE_STORE_PARTITION_COLUMNS) - {DELETED_COLUMN}
+        columns = [name for name in schema.names if name not in excluded]
+        dataset = ds.dataset(files, schema=schema, filesystem=self.offline_fs, format="parquet")
+        return keep_latest(dataset.to_table(columns=columns, use_threads=True), drop_deleted=False)
+
+    def partition_file(self, month: str) -> str:
+        """年月のパーティションのファイルパスを返す"""
+        return f"{self.snapshot_path.rstrip('/')}/{SNAPSHOT_PARTITION_COLUMN}={month}/part-0.parquet"
+
+    def merge_month(self, month: str, new_records: pa.Table) -> int:
+        """1か月分のスナップショットに新しいレコードをマージして書き換える
+
+        Args:
+            month: 年月（YYYY-MM）
+            new_records: その年月の新しいレコード
+
+        Returns:
+            int: マージ後のレコード数
+        """
+        path = self.partition_file(month)
+        if self.snapshot_fs.get_file_info(path).type != pafs.FileType.NotFound:
+            current = pq.read_table(path, filesystem=self.snapshot_fs)
+            # 列が追加された場合も結合できるように、不足する列は欠損値で補う
+            merged = pa.concat_tables([current, new_records], promote_options="default")
+        else:
+            merged = new_records
+        # 最新のレコードが削除のrecord_idはスナップショットから除く
+        merged = keep_latest(merged)
+
+        # 一時ファイルに書き込んでから置き換え、途中で失敗しても既存のファイルを壊さない
+        tmp_path = f"{path}.tmp"
+        self.snapshot_fs.create_dir(path.rsplit("/", 1)[0], recursive=True)
+        pq.write_table(merged, tmp_path, filesystem=self.snapshot_fs)
+        self.snapshot_fs.move(tmp_path, path)
+        return merged.num_rows
+
+    def run(self) -> Dict:
+        """新しく取り込まれたレコードをスナップショットにマージする
+
+        Returns:
+            Dict: 更新後のマニフェスト
+        """
+        manifest = self.load_manifest()
+        new_files = self.list_new_files(manifest["files"], manifest["watermark"])
+        if not new_files:
+            logger.info("No new offline store files to compact")
+            return manifest
+
+        new_records = self.read_records(new_files)
+        months = pc.utf8_slice_codeunits(new_records["date"], 0, 7)
+        touched = sorted(set(months.to_pylist()))
+        for month in touched:
+            rows = self.merge_month(month, new_records.filter(pc.equal(months, month)))
+            logger.info(f"Compacted {SNAPSHOT_PARTITION_COLUMN}={month}: {rows} records")
+
+        watermark = pc.max(new_records["event_time"]).as_py()
+        manifest["watermark"] = max(filter(None, [manifest["watermark"], watermark]))
+        # 次回はウォーターマークの時間以降だけを一覧するため、その時間のパーティションのファイルだけを記録する
+        lower = watermark_key(manifest["watermark"])
+        manifest["files"] = sorted(path for path in manifest["files"] + new_files if partition_key(path) >= lower)
+        manifest["records"] = sum(
+            pq.read_metadata(info.path, filesystem=self.snapshot_fs).num_rows
+            for info in self.snapshot_fs.get_file_info(pafs.FileSelector(self.snapshot_path, recursive=True))
+            if info.path.endswith(".parquet")
+        )
+        self.save_manifest(manifest)
+        logger.info(
+            f"Merged {new_records.num_rows} new records from {len(new_files)} files into {len(touched)} months "
+            f"(snapshot: {manifest['records']} records, watermark: {manifest['watermark']})",
+        )
+        return manifest
+
+
+if __name__ == "__main__":
+    logger.info("Starting offline store compaction...")
+    args = parse_args()
+    offline_store_uri = args.offline_store_uri or Path("/opt/ml/processing/offline_meta/uri.txt").read_text().strip()
+    SnapshotCompactor(offline_store_uri, args.snapshot_uri).run()
+    logger.info("Finished offline store compaction...")
@@ -0,0 +1,52 @@
+from typing import Iterator, Tuple, Union
+
+import numpy as np
+
+
+def time_series_splits(
+    dates: np.ndarray,
+    n_splits: int = 5,
+    horizon: Union[int, None] = None,
+    gap: int = 0,
+    window: Union[int, None] = None,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """日付順に並んだデータに対して、ローリングオリジン方式の時系列交差検証の分割を作成する
+    分割は日付単位で行うため、同じ日付の行（複数エリアなど）は必ず同じ側に入る
+    データはコピーせず、学習・検証に使う行の位置（整数のインデックス配列）だけを返す
+
+    Args:
+        dates: 昇順に並んだ各行の日付
+        n_splits: 分割数（fold数）
+        horizon: 1つのfoldの検証期間の日数（省略時は末尾からn_splits個の検証期間を均等に取る）
+        gap: 学習期間と検証期間の間に空ける日数（リークを避けるため）
+        window: 学習期間の日数（省略時は先頭からの拡張ウィンドウ、指定時は固定長のローリングウィンドウ）
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: 学習に使う行の位置と検証に使う行の位置（いずれも昇順）
+
+    Raises:
+        ValueError: 日付が昇順でない、または分割に必要な日数が足りない場合
+    """
+    dates = np.asarray(dates)
+    if len(dates) > 1 and (dates[1:] < dates[:-1]).any():
+        msg = "dates must be sorted in ascending order"
+        raise ValueError(msg)
+
+    unique_dates = np.unique(dates)
+    n_dates = len(unique_dates)
+    horizon = horizon or n_dates // (n_splits + 1)
+    first_valid = n_dates - n_splits * horizon
+    if horizon < 1 or first_valid - gap < 1:
+        msg = f"Not enough dates ({n_dates}) for {n_splits} folds with horizon={horizon} and gap={gap}"
+        raise ValueError(msg)
+
+    # 各日付が始まる行の位置（末尾に行数を加えて、日付の位置から行の範囲を求められるようにする）
+    starts = np.append(np.searchsorted(dates, unique_dates, side="left"), len(dates))
+    for fold in range(n_splits):
+        valid_start = first_valid + fold * horizon
+        train_end = valid_start - gap
+        train_start = 0 if window is None else max(0, train_end - window)
+        yield (
+            np.arange(starts[train_start], starts[train_end]),
+            np.arange(starts[valid_start], starts[valid_start + horizon]),
+        )
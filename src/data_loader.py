@@ -3,10 +3,17 @@ import logging
 import os
 import pathlib
 import zipfile
-from typing import List
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
+from intraday_store import IntradayStore
+from power_usage_cache import PowerUsageCache
+from power_usage_parser import parse_intraday
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
@@ -31,23 +38,91 @@ def parse_args() -> argparse.Namespace:
         type=str,
         default=os.environ.get("SM_CHANNEL_POWER_USAGE", "/opt/ml/processing/input/power_usage/"),
     )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="電力使用量のZIPファイルを並列に読み込むプロセス数（省略時はCPU数）",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=os.environ.get("SM_POWER_USAGE_CACHE_DIR", ""),
+        help="パース済みの電力使用量データのキャッシュディレクトリ（省略時はキャッシュしない）",
+    )
+    parser.add_argument("--cache-max-mb", type=int, default=512, help="キャッシュの合計サイズの上限（MB）")
+    parser.add_argument(
+        "--intraday-store-dir",
+        type=str,
+        default=os.environ.get("SM_INTRADAY_STORE_DIR", ""),
+        help="5分間隔値を追記するストアのディレクトリ（省略時は保存しない）",
+    )
 
     return parser.parse_args()
 
 
+class PowerUsageLoadError(Exception):
+    """電力使用量データの読み込みに失敗したファイルがある場合のエラー"""
+
+    def __init__(self, errors: List[str]) -> None:
+        """
+        Args:
+            errors: 読み込みに失敗したファイルとエラー内容のリスト
+        """
+        self.errors = errors
+        super().__init__(f"Failed to read {len(errors)} power usage files: {errors[:5]}")
+
+
+def load_power_usage_archive(zip_path: str) -> Tuple[List[Dict], List[str]]:
+    """1つのZIPファイル内の日別CSVから最大電力と5分間隔値を読み込む（プロセスプールのワーカーで実行される）
+
+    Args:
+        zip_path: ZIPファイルのパス
+
+    Returns:
+        Tuple[List[Dict], List[str]]: 日付・最大電力・5分間隔値の辞書のリストと、失敗したファイルのエラー内容のリスト
+    """
+    records = []
+    errors = []
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for csv_filename in zip_ref.namelist():
+            if not csv_filename.endswith(".csv"):
+                continue
+
+            try:
+                intraday = parse_intraday(zip_ref.read(csv_filename))
+                records.append(
+                    {"date": csv_filename.split("_")[0], "max_power": int(np.nanmax(intraday)), "intraday": intraday},
+                )
+            except Exception as e:
+                errors.append(f"{pathlib.Path(zip_path).name}/{csv_filename}: {e}")
+    return records, errors
+
+
 class DataLoader:
     """データ読み込みを担当するクラス"""
 
-    def __init__(self, weather_data_path: str, power_usage_data_path: str) -> None:
+    def __init__(
+        self,
+        weather_data_path: str,
+        power_usage_data_path: str,
+        cache: Union[PowerUsageCache, None] = None,
+        intraday_store: Union[IntradayStore, None] = None,
+    ) -> None:
         """
         Args:
             config: 設定情報の辞書
                 - data_dir: データディレクトリのパス
                 - weather_file: 気象データファイル名
                 - power_usage_dir: 電力使用量データディレクトリ名
+            cache: パース済みの電力使用量データのキャッシュ（省略時はキャッシュしない）
+            intraday_store: 5分間隔値の追記先のストア（省略時は最大電力だけを残す）
         """
         self.weather_file = weather_data_path
         self.power_usage_dir = power_usage_data_path
+        self.cache = cache
+        self.intraday_store = intraday_store
+        self.load_errors: List[str] = []
 
     def load_weather_data(self, encoding: str = "shift-jis", skiprows: List[int] = [0, 1, 2, 4, 5]) -> pd.DataFrame:
         """気象データファイルを読み込む
@@ -79,49 +154,108 @@ class DataLoader:
 
         return df
 
-    def load_power_usage_data(self) -> pd.DataFrame:
+    def iter_power_usage_archives(self, max_workers: Union[int, None] = None) -> Iterator[Tuple[str, List[Dict]]]:
+        """電力使用量のZIPファイルをプロセスプールで並列に読み込み、ファイル名順（日付順）に結果を返す
+        同時に処理するZIPファイルはワーカー数までに制限するため、メモリ使用量はワーカー数に比例する
+        キャッシュが有効な場合、内容が変わっていないZIPファイルはパースせずにキャッシュから返す
+
+        Args:
+            max_workers: プロセス数（省略時はCPU数、1の場合はプロセスプールを使わない）
+
+        Yields:
+            Tuple[str, List[Dict]]: ZIPファイル名と、日付・最大電力・5分間隔値の辞書のリスト
+        """
+        zip_names = [name for name in sorted(os.listdir(self.power_usage_dir)) if name.endswith(".zip")]
+        max_workers = max_workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+
+        # 処理中のZIPファイル名・キャッシュキー・結果（またはFuture）・キャッシュから取得したかどうか
+        pending: Deque[Tuple[str, str, Union[Future, Tuple[List[Dict], List[str]]], bool]] = deque()
+        try:
+            for zip_name in zip_names:
+                zip_path = os.path.join(self.power_usage_dir, zip_name)
+                key = self.cache.key(zip_path) if self.cache else ""
+                cached = self.cache.get(key) if self.cache else None
+                if cached is not None:
+                    pending.append((zip_name, key, (cached, []), True))
+                elif executor is None:
+                    pending.append((zip_name, key, load_power_usage_archive(zip_path), False))
+                else:
+                    pending.append((zip_name, key, executor.submit(load_power_usage_archive, zip_path), False))
+                # 処理中のZIPファイルがワーカー数を超えたら、先頭から順に結果を受け取る
+                if len(pending) >= max_workers:
+                    yield self._receive(*pending.popleft())
+            while pending:
+                yield self._receive(*pending.popleft())
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            if self.cache:
+                self.cache.flush()
+                logger.info(f"Power usage cache: {self.cache.hits} hits, {self.cache.misses} misses")
+
+    def _receive(
+        self,
+        zip_name: str,
+        key: str,
+        result: Union[Future, Tuple[List[Dict], List[str]]],
+        from_cache: bool,
+    ) -> Tuple[str, List[Dict]]:
+        """ワーカーの結果を受け取り、エラーを集約する（エラーがなければキャッシュに保存する）"""
+        records, errors = result.result() if isinstance(result, Future) else result
+        self.load_errors.extend(errors)
+        if self.cache and not from_cache and not errors:
+            self.cache.put(key, records, source=zip_name)
+        return zip_name, records
+
+    def load_power_usage_data(self, max_workers: Union[int, None] = None, strict: bool = False) -> pd.DataFrame:
         """電力使用量データを読み込む
 
+        Args:
+            max_workers: ZIPファイルを並列に読み込むプロセス数（省略時はCPU数）
+            strict: 読み込みに失敗したファイルがある場合にエラーにするか
+
         Returns:
             pd.DataFrame: 電力使用量データフレーム
+
+        Raises:
+            PowerUsageLoadError: strict=Trueで、読み込みに失敗したファイルがある場合
         """
-        zip_dir = self.power_usage_dir
+        self.load_errors = []
         result = []
+        for _, records in self.iter_power_usage_archives(max_workers=max_workers):
+            result.extend(records)
+        intraday = [record.pop("intraday") for record in result]
 
-        # ZIP内のCSVファイルからデータを読み込む
-        for zip_name in sorted(os.listdir(zip_dir)):
-            if not zip_name.endswith(".zip"):
-                continue
-
-            zip_path = os.path.join(zip_dir, zip_name)
-
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                for csv_filename in zip_ref.namelist():
-                    if not csv_filename.endswith(".csv"):
-                        continue
-
-                    with zip_ref.open(csv_filename) as csv_file:
-                        try:
-                            df = pd.read_csv(csv_file, encoding="shift-jis", skiprows=54)
-                            max_power = df["当日実績(５分間隔値)(万kW)"].max()
-                            result.append({"date": csv_filename.split("_")[0], "max_power": max_power})
-                        except Exception as e:
-                            logger.info(f"Error reading {csv_filename}: {e}")
+        if self.load_errors:
+            logger.info(f"Failed to read {len(self.load_errors)} power usage files: {self.load_errors}")
+            if strict:
+                raise PowerUsageLoadError(self.load_errors)
 
         # 結果をDataFrameに変換
         power_usage_df = pd.DataFrame(result)
         power_usage_df["date"] = pd.to_datetime(power_usage_df["date"], format="%Y%m%d")
 
+        if self.intraday_store is not None and intraday:
+            order = np.argsort(power_usage_df["date"].to_numpy(), kind="stable")
+            self.intraday_store.append(
+                power_usage_df["date"].to_numpy()[order],
+                np.stack(intraday)[order],
+            )
+
         return power_usage_df
 
-    def merge_data(self) -> pd.DataFrame:
+    def merge_data(self, max_workers: Union[int, None] = None) -> pd.DataFrame:
         """気象データと電力使用量データを統合する
 
+        Args:
+            max_workers: 電力使用量のZIPファイルを並列に読み込むプロセス数（省略時はCPU数）
+
         Returns:
             pd.DataFrame: 統合されたデータフレーム
         """
         weather_df = self.load_weather_data()
-        power_usage_df = self.load_power_usage_data()
+        power_usage_df = self.load_power_usage_data(max_workers=max_workers)
 
         # dateカラムを使って両方のデータフレームを結合
         return weather_df.merge(power_usage_df, on="date", how="inner")
@@ -137,11 +271,14 @@ if __name__ == "__main__":
     weather_input_data_path = args.weather_input_data
     power_usage_input_data_path = args.power_usage_input_data
 
+    cache = PowerUsageCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
     data_loader = DataLoader(
         weather_data_path=weather_input_data_path,
         power_usage_data_path=power_usage_input_data_path,
+        cache=cache,
+        intraday_store=IntradayStore(args.intraday_store_dir) if args.intraday_store_dir else None,
     )
-    merged_data = data_loader.merge_data()
+    merged_data = data_loader.merge_data(max_workers=args.max_workers)
 
     pathlib.Path(f"{base_dir}/output").mkdir(parents=True, exist_ok=True)
     pd.DataFrame(merged_data).to_pickle(f"{base_dir}/output/merged_data.pkl")
@@ -4,7 +4,7 @@ import sys
 sys.path.append("/opt/ml/processing/deps")
 # 必要なパッケージをその場でインストール
 subprocess.run(
-    [sys.executable, "-m", "pip", "install", "--quiet", "awswrangler", "omegaconf", "category-encoders"],
+    [sys.executable, "-m", "pip", "install", "--quiet", "awswrangler", "omegaconf", "category-encoders", "pyarrow"],
     check=True,
 )
 
@@ -12,19 +12,25 @@ import argparse
 import logging
 import pickle
 from pathlib import Path
-from typing import Dict, Tuple, Union
+from typing import Dict, List, Tuple, Union
 
-import awswrangler as wr
-import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from omegaconf import DictConfig, OmegaConf
 
+from feature_dtypes import compact_dtypes
 from feature_encoder import FeatureEncoder
+from offline_store import READERS, OfflineStoreReader, SnapshotReader, make_reader
+from window_state import WindowState
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+# エリアの列（特徴量ではなく、エリアごとの学習・評価で行を分けるために使う）
+AREA_COL = "area"
+
 
 def load_config(config_path: str) -> DictConfig:
     """設定ファイルを読み込む
@@ -50,42 +56,239 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--glue-db", type=str)
     parser.add_argument("--glue-table", type=str)
     parser.add_argument("--region", type=str, default="ap-northeast-1")
+    parser.add_argument(
+        "--window-state-uri",
+        type=str,
+        default="",
+        help="推論時に使用するラグ・移動窓特徴量のstateの保存先（モデルと一緒に保存する）",
+    )
+    parser.add_argument(
+        "--offline-store-backend",
+        type=str,
+        default="athena",
+        choices=list(READERS),
+        help=(
+            "Offlineストアの読み込み方法"
+            "（athena: Athenaのクエリ, parquet: Parquetファイルを直接読み込む,"
+            " snapshot: 最新レコードのスナップショット）"
+        ),
+    )
+    parser.add_argument(
+        "--offline-store-uri",
+        type=str,
+        default="",
+        help="parquetで読み込むOfflineストアのURI（省略時はIngestToFeatureStoreが出力したURI）",
+    )
+    parser.add_argument(
+        "--snapshot-uri",
+        type=str,
+        default="",
+        help="snapshotで読み込むスナップショットのURI（compact_offline_store.pyの出力先）",
+    )
     return parser.parse_args()
 
 
+def make_offline_store_reader(args: argparse.Namespace) -> OfflineStoreReader:
+    """コマンドライン引数で指定されたOfflineストアの読み込みクラスを作成する
+
+    Args:
+        args: コマンドライン引数
+
+    Returns:
+        OfflineStoreReader: 読み込みクラスのインスタンス
+    """
+    if args.offline_store_backend == "athena":
+        reader = make_reader("athena", glue_db=args.glue_db, glue_table=args.glue_table, region=args.region)
+    elif args.offline_store_backend == "snapshot":
+        reader = make_reader("snapshot", uri=args.snapshot_uri)
+    else:
+        uri = args.offline_store_uri or Path("/opt/ml/processing/offline_meta/uri.txt").read_text().strip()
+        reader = make_reader(args.offline_store_backend, uri=uri)
+    return reader
+
+
 def load_data(args: argparse.Namespace, config: DictConfig) -> pd.DataFrame:
     """Offlineストアからデータを読み込む
 
     Args:
         args: コマンドライン引数
+        config: 設定ファイルの内容
 
     Returns:
         pd.DataFrame: 読み込んだデータフレーム
     """
-    query = f"""
-        SELECT
-            *
-        FROM
-        (
-            SELECT
-                *,
-                ROW_NUMBER() OVER (PARTITION BY record_id ORDER BY event_time DESC) AS latest
-            FROM "{args.glue_db}"."{args.glue_table}"
-        )
-        WHERE date BETWEEN '{config.start_date}' AND '{config.end_date}' AND latest = 1
-    """  # noqa: S608
-
-    boto_session = boto3.Session(region_name=args.region)
-    df = wr.athena.read_sql_query(
-        query,
-        database=args.glue_db,
-        boto3_session=boto_session,
-        s3_output="s3://power-forecast-athena-query-results-dev/",
-        ctas_approach=True,
-        workgroup="primary",
-    )
+    reader = make_offline_store_reader(args)
+    return reader.read(str(config.start_date), str(config.end_date))
 
-    return df
+
+def chunk_ranges(start_date: str, end_date: str, months: int) -> List[Tuple[str, str]]:
+    """期間をmonthsか月ごとの日付範囲（両端を含む）に分割する
+
+    Args:
+        start_date: 開始日（YYYY-MM-DD）
+        end_date: 終了日（YYYY-MM-DD）
+        months: 1つの範囲の月数
+
+    Returns:
+        List[Tuple[str, str]]: 開始日と終了日のタプルのリスト（日付順）
+    """
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    ranges = []
+    chunk_start = start
+    while chunk_start <= end:
+        # 月初から数えてmonthsか月後の前日までを1つの範囲とする
+        next_start = chunk_start.to_period("M").to_timestamp() + pd.DateOffset(months=months)
+        chunk_end = min(next_start - pd.Timedelta(days=1), end)
+        ranges.append((chunk_start.strftime("%Y-%m-%d"), chunk_end.strftime("%Y-%m-%d")))
+        chunk_start = next_start
+    return ranges
+
+
+def fit_encoders(reader: OfflineStoreReader, config: DictConfig) -> Dict[str, FeatureEncoder]:
+    """分割処理の前にエンコーダーをfitする
+    設定にカテゴリ（categories）がある場合はそれを使い、ない場合はエンコード対象の列だけを全期間から読み込んでfitする
+
+    Args:
+        reader: Offlineストアの読み込みクラス
+        config: 設定ファイルの内容
+
+    Returns:
+        Dict[str, FeatureEncoder]: エンコーダーの辞書
+    """
+    encoders_dict = {}
+    for params in config.get("encoders", []):
+        if params["name"] in encoders_dict:
+            continue
+        encoder = FeatureEncoder(**params)
+        if encoder.categories:
+            encoder.fit_categories()
+        else:
+            columns = list(params["columns"])
+            values = reader.read(str(config.start_date), str(config.end_date), columns=columns)[columns]
+            encoder.fit(values.drop_duplicates())
+            logger.info(f"Fitted {params['name']} encoder on {len(values)} rows of {columns}")
+        encoders_dict[params["name"]] = encoder
+    return encoders_dict
+
+
+class ChunkWriter:
+    """データフレームをバッチごとに1つのParquetファイルへ追記するクラス"""
+
+    def __init__(self, path: Path) -> None:
+        """
+        Args:
+            path (Path): 出力先のファイルパス
+        """
+        self.path = path
+        self.writer: Union[pq.ParquetWriter, None] = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        """データフレームを追記する
+        最初のバッチの型をそのままファイルのスキーマとし、後のバッチはその型に揃えて書き込む
+        （後のバッチで整数の列が欠損値を含むためにfloat64になった場合も、元の整数型の欠損値として書き込む）
+
+        Args:
+            df: 追記するデータフレーム
+        """
+        if df.empty:
+            return
+        if self.writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pandas(df[self.writer.schema.names], schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self) -> None:
+        """ファイルを閉じる"""
+        if self.writer is not None:
+            self.writer.close()
+
+
+def prepare_in_chunks(
+    reader: OfflineStoreReader,
+    config: DictConfig,
+    output_dir: Path,
+    months: int,
+) -> Tuple[List[str], Dict[str, FeatureEncoder]]:
+    """Offlineストアを日付順に期間ごとに読み込み、エンコード・分割・書き込みをバッチごとに行う
+    メモリに保持するのは1つの期間のデータだけのため、全履歴がメモリに載らない場合でも処理できる
+    重複を除いたスナップショットを年月のパーティションで絞り込んで読み込むため、全体の読み込み量はスナップショット1回分になる
+    （athena, parquetでは期間ごとにOfflineストア全体の重複除去をやり直すことになるため使用できない）
+
+    Args:
+        reader: Offlineストアの読み込みクラス（SnapshotReader）
+        config: 設定ファイルの内容（split_dateが必要）
+        output_dir: 出力先のディレクトリ（train/, test/ 以下に出力する）
+        months: 1回に読み込む月数
+
+    Returns:
+        Tuple[List[str], Dict[str, FeatureEncoder]]: 学習データのカラム名とエンコーダーの辞書
+
+    Raises:
+        TypeError: スナップショット以外の読み込みクラスの場合
+        ValueError: split_dateが設定されていない場合（分割処理では割合による分割はできない）
+    """
+    if not isinstance(reader, SnapshotReader):
+        msg = f"Chunked dataprep requires the snapshot backend, got {type(reader).__name__}"
+        raise TypeError(msg)
+    split_date = config.get("split_date")
+    if not split_date:
+        msg = "split_date is required for chunked dataprep"
+        raise ValueError(msg)
+    split_date = str(split_date)
+
+    encoders_dict = fit_encoders(reader, config)
+    writers = {
+        "train": ChunkWriter(output_dir / "train" / "train.parquet"),
+        "test": ChunkWriter(output_dir / "test" / "test.parquet"),
+    }
+    columns: List[str] = []
+    try:
+        for chunk_start, chunk_end in chunk_ranges(str(config.start_date), str(config.end_date), months):
+            df = reader.read(chunk_start, chunk_end)
+            if df.empty:
+                continue
+            if config.get("lean_features", False):
+                df = compact_dtypes(df)
+            encoded = df
+            for encoder in encoders_dict.values():
+                encoded = encoder.transform(encoded)
+            df = add_area_key(df, encoded, config.get("area_column"))
+            df = format_target_first(df).sort_values(sort_columns(df))
+            df = df.drop(columns=["record_id", "event_time", "latest"], errors="ignore")
+            columns = columns or df.columns.tolist()
+
+            is_test = df["date"].astype(str) >= split_date
+            writers["train"].write(df[~is_test])
+            writers["test"].write(df[is_test])
+            logger.info(f"Processed {chunk_start} - {chunk_end}: {len(df)} rows ({int(is_test.sum())} test)")
+            del df
+    finally:
+        for writer in writers.values():
+            writer.close()
+    logger.info(f"Wrote {writers['train'].rows} train rows and {writers['test'].rows} test rows")
+    return columns, encoders_dict
+
+
+def add_area_key(df: pd.DataFrame, encoded: pd.DataFrame, area_column: Union[str, None]) -> pd.DataFrame:
+    """エンコード前のエリアの値をarea列としてエンコード後のデータに加える（エリアの列をエンコードした場合も残す）
+
+    Args:
+        df: エンコード前のデータフレーム
+        encoded: エンコード後のデータフレーム
+        area_column: エリアを表す列（Noneの場合は何もしない）
+
+    Returns:
+        pd.DataFrame: area列を加えたデータフレーム
+    """
+    if area_column:
+        # 前処理でconfigのarea_columnの列はarea列としてFeature Storeに登録されている
+        encoded[AREA_COL] = df[AREA_COL].astype(str).to_numpy()
+    return encoded
 
 
 def encode_features(
@@ -174,6 +377,11 @@ def format_target_first(df: pd.DataFrame, target_col: str = "max_power") -> pd.D
     return pd.concat([y, df], axis=1)
 
 
+def sort_columns(df: pd.DataFrame, date_col: str = "date") -> List[str]:
+    """並べ替えに使う列（日付と、ある場合はエリア）を返す"""
+    return [date_col, AREA_COL] if AREA_COL in df.columns else [date_col]
+
+
 def train_test_split(
     df: pd.DataFrame,
     test_date: Union[str, None] = None,
@@ -193,8 +401,8 @@ def train_test_split(
         Tuple[pd.DataFrame, pd.DataFrame]: 訓練データとテストデータ
     """
     df = format_target_first(df)
-    # 日付でソート
-    df_sorted = df.sort_values(date_col)
+    # 日付でソート（複数エリアの場合は同じ日付の中でエリア順にする）
+    df_sorted = df.sort_values(sort_columns(df, date_col))
 
     if test_date:
         # 指定した日付で分割
@@ -206,22 +414,28 @@ def train_test_split(
         df_train = df_sorted.iloc[:train_size]
         df_test = df_sorted.iloc[train_size:]
 
-    # 不要なカラムを削除（athenaのクエリで取得したカラム）
-    delete_cols = [date_col, "record_id", "event_time", "latest"]
-    df_train = df_train.drop(columns=delete_cols).reset_index(drop=True)
-    df_test = df_test.drop(columns=delete_cols).reset_index(drop=True)
+    # 不要なカラムを削除（Feature Storeのレコードの識別子とイベント時刻）
+    # 日付は特徴量ではないが、評価・可視化で使うためParquetの出力には残す
+    delete_cols = ["record_id", "event_time", "latest"]
+    df_train = df_train.drop(columns=delete_cols, errors="ignore").reset_index(drop=True)
+    df_test = df_test.drop(columns=delete_cols, errors="ignore").reset_index(drop=True)
 
     return df_train, df_test
 
 
-def save_column_names(df: pd.DataFrame, output_path: str = "/opt/ml/processing/train/features.txt") -> None:
-    """特徴量重要度のプロットのためカラム名を保存する
+def save_column_names(
+    df: pd.DataFrame,
+    output_path: str = "/opt/ml/processing/train/features.txt",
+    date_col: str = "date",
+) -> None:
+    """特徴量重要度のプロットのためカラム名を保存する（日付・エリアの列は特徴量ではないため除く）
 
     Args:
         df: 入力データフレーム
         output_path: 出力パス
+        date_col: 日付列の名前
     """
-    feature_names = df.columns.tolist()
+    feature_names = [col for col in df.columns if col not in {date_col, AREA_COL}]
 
     with Path(output_path).open("w") as f:
         for name in feature_names:
@@ -234,25 +448,47 @@ if __name__ == "__main__":
     base_dir = "/opt/ml/processing"
     config = load_config("/opt/ml/processing/deps/config.yaml")
 
-    # データの読み込み
-    df = load_data(args, config)
-
-    # エンコーダーの適用
-    processed_data, encoders_dict = apply_encoders(df, config)
-
-    # データ分割
-    train_data, test_data = train_test_split(processed_data, test_date=config.get("split_date"))
-    # カラム名を保存
-    save_column_names(train_data, output_path=f"{base_dir}/train/features.txt")
+    chunk_months = config.get("dataprep_chunk_months")
+    if chunk_months:
+        # 期間ごとに読み込み・エンコード・分割・書き込みを行う（全履歴をメモリに載せない）
+        train_columns, encoders_dict = prepare_in_chunks(
+            make_offline_store_reader(args),
+            config,
+            Path(base_dir),
+            months=chunk_months,
+        )
+        save_column_names(pd.DataFrame(columns=train_columns), output_path=f"{base_dir}/train/features.txt")
+    else:
+        # データの読み込み
+        df = load_data(args, config)
+        if config.get("lean_features", False):
+            # Feature Storeを経由して失われた型をコンパクトな型に戻す
+            df = compact_dtypes(df)
+
+        # エンコーダーの適用
+        processed_data, encoders_dict = apply_encoders(df, config)
+        processed_data = add_area_key(df, processed_data, config.get("area_column"))
+
+        # データ分割
+        train_data, test_data = train_test_split(processed_data, test_date=config.get("split_date"))
+        # カラム名を保存
+        save_column_names(train_data, output_path=f"{base_dir}/train/features.txt")
+
+        # データの保存
+        Path(f"{base_dir}/train").mkdir(parents=True, exist_ok=True)
+        # 型とカラム名をファイルに含めるため、Parquetで受け渡す（読み込み側はfeatures.txtの列だけを読み込む）
+        train_data.to_parquet(f"{base_dir}/train/train.parquet", index=False)
+        Path(f"{base_dir}/test").mkdir(parents=True, exist_ok=True)
+        test_data.to_parquet(f"{base_dir}/test/test.parquet", index=False)
 
-    # データの保存
-    Path(f"{base_dir}/train").mkdir(parents=True, exist_ok=True)
-    train_data.to_csv(f"{base_dir}/train/train.csv", index=False, header=False)
     save_encoders(
         encoders_dict,
         file_dir=Path(f"{base_dir}/train"),
         filename="encoders.pkl",
     )
-    Path(f"{base_dir}/test").mkdir(parents=True, exist_ok=True)
-    test_data.to_csv(f"{base_dir}/test/test.csv", index=False, header=False)
+    # 学習時と推論時で同じラグ・移動窓特徴量を使うため、stateをモデルと一緒に保存する
+    if args.window_state_uri:
+        window_state = WindowState.load(args.window_state_uri)
+        if window_state is not None:
+            window_state.save(f"{base_dir}/train")
     logger.info("Finished processing data...")
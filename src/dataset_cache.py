@@ -0,0 +1,149 @@
+import datetime
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Union
+
+import lightgbm as lgb
+import numpy as np
+
+logger = logging.getLogger()
+
+INDEX_FILENAME = "index.json"
+# ビン分割の結果に影響するパラメータ（これ以外のパラメータが変わってもキャッシュを使える）
+DATASET_PARAM_NAMES = [
+    "max_bin",
+    "min_data_in_bin",
+    "bin_construct_sample_cnt",
+    "data_random_seed",
+    "use_missing",
+    "zero_as_missing",
+    "linear_tree",
+]
+# キャッシュするDatasetのパラメータ
+# 事前フィルタを無効にして、min_child_samplesなどが異なる学習・試行でも同じDatasetを使えるようにする
+BASE_DATASET_PARAMS = {"feature_pre_filter": False, "verbose": -1}
+
+
+def data_hash(X: np.ndarray, y: np.ndarray) -> str:
+    """特徴量と目標値の内容（形状・型を含む）のハッシュを求める"""
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (np.ascontiguousarray(X), np.ascontiguousarray(y)):
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+def dataset_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """学習のパラメータから、Datasetの作成に使うパラメータだけを取り出す"""
+    return {**BASE_DATASET_PARAMS, **{name: params[name] for name in DATASET_PARAM_NAMES if name in params}}
+
+
+class DatasetCache:
+    """ビン分割済みのLightGBMのDatasetをバイナリファイルとして保存し、学習・試行・再実行の間で使い回すクラス
+    キャッシュのキーは学習データの内容のハッシュとビン分割のパラメータ
+    学習データが前回の学習データの末尾に行を追加しただけの場合は、前回のビンの境界を使って作り直す（境界を求め直さない）
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 3, max_append_ratio: float = 0.2) -> None:
+        """
+        Args:
+            cache_dir (str): キャッシュのディレクトリ
+            max_entries (int): 残すDatasetの数（古いものから削除する）
+            max_append_ratio (float): ビンの境界を求めたときの行数に対して、
+                この割合を超えて行が追加された場合はビンの境界を求め直す
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_append_ratio = max_append_ratio
+
+    def load_index(self) -> List[Dict[str, Any]]:
+        """キャッシュしたDatasetの一覧を読み込む"""
+        index_path = self.cache_dir / INDEX_FILENAME
+        return json.loads(index_path.read_text()) if index_path.exists() else []
+
+    def save_index(self, entries: List[Dict[str, Any]]) -> None:
+        """キャッシュしたDatasetの一覧を保存する（一時ファイルに書き込んでから置き換える）"""
+        tmp_path = self.cache_dir / f"{INDEX_FILENAME}.tmp"
+        tmp_path.write_text(json.dumps(entries, indent=2))
+        tmp_path.replace(self.cache_dir / INDEX_FILENAME)
+
+    def find_base(
+        self,
+        entries: List[Dict[str, Any]],
+        X: np.ndarray,
+        y: np.ndarray,
+        params_key: str,
+    ) -> Union[Dict[str, Any], None]:
+        """学習データの先頭部分と一致する（末尾に行を追加しただけの）キャッシュを探す"""
+        candidates = [
+            entry
+            for entry in entries
+            if entry["params_key"] == params_key
+            and entry["n_features"] == X.shape[1]
+            and entry["n_rows"] < len(X) <= entry["bins_rows"] * (1 + self.max_append_ratio)
+        ]
+        # 行数が最も多いものだけを確認する（先頭部分のハッシュを求める回数を1回にする）
+        if not candidates:
+            return None
+        entry = max(candidates, key=lambda entry: entry["n_rows"])
+        n_rows = entry["n_rows"]
+        return entry if data_hash(X[:n_rows], y[:n_rows]) == entry["data_hash"] else None
+
+    def get(self, X: np.ndarray, y: np.ndarray, params: Dict[str, Any]) -> Tuple[lgb.Dataset, str]:
+        """学習データのDatasetをキャッシュから取り出す（ない場合は作成してキャッシュする）
+
+        Args:
+            X: 特徴量
+            y: 目標値
+            params: 学習のパラメータ（ビン分割に関係するものだけを使う）
+
+        Returns:
+            Tuple[lgb.Dataset, str]: 作成済みのDatasetと、そのバイナリファイルのパス
+        """
+        params = dataset_params(params)
+        params_key = hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=8).hexdigest()
+        key = f"{data_hash(X, y)}-{params_key}"
+        path = self.cache_dir / f"{key}.bin"
+        entries = [entry for entry in self.load_index() if (self.cache_dir / entry["file"]).exists()]
+
+        hit = next((entry for entry in entries if entry["file"] == path.name), None)
+        if hit is not None:
+            logger.info(f"Loaded cached dataset {path}")
+            dataset = lgb.Dataset(str(path), params=params).construct()
+            # 最近使ったものとして一覧の末尾に移す
+            entries = [entry for entry in entries if entry is not hit] + [hit]
+            self.save_index(entries)
+            return dataset, str(path)
+
+        base = self.find_base(entries, X, y, params_key)
+        if base is not None:
+            # 前回のDatasetのビンの境界を使い、全行をビンに割り当てる
+            reference = lgb.Dataset(str(self.cache_dir / base["file"]), params=params).construct()
+            dataset = lgb.Dataset(X, y, params=params, reference=reference, free_raw_data=False).construct()
+            bins_rows = base["bins_rows"]
+            logger.info(f"Built dataset with bin boundaries of {base['file']} (+{len(X) - base['n_rows']} rows)")
+        else:
+            dataset = lgb.Dataset(X, y, params=params, free_raw_data=False).construct()
+            bins_rows = len(X)
+            logger.info(f"Built dataset from scratch ({len(X)} rows)")
+
+        dataset.save_binary(str(path))
+        entries.append(
+            {
+                "file": path.name,
+                "data_hash": key.split("-")[0],
+                "params_key": params_key,
+                "n_rows": len(X),
+                "n_features": X.shape[1],
+                "bins_rows": bins_rows,
+                "created_at": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),  # noqa: UP017
+            },
+        )
+        # 古いものから削除する
+        for entry in entries[: -self.max_entries]:
+            (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+        self.save_index(entries[-self.max_entries :])
+        return dataset, str(path)
@@ -3,26 +3,42 @@ import sys
 import tarfile
 
 # 必要なパッケージをその場でインストール
-subprocess.run([sys.executable, "-m", "pip", "install", "--quiet", "lightgbm", "scikit-learn"], check=True)
+subprocess.run([sys.executable, "-m", "pip", "install", "--quiet", "lightgbm", "scikit-learn", "pyarrow"], check=True)
 
 import argparse
 import json
 import logging
 import os
+import shutil
 from pathlib import Path
-from typing import List, Tuple, Union
+from typing import Dict, List, Tuple, Union
 
 import joblib
 import lightgbm as lgb
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from scipy.sparse import spmatrix
-from sklearn.metrics import mean_squared_error
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+# 可視化ステップに渡す成果物（モデルを読み込み直さずに可視化できるようにする）
+PREDICTIONS_FILENAME = "predictions.parquet"
+FEATURE_IMPORTANCE_FILENAME = "feature_importance.csv"
+# 予測値のParquetのスキーマ（日付・エリアはテストデータにある場合だけ含める）
+PREDICTIONS_SCHEMA = pa.schema(
+    [
+        ("date", pa.timestamp("ns")),
+        ("area", pa.string()),
+        ("actual", pa.float64()),
+        ("predicted", pa.float64()),
+    ],
+)
+
 
 def parse_args() -> argparse.Namespace:
     """
@@ -37,7 +53,7 @@ def parse_args() -> argparse.Namespace:
         "--model-path", type=str, default=os.environ.get("SM_MODEL_PATH", "/opt/ml/processing/model/model.tar.gz"),
     )
     parser.add_argument(
-        "--test-path", type=str, default=os.environ.get("SM_CHANNEL_TEST", "/opt/ml/processing/test/test.csv"),
+        "--test-path", type=str, default=os.environ.get("SM_CHANNEL_TEST", "/opt/ml/processing/test/test.parquet"),
     )
     parser.add_argument(
         "--feature-names-path",
@@ -51,23 +67,94 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def load_model(model_tar_path: str) -> lgb.Booster:
+def load_model(model_tar_path: str) -> Union[lgb.Booster, Dict[str, lgb.Booster]]:
     """model.tar.gz から model.pickle を取り出してモデルを返す
     Args:
         model_tar_path (str): モデルのtar.gzファイルのパス
     Returns:
-        lgb.Booster: 学習済みモデル
+        Union[lgb.Booster, Dict[str, lgb.Booster]]: 学習済みモデル（エリアごとのモデルの場合はエリア名の辞書）
     """
     extract_dir = "/tmp/model"  # noqa: S108
     Path(extract_dir).mkdir(exist_ok=True)
     with tarfile.open(model_tar_path, "r:gz") as tar:
         tar.extractall(path=extract_dir)
 
+    # エリアごとのモデルの場合は、マニフェストに記載されたモデルをエリア名の辞書で返す
+    manifest_path = next(Path(extract_dir).rglob("area_manifest.json"), None)
+    if manifest_path is not None:
+        with manifest_path.open() as f:
+            manifest = json.load(f)
+        return {area: joblib.load(manifest_path.parent / entry["model"]) for area, entry in manifest["areas"].items()}
+
     model_path = next(Path(extract_dir).rglob("model.joblib"))
 
     return joblib.load(model_path)
 
 
+def resolve_feature_names_path(feature_names_path: str, extract_dir: str = "/tmp/model") -> str:  # noqa: S108
+    """モデルと一緒に保存された特徴量名（features.txt）がある場合はそのパスを返す
+    特徴量を削減したモデルは、学習データのfeatures.txtより特徴量が少ない
+
+    Args:
+        feature_names_path (str): 学習データの特徴量名のパス
+        extract_dir (str): モデルを展開したディレクトリ
+
+    Returns:
+        str: 使用する特徴量名のパス
+    """
+    path = Path(extract_dir) / "features.txt"
+    return str(path) if path.exists() else feature_names_path
+
+
+def load_areas(test_data_path: str) -> Union[np.ndarray, None]:
+    """テストデータの各行のエリアを読み込む（エリアの列がない場合はNone）"""
+    if Path(test_data_path).suffix == ".csv" or "area" not in pq.read_schema(test_data_path).names:
+        return None
+    return pd.read_parquet(test_data_path, columns=["area"])["area"].astype(str).to_numpy()
+
+
+def load_dates(test_data_path: str) -> Union[np.ndarray, None]:
+    """テストデータの各行の日付を読み込む（日付の列がない場合はNone）"""
+    if Path(test_data_path).suffix == ".csv" or "date" not in pq.read_schema(test_data_path).names:
+        return None
+    return pd.to_datetime(pd.read_parquet(test_data_path, columns=["date"])["date"]).to_numpy()
+
+
+def predict(
+    model: Union[lgb.Booster, Dict[str, lgb.Booster]],
+    X_test: pd.DataFrame,
+    areas: Union[np.ndarray, None],
+) -> np.ndarray:
+    """予測を行う（エリアごとのモデルの場合は、各行をそのエリアのモデルで予測する）
+
+    Args:
+        model (Union[lgb.Booster, Dict[str, lgb.Booster]]): 学習済みモデル（エリアごとのモデルの場合はエリア名の辞書）
+        X_test (pd.DataFrame): 特徴量データ
+        areas (Union[np.ndarray, None]): 各行のエリア
+
+    Returns:
+        np.ndarray: 予測値
+
+    Raises:
+        ValueError: エリアごとのモデルで、エリアの列がないか、モデルのないエリアがある場合
+    """
+    if not isinstance(model, dict):
+        return model.predict(X_test)
+    if areas is None:
+        msg = "Test data has no area column (required for per-area models)"
+        raise ValueError(msg)
+    missing = sorted(set(areas) - set(model))
+    if missing:
+        msg = f"No models for areas {missing}"
+        raise ValueError(msg)
+    y_pred = np.empty(len(X_test))
+    for area, area_model in model.items():
+        rows = areas == area
+        if rows.any():
+            y_pred[rows] = area_model.predict(X_test[rows])
+    return y_pred
+
+
 def get_feature_names(feature_name_path: str) -> List[str]:
     """モデルの特徴量名を取得する
 
@@ -79,16 +166,118 @@ def get_feature_names(feature_name_path: str) -> List[str]:
     return feature_names
 
 
-def evaluate_model(y_true: pd.Series, y_pred: Union[np.ndarray, pd.Series, spmatrix], output_path: str) -> None:
+def load_cv_results(extract_dir: str = "/tmp/model") -> Union[Dict, None]:  # noqa: S108
+    """学習時の時系列交差検証の結果（cv_results.json）を読み込む
+
+    Args:
+        extract_dir (str): モデルを展開したディレクトリ
+
+    Returns:
+        Union[Dict, None]: 交差検証の結果（交差検証を行っていない場合はNone）
+    """
+    path = next(Path(extract_dir).rglob("cv_results.json"), None)
+    if path is None:
+        return None
+    with path.open() as f:
+        return json.load(f)
+
+
+def get_feature_importance(
+    model: Union[lgb.Booster, Dict[str, lgb.Booster]],
+    feature_names: List[str],
+) -> pd.DataFrame:
+    """特徴量重要度を取得する（エリアごとのモデルの場合は、全エリアのモデルの重要度を合計する）
+    使用するlightgbmのインターフェースによって異なるため、条件分岐で取得する
+
+    Args:
+        model (Union[lgb.Booster, Dict[str, lgb.Booster]]): 学習済みモデル
+        feature_names (List[str]): 特徴量名のリスト（先頭は目的変数）
+
+    Returns:
+        pd.DataFrame: 特徴量と重要度を含むデータフレーム（重要度の高い順）
+
+    Raises:
+        ValueError: モデルから重要度を取得できない場合
+    """
+    models = list(model.values()) if isinstance(model, dict) else [model]
+    importances = 0
+    for area_model in models:
+        if hasattr(area_model, "feature_name_") and hasattr(area_model, "feature_importances_"):
+            importances = importances + area_model.feature_importances_
+        elif hasattr(area_model, "feature_name") and hasattr(area_model, "feature_importance"):
+            importances = importances + area_model.feature_importance()
+        else:
+            msg = "モデルの特徴量取得に失敗しました"
+            raise ValueError(msg)
+    # 特徴量名の先頭は目的変数のため除外して渡す
+    df_importance = pd.DataFrame({"feature": feature_names[1:], "importance": importances})
+    return df_importance.sort_values("importance", ascending=False)
+
+
+def save_predictions(
+    y_true: pd.Series,
+    y_pred: np.ndarray,
+    output_path: str,
+    dates: Union[np.ndarray, None] = None,
+    areas: Union[np.ndarray, None] = None,
+) -> None:
+    """予測値と実際の値をPREDICTIONS_SCHEMAのParquetで保存する（可視化ステップで予測し直さないようにする）
+
+    Args:
+        y_true (pd.Series): 実際の値
+        y_pred (np.ndarray): 予測値
+        output_path (str): 保存先のディレクトリ
+        dates (Union[np.ndarray, None]): 各行の日付（ない場合は列を含めない）
+        areas (Union[np.ndarray, None]): 各行のエリア（ない場合は列を含めない）
+    """
+    columns = {"date": dates, "area": areas, "actual": np.asarray(y_true), "predicted": np.asarray(y_pred)}
+    schema = pa.schema([field for field in PREDICTIONS_SCHEMA if columns[field.name] is not None])
+    table = pa.table({field.name: columns[field.name] for field in schema}, schema=schema)
+    Path(output_path).mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, Path(output_path) / PREDICTIONS_FILENAME)
+
+
+def evaluate_model(
+    y_true: pd.Series,
+    y_pred: Union[np.ndarray, pd.Series, spmatrix],
+    output_path: str,
+    cv_results: Union[Dict, None] = None,
+    areas: Union[np.ndarray, None] = None,
+) -> None:
     """モデルの評価を行い、結果をJSONファイルに保存する
 
     Args:
         y_true (pd.Series): 実際の値
         y_pred (pd.Series): 予測値
         output_path (str): 評価結果を保存するパス
+        cv_results (Union[Dict, None]): 学習時の時系列交差検証の結果（ある場合は評価結果に含める）
+        areas (Union[np.ndarray, None]): 各行のエリア（ある場合はエリアごとの評価指標も含める）
     """
-    # sagemakerのJsonGetで取得しやすいような形式にする
-    metrics = {"regression_metrics": {"mse": {"value": mean_squared_error(y_true, y_pred)}}}
+    # sagemakerのJsonGetで取得しやすいような形式にする（条件ステップはmseを使い、可視化ステップは全指標を使う）
+    mse = mean_squared_error(y_true, y_pred)
+    metrics = {
+        "regression_metrics": {
+            "mse": {"value": mse},
+            "rmse": {"value": float(np.sqrt(mse))},
+            "mae": {"value": mean_absolute_error(y_true, y_pred)},
+            "r2": {"value": r2_score(y_true, y_pred)},
+        },
+    }
+    if areas is not None:
+        metrics["area_metrics"] = {
+            str(area): {
+                "rows": int((areas == area).sum()),
+                "rmse": {"value": float(np.sqrt(mean_squared_error(y_true[areas == area], y_pred[areas == area])))},
+            }
+            for area in np.unique(areas)
+        }
+    if cv_results is not None:
+        metrics["cv_metrics"] = {
+            "folds": len(cv_results["folds"]),
+            "rmse_mean": {"value": cv_results["rmse_mean"]},
+            "rmse_std": {"value": cv_results["rmse_std"]},
+            "mae_mean": {"value": cv_results["mae_mean"]},
+        }
     Path(output_path).mkdir(parents=True, exist_ok=True)
 
     with (Path(output_path) / "evaluation.json").open("w") as f:
@@ -111,7 +300,12 @@ def load_test_data(
         pd.DataFrame: 特徴量データ
         pd.Series: 目的変数データ
     """
-    test_data = pd.read_csv(test_data_path, header=None, names=feature_names)
+    if Path(test_data_path).suffix == ".csv":
+        # 以前の形式（ヘッダーなしCSV）
+        test_data = pd.read_csv(test_data_path, header=None, names=feature_names)
+    else:
+        # features.txtの列だけをメモリマップで読み込む（日付などの列は読まない）
+        test_data = pd.read_parquet(test_data_path, columns=feature_names, memory_map=True)
     X_test = test_data.drop(columns=[target_col])
     y_true = test_data[target_col]
     return X_test, y_true
@@ -127,8 +321,9 @@ if __name__ == "__main__":
     feature_names_path = args.feature_names_path
     output_path = args.output_path
 
-    # モデルのロード
+    # モデルのロード（モデルと一緒に保存された特徴量名がある場合はそちらを使う）
     model = load_model(model_path)
+    feature_names_path = resolve_feature_names_path(feature_names_path)
 
     # 特徴量名の取得
     feature_names = get_feature_names(feature_names_path)
@@ -136,7 +331,13 @@ if __name__ == "__main__":
     # テストデータのロード
     X_test, y_true = load_test_data(test_data_path, feature_names)
 
-    # 予測と評価
-    y_pred = model.predict(X_test)
-    evaluate_model(y_true, y_pred, output_path)
+    # 予測と評価（エリアの列がある場合はエリアごとの評価指標も求める）
+    areas = load_areas(test_data_path)
+    y_pred = predict(model, X_test, areas)
+    evaluate_model(y_true, y_pred, output_path, cv_results=load_cv_results(), areas=areas)
+
+    # 可視化ステップがモデルを読み込まずに済むように、予測値・特徴量重要度・特徴量名を一緒に出力する
+    save_predictions(y_true, y_pred, output_path, dates=load_dates(test_data_path), areas=areas)
+    get_feature_importance(model, feature_names).to_csv(Path(output_path) / FEATURE_IMPORTANCE_FILENAME, index=False)
+    shutil.copyfile(feature_names_path, Path(output_path) / "features.txt")
     logger.info("finished evaluate...")
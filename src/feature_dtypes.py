@@ -0,0 +1,52 @@
+from typing import Dict
+
+import pandas as pd
+
+from window_state import WINDOW_FEATURES
+
+# 省メモリモードで使用する特徴量ごとの型
+# フラグはint8、連続値はfloat32、天気カテゴリはcategory型で保持する
+COMPACT_DTYPES: Dict[str, str] = {
+    "max_temp": "float32",
+    "min_temp": "float32",
+    "max_power": "int32",
+    "weather_category": "category",
+    "avg": "float32",
+    "rng": "float32",
+    "cdd": "float32",
+    "hdd": "float32",
+    "hot": "int8",
+    "cold": "int8",
+    "year": "int16",
+    "month": "int8",
+    "day": "int8",
+    "dow": "int8",
+    "dow_sin": "float32",
+    "dow_cos": "float32",
+    "mon_sin": "float32",
+    "mon_cos": "float32",
+    "weekend": "int8",
+    "holiday": "int8",
+    **dict.fromkeys(WINDOW_FEATURES, "float32"),
+}
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """特徴量の列をコンパクトな型に変換する
+    Feature StoreやCSVを経由して型が失われたデータフレームを省メモリな型に戻すために使用する
+
+    Args:
+        df: 特徴量を含むデータフレーム
+
+    Returns:
+        pd.DataFrame: 型変換されたデータフレーム（対象外の列はそのまま）
+    """
+    dtypes = {}
+    for col, dtype in COMPACT_DTYPES.items():
+        if col not in df.columns:
+            continue
+        # 欠損値を含む列は整数型に変換できないためスキップする
+        if dtype.startswith("int") and df[col].isna().any():
+            continue
+        dtypes[col] = dtype
+    return df.astype(dtypes, copy=False)
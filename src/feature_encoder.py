@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Union
 
 import category_encoders as ce
 import pandas as pd
@@ -10,14 +10,16 @@ class FeatureEncoder:
     One-Hot EncodingとOrdinal Encodingに対応
     """
 
-    def __init__(self, name: str, columns: List[str]) -> None:
+    def __init__(self, name: str, columns: List[str], categories: Union[Dict[str, List], None] = None) -> None:
         """
         Args:
             name (str): Encoderの仕方を指定
             columns (List[str]): エンコードするカラム
+            categories (Union[Dict[str, List], None]): カラムごとの既知のカテゴリ（fit_categoriesで使用する）
         """
         self.name = name
         self.columns = columns
+        self.categories = categories
         self.fitted = False
 
         if self.name == "One-Hot":
@@ -42,15 +44,41 @@ class FeatureEncoder:
         Args:
             input_df (pd.DataFrame): エンコードするデータ
         """
-        self.encoder.fit(input_df)
+        self.encoder.fit(input_df[self.columns])
         self.fitted = True
 
+    def fit_categories(self, categories: Union[Dict[str, List], None] = None) -> None:
+        """
+        データを読み込まずに、既知のカテゴリだけでfitする（分割処理でデータ全体を読み込めない場合に使用する）
+        Args:
+            categories (Union[Dict[str, List], None]): カラムごとのカテゴリ（省略時はコンストラクタで指定したカテゴリ）
+        """
+        categories = categories or self.categories
+        if not categories or any(col not in categories for col in self.columns):
+            msg = f"Categories are required for all columns: {self.columns}"
+            raise ValueError(msg)
+        # カラムごとにカテゴリ数が異なる場合は、先頭のカテゴリを繰り返して長さを揃える（新しいカテゴリは増えない）
+        size = max(len(categories[col]) for col in self.columns)
+        self.fit(
+            pd.DataFrame(
+                {
+                    col: list(categories[col]) + [categories[col][0]] * (size - len(categories[col]))
+                    for col in self.columns
+                },
+            ),
+        )
+
     def transform(self, input_df: pd.DataFrame) -> pd.DataFrame:
         """
         対象となる列に対象のエンコーダーを適用する
+        対象の列だけをエンコーダーに渡すため、学習時と推論時で他の列の構成が異なっていてもよい
         Args:
             input_df (pd.DataFrame): エンコードするデータ
         Returns:
-            pd.DataFrame: エンコードされたデータ
+            pd.DataFrame: エンコードされたデータ（エンコード後の列は元の列の位置に配置される）
         """
-        return self.encoder.transform(input_df)
+        encoded = self.encoder.transform(input_df[self.columns])
+        position = input_df.columns.get_loc(self.columns[0])
+        before = [col for col in input_df.columns[:position] if col not in self.columns]
+        after = [col for col in input_df.columns[position:] if col not in self.columns]
+        return pd.concat([input_df[before], encoded, input_df[after]], axis=1)
@@ -0,0 +1,145 @@
+import logging
+from typing import Any, Dict, List, Tuple, Union
+
+import lightgbm as lgb
+import numpy as np
+
+from cv_splits import time_series_splits
+
+logger = logging.getLogger()
+
+# 特徴量の重要度の求め方
+IMPORTANCE_METHODS = ["gain", "permutation"]
+
+
+def _rmse(booster: lgb.Booster, X: np.ndarray, y: np.ndarray) -> float:
+    """BoosterのRMSEを求める"""
+    return float(np.sqrt(np.mean((booster.predict(X) - y) ** 2)))
+
+
+def feature_importance(
+    booster: lgb.Booster,
+    X_valid: np.ndarray,
+    y_valid: np.ndarray,
+    method: str = "gain",
+    n_repeats: int = 3,
+    seed: int = 10,
+) -> np.ndarray:
+    """検証データに対する特徴量の重要度を求める
+
+    Args:
+        booster: 全特徴量で学習したモデル
+        X_valid: 検証データの特徴量
+        y_valid: 検証データの目標値
+        method: "gain"（分岐による損失の減少量の合計）または"permutation"（列を並べ替えたときの検証RMSEの増加量）
+        n_repeats: permutationの場合に並べ替えを繰り返す回数（平均を取る）
+        seed: 乱数シード
+
+    Returns:
+        np.ndarray: 特徴量ごとの重要度（大きいほど重要）
+
+    Raises:
+        ValueError: 重要度の求め方が不正な場合
+    """
+    if method == "gain":
+        return booster.feature_importance(importance_type="gain")
+    if method != "permutation":
+        msg = f"Unknown importance method: {method} (expected one of {IMPORTANCE_METHODS})"
+        raise ValueError(msg)
+
+    rng = np.random.default_rng(seed)
+    baseline = _rmse(booster, X_valid, y_valid)
+    importances = np.zeros(X_valid.shape[1])
+    X_permuted = X_valid.copy()
+    for i in range(X_valid.shape[1]):
+        for _ in range(n_repeats):
+            X_permuted[:, i] = rng.permutation(X_valid[:, i])
+            importances[i] += (_rmse(booster, X_permuted, y_valid) - baseline) / n_repeats
+        X_permuted[:, i] = X_valid[:, i]
+    return importances
+
+
+def prune_features(
+    X: np.ndarray,
+    y: np.ndarray,
+    dates: np.ndarray,
+    feature_names: List[str],
+    params: Dict[str, Any],
+    num_boost_round: int,
+    method: str = "gain",
+    tolerance: float = 0.01,
+    valid_days: Union[int, None] = None,
+    seed: int = 10,
+) -> Tuple[List[int], Dict[str, Any]]:
+    """重要度の低い特徴量から順に、検証RMSEが許容範囲に収まる限り削除する
+    末尾valid_days日を検証データとして全特徴量のモデルの重要度を求め、重要度の低いものからまとめて削除して学習し直す
+    検証RMSEが全特徴量のモデルの(1 + tolerance)倍を超えた場合は、まとめて削除する数を半分にして試し直す
+    （1つだけ削除して超えた場合は、その特徴量を残して次の特徴量に進む）
+
+    Args:
+        X: 特徴量（日付順）
+        y: 目標値
+        dates: 各行の日付（昇順）
+        feature_names: 特徴量名（Xの列の順）
+        params: lgb.trainのパラメータ
+        num_boost_round: ブースティング回数
+        method: 重要度の求め方（"gain"または"permutation"）
+        tolerance: 検証RMSEの悪化の許容割合
+        valid_days: 検証データの日数（省略時は全日数の1/5）
+        seed: 乱数シード
+
+    Returns:
+        Tuple[List[int], Dict[str, Any]]: 残す特徴量の列の位置（元の順）と、削除の記録
+    """
+    valid_days = valid_days or max(1, len(np.unique(dates)) // 5)
+    train_index, valid_index = next(time_series_splits(dates, n_splits=1, horizon=valid_days))
+    X_train, y_train = X[train_index], y[train_index]
+    X_valid, y_valid = X[valid_index], y[valid_index]
+
+    def fit(columns: List[int]) -> lgb.Booster:
+        dataset = lgb.Dataset(X_train[:, columns], y_train, params={**params, "verbose": -1})
+        return lgb.train(params, dataset, num_boost_round=num_boost_round)
+
+    all_columns = list(range(X.shape[1]))
+    booster = fit(all_columns)
+    baseline = _rmse(booster, X_valid, y_valid)
+    limit = baseline * (1 + tolerance)
+    importances = feature_importance(booster, X_valid, y_valid, method=method, seed=seed)
+    # 重要度の低い順（同じ重要度の場合は後ろの列から）
+    candidates = sorted(all_columns, key=lambda i: (importances[i], -i))
+
+    kept = set(all_columns)
+    rmse = baseline
+    steps = []
+    block = max(1, len(candidates) // 4)
+    position = 0
+    # 最低1つの特徴量は残す
+    while position < len(candidates) and len(kept) > 1:
+        drop = [i for i in candidates[position : position + block] if i in kept][: len(kept) - 1]
+        columns = sorted(kept - set(drop))
+        trial_rmse = _rmse(fit(columns), X_valid[:, columns], y_valid)
+        accepted = trial_rmse <= limit
+        steps.append({"dropped": [feature_names[i] for i in drop], "rmse": trial_rmse, "accepted": accepted})
+        logger.info(f"Pruning step {len(steps)}: {steps[-1]}")
+        if accepted:
+            kept -= set(drop)
+            rmse = trial_rmse
+            position += block
+        elif block > 1:
+            block //= 2
+        else:
+            position += 1
+
+    keep = sorted(kept)
+    report = {
+        "method": method,
+        "tolerance": tolerance,
+        "valid_rows": len(valid_index),
+        "baseline_rmse": baseline,
+        "pruned_rmse": rmse,
+        "ranking": [{"feature": feature_names[i], "importance": float(importances[i])} for i in candidates[::-1]],
+        "kept": [feature_names[i] for i in keep],
+        "dropped": [feature_names[i] for i in all_columns if i not in kept],
+        "steps": steps,
+    }
+    return keep, report
@@ -0,0 +1,109 @@
+from typing import Callable, Dict, Iterable, List, Union
+
+import pandas as pd
+
+
+class FeatureSpec:
+    """特徴量の定義（入力となる列と計算関数）を保持するクラス"""
+
+    def __init__(self, name: str, inputs: List[str], compute: Callable[[pd.DataFrame], pd.Series]) -> None:
+        """
+        Args:
+            name (str): 特徴量名
+            inputs (List[str]): 計算に必要な列名（他の特徴量または入力データの列）
+            compute (Callable[[pd.DataFrame], pd.Series]): データフレームを受け取り特徴量を返すベクトル化された関数
+        """
+        self.name = name
+        self.inputs = inputs
+        self.compute = compute
+
+
+class FeatureRegistry:
+    """特徴量の定義を登録し、必要な特徴量とその依存関係だけを計算するクラス"""
+
+    def __init__(self) -> None:
+        self._specs: Dict[str, FeatureSpec] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    @property
+    def names(self) -> List[str]:
+        """登録されている特徴量名のリスト（登録順）"""
+        return list(self._specs)
+
+    def register(self, name: str, inputs: List[str], compute: Callable[[pd.DataFrame], pd.Series]) -> None:
+        """特徴量を登録する
+
+        Args:
+            name: 特徴量名
+            inputs: 計算に必要な列名
+            compute: 特徴量を計算する関数
+
+        Raises:
+            ValueError: 同名の特徴量がすでに登録されている場合
+        """
+        if name in self._specs:
+            msg = f"Feature already registered: {name}"
+            raise ValueError(msg)
+        self._specs[name] = FeatureSpec(name, inputs, compute)
+
+    def resolve(self, required: Union[Iterable[str], None], available: Iterable[str]) -> List[str]:
+        """必要な特徴量を計算するための依存関係を解決し、計算順に並べた特徴量名を返す
+
+        Args:
+            required: 必要な特徴量名（Noneの場合は登録されている全特徴量）
+            available: 入力データにすでに存在する列名
+
+        Returns:
+            List[str]: 計算が必要な特徴量名（依存関係を満たす順序）
+
+        Raises:
+            KeyError: 特徴量も入力列も見つからない名前が含まれている場合
+            ValueError: 依存関係が循環している場合
+        """
+        available = set(available)
+        order: List[str] = []
+        visiting = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name not in self._specs:
+                if name in available:
+                    return
+                msg = f"Unknown feature or input column: {name}"
+                raise KeyError(msg)
+            if name in visiting:
+                msg = f"Circular feature dependency detected at: {name}"
+                raise ValueError(msg)
+            visiting.add(name)
+            for dependency in self._specs[name].inputs:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.names if required is None else required:
+            visit(name)
+        return order
+
+    def compute(
+        self,
+        df: pd.DataFrame,
+        required: Union[Iterable[str], None] = None,
+        cast: Union[Callable[[pd.Series, str], pd.Series], None] = None,
+    ) -> pd.DataFrame:
+        """必要な特徴量だけを計算してデータフレームに列を追加する（入力データフレームを直接更新する）
+
+        Args:
+            df: 入力データフレーム
+            required: 必要な特徴量名（Noneの場合は登録されている全特徴量）
+            cast: 計算した特徴量の型を変換する関数（省略可能）
+
+        Returns:
+            pd.DataFrame: 特徴量を追加したデータフレーム
+        """
+        for name in self.resolve(required, df.columns):
+            values = self._specs[name].compute(df)
+            df[name] = cast(values, name) if cast else values
+        return df
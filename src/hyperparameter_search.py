@@ -0,0 +1,254 @@
+import logging
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import lightgbm as lgb
+import numpy as np
+
+from cv_splits import time_series_splits
+
+logger = logging.getLogger()
+
+# 探索するハイパーパラメータと、乱数生成器から値を取り出す関数
+# LGBMRegressorの引数名を使う（lgb.trainでも同じ名前を別名として受け付ける）
+SEARCH_SPACE: Dict[str, Callable[[np.random.Generator], Any]] = {
+    "learning_rate": lambda rng: float(10 ** rng.uniform(-2, math.log10(0.3))),
+    "num_leaves": lambda rng: int(rng.integers(7, 128)),
+    "min_child_samples": lambda rng: int(rng.integers(5, 60)),
+    "colsample_bytree": lambda rng: float(rng.uniform(0.5, 1.0)),
+    "subsample": lambda rng: float(rng.uniform(0.5, 1.0)),
+    "reg_lambda": lambda rng: float(10 ** rng.uniform(-3, 1)),
+}
+# 全試行で共通のパラメータ
+BASE_PARAMS = {"objective": "regression", "metric": "rmse", "subsample_freq": 1, "verbose": -1}
+
+# ワーカープロセスごとに一度だけ作成する学習・検証データ
+_worker_data: Dict[str, lgb.Dataset] = {}
+
+
+def sample_params(rng: np.random.Generator) -> Dict[str, Any]:
+    """探索空間からハイパーパラメータを1組取り出す
+
+    Args:
+        rng: 乱数生成器
+
+    Returns:
+        Dict[str, Any]: ハイパーパラメータ
+    """
+    return {name: sample(rng) for name, sample in SEARCH_SPACE.items()}
+
+
+def _init_worker(
+    X: Union[np.ndarray, None],
+    y: Union[np.ndarray, None],
+    train_index: np.ndarray,
+    valid_index: np.ndarray,
+    dataset_path: Union[str, None] = None,
+) -> None:
+    """ワーカープロセスの初期化時に、ビン分割済みの学習・検証データを作成する（試行ごとに作り直さない）"""
+    # 試行ごとにmin_child_samplesなどを変えられるように、特徴量の事前フィルタを無効にする
+    dataset_params = {"feature_pre_filter": False, "verbose": -1}
+    if dataset_path is not None:
+        # キャッシュしたビン分割済みのDatasetを読み込み、学習・検証の行を取り出す（ビン分割をしない）
+        dataset = lgb.Dataset(dataset_path, params=dataset_params).construct()
+        _worker_data["train"] = dataset.subset(train_index).construct()
+        _worker_data["valid"] = dataset.subset(valid_index).construct()
+        return
+    train_set = lgb.Dataset(X[train_index], y[train_index], params=dataset_params, free_raw_data=False)
+    _worker_data["train"] = train_set.construct()
+    valid_set = lgb.Dataset(X[valid_index], y[valid_index], params=dataset_params, reference=train_set)
+    _worker_data["valid"] = valid_set.construct()
+
+
+def _deadline_callback(deadline: float, stopped: List[bool]) -> Callable[[lgb.callback.CallbackEnv], None]:
+    """探索の期限（UNIX時刻）を過ぎたら学習を打ち切るコールバックを作成する
+
+    Args:
+        deadline: 探索の期限（time.time()の値）
+        stopped: 期限で打ち切った場合にTrueを追加するリスト
+
+    Returns:
+        Callable[[lgb.callback.CallbackEnv], None]: lgb.trainに渡すコールバック
+    """
+
+    def _callback(env: lgb.callback.CallbackEnv) -> None:
+        if time.time() >= deadline:
+            stopped.append(True)
+            raise lgb.callback.EarlyStopException(env.iteration, env.evaluation_result_list)
+
+    # early stoppingのコールバック（order=30）の後に実行する
+    _callback.order = 40  # type: ignore[attr-defined]
+    return _callback
+
+
+def run_trial(
+    params: Dict[str, Any],
+    num_boost_round: int,
+    early_stopping_rounds: int,
+    deadline: float = math.inf,
+) -> Tuple[float, int, bool]:
+    """1つの試行を時系列順の検証データでearly stoppingしながら学習する（ワーカープロセスで実行される）
+    探索の期限を過ぎた場合は、実行中の学習もその回で打ち切る
+
+    Args:
+        params: LightGBMのパラメータ
+        num_boost_round: 最大のブースティング回数
+        early_stopping_rounds: 検証スコアが改善しない場合に打ち切るまでの回数
+        deadline: 探索の期限（time.time()の値）
+
+    Returns:
+        Tuple[float, int, bool]: 検証データの最良のRMSE、そのときのブースティング回数、期限で打ち切ったかどうか
+    """
+    stopped: List[bool] = []
+    booster = lgb.train(
+        params,
+        _worker_data["train"],
+        num_boost_round=num_boost_round,
+        valid_sets=[_worker_data["valid"]],
+        callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False), _deadline_callback(deadline, stopped)],
+    )
+    rmse = float(booster.best_score["valid_0"]["rmse"]) if booster.best_score else math.inf
+    return rmse, int(booster.best_iteration or num_boost_round), bool(stopped)
+
+
+def _collect_rung(
+    executor: ProcessPoolExecutor,
+    futures: Dict[Future, Dict[str, Any]],
+    rung: int,
+    rounds: int,
+    deadline: float,
+    log: List[Dict[str, Any]],
+) -> None:
+    """1つの段階の試行の結果を受け取り、試行と記録に反映する
+    期限を過ぎた場合は未実行の試行を取り消す。実行中の試行は期限のコールバックで次の回に打ち切られる
+
+    Args:
+        executor: 試行を実行しているプロセスプール
+        futures: 実行中の試行
+        rung: 段階の番号
+        rounds: この段階のブースティング回数
+        deadline: 探索の期限（time.monotonic()の値）
+        log: 試行の記録（終わった試行を追加する）
+    """
+    pending = set(futures)
+    while pending:
+        timeout = max(0.0, deadline - time.monotonic())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            trial = futures[future]
+            rmse, best_iteration, stopped = future.result()
+            if stopped:
+                # 期限で打ち切った試行は、回数を揃えて比較できないため結果に含めない
+                continue
+            trial["rmse"], trial["best_iteration"] = rmse, best_iteration
+            trial["rung"] = rung
+            log.append({**trial, "params": dict(trial["params"]), "num_boost_round": rounds})
+        if pending and time.monotonic() >= deadline:
+            logger.info(f"Search time budget exhausted at rung {rung}; cancelling {len(pending)} trials")
+            executor.shutdown(wait=False, cancel_futures=True)
+            return
+
+
+def successive_halving(
+    X: np.ndarray,
+    y: np.ndarray,
+    dates: np.ndarray,
+    n_trials: int = 27,
+    min_rounds: int = 50,
+    max_rounds: int = 2000,
+    eta: int = 3,
+    valid_days: Union[int, None] = None,
+    time_budget: float = 600.0,
+    max_workers: Union[int, None] = None,
+    seed: int = 10,
+    dataset_path: Union[str, None] = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Successive Halvingでハイパーパラメータを探索する
+    全試行を少ないブースティング回数で学習し、検証スコアが上位1/etaの試行だけを回数をeta倍にして学習し直す
+    各試行は末尾valid_days日を検証データとしてearly stoppingし、プロセスプールで並列に実行する
+    コア数を超えてスレッドが動かないように、各試行のスレッド数をCPU数 / プロセス数に制限する
+
+    Args:
+        X: 特徴量（日付順）
+        y: 目標値
+        dates: 各行の日付（昇順）
+        n_trials: 最初に試すハイパーパラメータの組数
+        min_rounds: 最初の段階のブースティング回数
+        max_rounds: 最後の段階のブースティング回数の上限
+        eta: 各段階で残す試行の割合の逆数（回数の増加率）
+        valid_days: 検証データの日数（省略時は全日数の1/5）
+        time_budget: 探索にかける時間の上限（秒）。超えた場合は実行中の試行の学習と未実行の試行を打ち切り、
+            それまでに終わった試行の中で最良のものを返す
+        max_workers: プロセス数（省略時はCPU数）
+        seed: 乱数シード
+        dataset_path: Xとyのビン分割済みのDatasetのバイナリファイル（DatasetCacheで作成したもの）。
+            指定した場合は各プロセスでビン分割をせずに読み込む
+
+    Returns:
+        Tuple[Dict[str, Any], List[Dict[str, Any]]]: 最良のハイパーパラメータ（n_estimatorsを含む）と全試行の記録
+
+    Raises:
+        RuntimeError: 時間内に1つも試行が終わらなかった場合
+    """
+    deadline = time.monotonic() + time_budget
+    # ワーカープロセスでも同じ期限を判定できるようにUNIX時刻でも保持する
+    worker_deadline = time.time() + time_budget
+    max_workers = max_workers or os.cpu_count() or 1
+    num_threads = max(1, (os.cpu_count() or 1) // max_workers)
+    valid_days = valid_days or max(1, len(np.unique(dates)) // 5)
+    train_index, valid_index = next(time_series_splits(dates, n_splits=1, horizon=valid_days))
+
+    rng = np.random.default_rng(seed)
+    trials = [
+        {"trial": i, "params": sample_params(rng), "rung": -1, "rmse": math.inf, "best_iteration": 0}
+        for i in range(n_trials)
+    ]
+    log: List[Dict[str, Any]] = []
+    survivors = trials
+    rounds = min_rounds
+    rung = 0
+    # Datasetのファイルがある場合は、特徴量を各プロセスに渡さない
+    initargs = (X, y, train_index, valid_index)
+    if dataset_path is not None:
+        initargs = (None, None, train_index, valid_index, dataset_path)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as executor:
+        while survivors and time.monotonic() < deadline:
+            early_stopping_rounds = max(10, rounds // 10)
+            futures: Dict[Future, Dict[str, Any]] = {
+                executor.submit(
+                    run_trial,
+                    {**BASE_PARAMS, **trial["params"], "num_threads": num_threads, "seed": seed},
+                    rounds,
+                    early_stopping_rounds,
+                    worker_deadline,
+                ): trial
+                for trial in survivors
+            }
+            _collect_rung(executor, futures, rung, rounds, deadline, log)
+
+            completed = sorted((t for t in survivors if t["rung"] == rung), key=lambda t: t["rmse"])
+            if not completed:
+                break
+            logger.info(
+                f"Rung {rung}: {len(completed)} trials with {rounds} rounds, best RMSE {completed[0]['rmse']:.3f}",
+            )
+            if rounds >= max_rounds or len(completed) <= 1:
+                break
+            # 上位1/etaの試行だけを、回数をeta倍にして次の段階で学習する
+            survivors = completed[: max(1, len(completed) // eta)]
+            rounds = min(max_rounds, rounds * eta)
+            rung += 1
+
+    finished = [t for t in trials if t["rung"] >= 0]
+    if not finished:
+        msg = f"No trials finished within the time budget ({time_budget} seconds)"
+        raise RuntimeError(msg)
+    # 最も多くの回数で学習した段階の中で、検証スコアが最良の試行を選ぶ
+    best = min(finished, key=lambda t: (-t["rung"], t["rmse"]))
+    best_params = {**best["params"], "subsample_freq": BASE_PARAMS["subsample_freq"]}
+    best_params["n_estimators"] = best["best_iteration"]
+    logger.info(f"Best trial {best['trial']} (rung {best['rung']}): RMSE {best['rmse']:.3f}, params {best_params}")
+    return best_params, log
@@ -9,18 +9,27 @@ import os
 import pickle
 from io import StringIO
 from pathlib import Path
-from typing import Any, Dict, Tuple, Union
+from typing import Any, Dict, List, Tuple, Union
 
 import joblib
 import numpy as np
 import pandas as pd
 
 from preprocess import FeatureEngineering, load_config
+from window_state import STATE_FILENAME, WINDOW_FEATURES, WindowState
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+# 前処理が日次で更新するラグ・移動窓特徴量のstateの保存先（モデルの環境変数で渡す）
+WINDOW_STATE_URI_ENV = "WINDOW_STATE_URI"
+# リクエストの列（エリアの列は複数エリアのモデルの場合のみ指定する）
+COLUMNS = ["date", "max_temp", "min_temp", "weather"]
+AREA_COL = "area"
+# エリアごとのモデルの一覧（train.pyのsave_modelが出力する）
+AREA_MANIFEST_FILENAME = "area_manifest.json"
+
 
 def model_fn(model_dir: str) -> Dict[str, Any]:
     """保存されたモデル・設定ファイル・エンコーダーを読み込む
@@ -29,11 +38,17 @@ def model_fn(model_dir: str) -> Dict[str, Any]:
         model_dir (str): モデルが保存されているディレクトリパス
 
     Returns:
-        Dict[str, Any]: モデルとエンコーダーを含む辞書
+        Dict[str, Any]: モデルとエンコーダーを含む辞書（エリアごとのモデルの場合、modelはエリア名の辞書）
     """
-    # モデルの読み込み
-    model_path = os.path.join(model_dir, "model.joblib")
-    model = joblib.load(model_path)
+    # モデルの読み込み（エリアごとのモデルの場合はマニフェストに従ってエリアごとに読み込む）
+    manifest_path = Path(model_dir) / AREA_MANIFEST_FILENAME
+    if manifest_path.exists():
+        with manifest_path.open() as f:
+            manifest = json.load(f)
+        model = {area: joblib.load(Path(model_dir) / entry["model"]) for area, entry in manifest["areas"].items()}
+        logger.info(f"Loaded {len(model)} area models")
+    else:
+        model = joblib.load(os.path.join(model_dir, "model.joblib"))
 
     # config.yaml の読み込み
     config_path = os.path.join(model_dir, "code", "config.yaml")
@@ -54,7 +69,60 @@ def model_fn(model_dir: str) -> Dict[str, Any]:
             feature_names = [line.strip() for line in f if line.strip()]
         logger.info(f"Loaded {len(feature_names)} feature names")
 
-    return {"model": model, "config": config, "encoders": encoders_dict, "feature_names": feature_names}
+    # ラグ・移動窓特徴量のstateの読み込み（存在する場合）
+    window_state = load_window_state(model_dir)
+
+    return {
+        "model": model,
+        "config": config,
+        "encoders": encoders_dict,
+        "feature_names": feature_names,
+        "window_state": window_state,
+    }
+
+
+def load_window_state(model_dir: str) -> Union[WindowState, None]:
+    """ラグ・移動窓特徴量のstateを読み込む
+    前処理が更新する最新のstate（環境変数WINDOW_STATE_URI）を優先し、ない場合はモデルと一緒に保存されたstateを使う
+
+    Args:
+        model_dir (str): モデルが保存されているディレクトリパス
+
+    Returns:
+        Union[WindowState, None]: 読み込んだstate（どちらにもない場合はNone）
+    """
+    window_state = None
+    state_uri = os.environ.get(WINDOW_STATE_URI_ENV)
+    if state_uri:
+        window_state = WindowState.load(state_uri)
+    if window_state is None and (Path(model_dir) / STATE_FILENAME).exists():
+        window_state = WindowState.load(model_dir)
+    if window_state is not None:
+        logger.info(f"Loaded window state up to {window_state.last_date}")
+    return window_state
+
+
+def refresh_window_state(model_dict: Dict[str, Any], dates: pd.Series) -> Union[WindowState, None]:
+    """リクエストの日付がstateの最終日の翌日より後の場合は、最新のstateを読み込み直す
+    エンドポイントは長く稼働するため、model_fnで読み込んだstateは前処理の実行後に古くなる
+
+    Args:
+        model_dict (Dict[str, Any]): model_fnが返した辞書（読み込み直したstateで更新する）
+        dates (pd.Series): リクエストの各行の日付
+
+    Returns:
+        Union[WindowState, None]: 使用するstate
+    """
+    window_state = model_dict.get("window_state")
+    state_uri = os.environ.get(WINDOW_STATE_URI_ENV)
+    if not state_uri or window_state is None or window_state.last_date is None:
+        return window_state
+    if pd.to_datetime(dates).max() > window_state.last_date + pd.Timedelta(days=1):
+        latest = WindowState.load(state_uri)
+        if latest is not None and latest.last_date > window_state.last_date:
+            logger.info(f"Reloaded window state up to {latest.last_date}")
+            model_dict["window_state"] = latest
+    return model_dict["window_state"]
 
 
 def apply_encoders(df: pd.DataFrame, encoders_dict: Dict[str, Any]) -> pd.DataFrame:
@@ -78,6 +146,33 @@ def apply_encoders(df: pd.DataFrame, encoders_dict: Dict[str, Any]) -> pd.DataFr
     return result_df
 
 
+def required_features(
+    feature_names: List[str],
+    encoders_dict: Dict[str, Any],
+    target_col: str = "max_power",
+) -> List[str]:
+    """モデルが使用する特徴量名から、特徴量エンジニアリングで計算が必要な特徴量名を求める
+    エンコード後の列名（例: weather_category_晴れ）はエンコード前の列名（weather_category）に置き換える
+
+    Args:
+        feature_names (List[str]): 学習時の特徴量名（先頭は目的変数）
+        encoders_dict (Dict[str, Any]): エンコーダーの辞書
+        target_col (str): 目的変数のカラム名
+
+    Returns:
+        List[str]: 計算が必要な特徴量名
+    """
+    encoded_columns = [col for encoder in encoders_dict.values() for col in getattr(encoder, "columns", [])]
+    required = []
+    for name in feature_names:
+        if name == target_col:
+            continue
+        source = next((col for col in encoded_columns if name == col or name.startswith(f"{col}_")), name)
+        if source not in required:
+            required.append(source)
+    return required
+
+
 def astype_df(df: pd.DataFrame) -> pd.DataFrame:
     """データフレームのカラムの型を変換する
 
@@ -95,11 +190,58 @@ def astype_df(df: pd.DataFrame) -> pd.DataFrame:
         elif col in {"max_temp", "min_temp"}:
             df[col] = pd.to_numeric(df[col], errors="coerce")
         # 明示的にstrへ変換
-        elif col == "weather":
+        elif col in {"weather", AREA_COL}:
             df[col] = df[col].astype(str)
     return df
 
 
+def select_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """リクエストの列を選択する（エリアの列はある場合のみ含める）
+
+    Args:
+        df (pd.DataFrame): リクエストから作成したデータフレーム
+
+    Returns:
+        pd.DataFrame: リクエストの列だけのデータフレーム
+    """
+    return df[[*COLUMNS, AREA_COL]] if AREA_COL in df.columns else df[COLUMNS]
+
+
+def predict_by_area(
+    model: Union[Any, Dict[str, Any]],
+    X: np.ndarray,
+    areas: Union[pd.Series, None],
+) -> np.ndarray:
+    """予測を行う（エリアごとのモデルの場合は、各行をリクエストのエリアのモデルで予測する）
+
+    Args:
+        model (Union[Any, Dict[str, Any]]): 学習済みモデル（エリアごとのモデルの場合はエリア名の辞書）
+        X (np.ndarray): 特徴量
+        areas (Union[pd.Series, None]): 各行のエリア
+
+    Returns:
+        np.ndarray: 予測値
+
+    Raises:
+        ValueError: エリアごとのモデルで、リクエストにエリアがないか、モデルのないエリアがある場合
+    """
+    if not isinstance(model, dict):
+        return model.predict(X)
+    if areas is None:
+        msg = f"Request has no {AREA_COL} column (required for per-area models: {sorted(model)})"
+        raise ValueError(msg)
+    areas = areas.to_numpy()
+    missing = sorted(set(areas) - set(model))
+    if missing:
+        msg = f"No models for areas {missing} (available: {sorted(model)})"
+        raise ValueError(msg)
+    y_pred = np.empty(len(X))
+    for area in np.unique(areas):
+        rows = areas == area
+        y_pred[rows] = model[area].predict(X[rows])
+    return y_pred
+
+
 def input_fn(request_body: Union[str, bytes], request_content_type: str) -> pd.DataFrame:
     """
     推論APIに送信されたリクエストのContent-Typeに応じて、入力データ（CSVやJSONなど）をDataFrameへ変換する
@@ -112,8 +254,8 @@ def input_fn(request_body: Union[str, bytes], request_content_type: str) -> pd.D
 
     Returns:
         pd.DataFrame: Content-Typeに応じて変換されたデータフレーム。
-            - カラム: ['date', 'max_temp', 'min_temp', 'weather']
-            - 'date'はdatetime型、'max_temp'と'min_temp'はfloat型、'weather'はstr型に変換される
+            - カラム: ['date', 'max_temp', 'min_temp', 'weather']（複数エリアのモデルの場合は末尾に'area'）
+            - 'date'はdatetime型、'max_temp'と'min_temp'はfloat型、'weather'と'area'はstr型に変換される
 
     Raises:
         ValueError: サポートされていないContent-Typeの場合
@@ -123,13 +265,13 @@ def input_fn(request_body: Union[str, bytes], request_content_type: str) -> pd.D
         input_fn('2024-05-21,25.0,15.0,晴れ', 'text/csv')
         # JSONリクエスト例
         input_fn('{"date": "2024-05-21", "max_temp": 25.0, "min_temp": 15.0, "weather": "晴れ"}', 'application/json')
+        # 複数エリアのモデルへのリクエスト例
+        input_fn('2024-05-21,25.0,15.0,晴れ,tokyo', 'text/csv')
     """
-
-    COLUMNS = ["date", "max_temp", "min_temp", "weather"]
-
     # text/csv なら CSV 文字列→DataFrame
     if request_content_type.startswith("text/csv"):
-        df = pd.read_csv(StringIO(request_body), header=None, names=COLUMNS)
+        df = pd.read_csv(StringIO(request_body), header=None)
+        df.columns = [*COLUMNS, AREA_COL][: len(df.columns)]
         return astype_df(df)
 
     # application/json 系
@@ -138,15 +280,17 @@ def input_fn(request_body: Union[str, bytes], request_content_type: str) -> pd.D
 
         # [{...}, {...}] 形式
         if isinstance(payload, list) and payload and isinstance(payload[0], dict):
-            return astype_df(pd.DataFrame(payload)[COLUMNS])
+            return astype_df(select_columns(pd.DataFrame(payload)))
 
         # {"feature": val, ...} 単一レコード形式
         if isinstance(payload, dict) and "features" not in payload:
-            return astype_df(pd.DataFrame([payload])[COLUMNS])
+            return astype_df(select_columns(pd.DataFrame([payload])))
 
         # {"features": [[...]]} 形式
         if isinstance(payload, dict) and "features" in payload:
-            return astype_df(pd.DataFrame(payload["features"], columns=COLUMNS))
+            rows = payload["features"]
+            columns = [*COLUMNS, AREA_COL][: len(rows[0]) if rows else len(COLUMNS)]
+            return astype_df(pd.DataFrame(rows, columns=columns))
     msg = f"Unsupported content type: {request_content_type}"
     raise ValueError(msg)
 
@@ -161,28 +305,53 @@ def predict_fn(input_data: pd.DataFrame, model_dict: Dict[str, Any]) -> np.ndarr
 
     Returns:
         np.ndarray: モデルの予測結果
+
+    Raises:
+        ValueError: 複数エリアのモデル（configのarea_columnを指定）で、リクエストにエリアの列がない場合、
+            またはモデルの特徴量を作成できない場合
     """
     model = model_dict["model"]
     config = model_dict["config"]
     encoders_dict = model_dict.get("encoders", {})
     feature_names = model_dict.get("feature_names", [])
 
-    # 特徴量エンジニアリング
+    # 特徴量エンジニアリング（モデルが使用する特徴量とその依存関係だけを計算する）
     feature_engineering = FeatureEngineering(config=config)
-    input_data = feature_engineering.make_features(df=input_data, date_col="date")
+    features = required_features(feature_names, encoders_dict) if feature_names else None
+    window_features = [name for name in features or [] if name in WINDOW_FEATURES]
+    if features is not None:
+        features = [name for name in features if name not in WINDOW_FEATURES]
+    dates = input_data["date"]
+    areas = input_data[AREA_COL].reset_index(drop=True) if AREA_COL in input_data.columns else None
+    if areas is None and config.get("area_column") is not None:
+        msg = f"Request has no {AREA_COL} column (required because area_column is set in config.yaml)"
+        raise ValueError(msg)
+    input_data = feature_engineering.make_features(df=input_data, date_col="date", features=features)
+
+    # ラグ・移動窓特徴量は各行の日付に対してstateから作成する（stateの最終日の翌日以外は欠損値になる）
+    if window_features:
+        window_state = refresh_window_state(model_dict, dates)
+        if window_state is None:
+            # stateがない場合（複数エリアのモデルや初回の実行前）は、空のstateと同じく欠損値にする
+            logger.warning(f"No window state available; {len(window_features)} window features are set to NaN")
+            window = pd.DataFrame(np.nan, index=dates.index, columns=window_features, dtype="float64")
+        else:
+            window = window_state.features_for_dates(dates)[window_features]
+        input_data = pd.concat([input_data, window], axis=1)
 
     # エンコーダー適用（存在する場合のみ）
     if encoders_dict:
         input_data = apply_encoders(input_data, encoders_dict)
 
-    # 学習時のカラム順序に合わせる
+    # 学習時のカラム順序に合わせる（特徴量が足りない場合は、特徴量の数が合わないまま予測せずにエラーにする）
     if feature_names:
-        # 特徴量名と入力データの列名の交差部分を取得
-        common_columns = [col for col in feature_names if col in input_data.columns]
-        if common_columns:
-            input_data = input_data[common_columns]
+        missing = [col for col in feature_names[1:] if col not in input_data.columns]
+        if missing:
+            msg = f"Missing features for the model: {missing}"
+            raise ValueError(msg)
+        input_data = input_data.reindex(columns=feature_names[1:])
 
-    return model.predict(input_data.values)
+    return predict_by_area(model, input_data.to_numpy(), areas)
 
 
 def output_fn(prediction: np.ndarray, accept: str) -> Tuple[Union[str, bytes], str]:
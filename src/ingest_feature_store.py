@@ -6,6 +6,7 @@ subprocess.run(
     [sys.executable, "-m", "pip", "install", "--quiet", "sagemaker"],
     check=True,
 )
+sys.path.append("/opt/ml/processing/deps")
 
 import argparse
 import datetime
@@ -17,6 +18,8 @@ import pandas as pd
 from sagemaker.feature_store.feature_group import FeatureGroup
 from sagemaker.session import Session
 
+from window_state import WindowState
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
@@ -31,6 +34,13 @@ def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument("--feature-group-name", type=str)
     parser.add_argument("--region", type=str, default="ap-northeast-1")
+    parser.add_argument(
+        "--window-state-uri",
+        type=str,
+        default="",
+        help="登録が成功した後に、前処理で更新したラグ・移動窓特徴量のstateを反映する保存先",
+    )
+    parser.add_argument("--window-state-dir", type=str, default="/opt/ml/processing/window_state")
     return parser.parse_args()
 
 
@@ -45,9 +55,12 @@ if __name__ == "__main__":
     df = pd.read_parquet("/opt/ml/processing/extract_features/")
 
     # Feature Store に必須の列（record_identifier, event_time）を追加
-    #    - record_id: 一意のID
+    #    - record_id: 一意のID（エリア列がある場合は日付とエリアの組み合わせ）
     #    - event_time: 時系列順序を定義
-    df["record_id"] = df["date"].astype(str)
+    if "area" in df.columns:
+        df["record_id"] = df["date"].astype(str) + "|" + df["area"].astype(str)
+    else:
+        df["record_id"] = df["date"].astype(str)
     df["event_time"] = datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")  # noqa: UP017
 
     feature_group.ingest(
@@ -56,8 +69,18 @@ if __name__ == "__main__":
         wait=True,
     )
     # オフラインストアのメタデータを取得し、URIを保存
-    offline_uri = feature_group.describe()["OfflineStoreConfig"]["S3StorageConfig"]["S3Uri"]
+    # ResolvedOutputS3Uriはフィーチャーグループのデータのプレフィックス（dataprepのparquet読み込みで使用する）
+    s3_storage_config = feature_group.describe()["OfflineStoreConfig"]["S3StorageConfig"]
+    offline_uri = s3_storage_config.get("ResolvedOutputS3Uri", s3_storage_config["S3Uri"])
     logger.info(f"Offline store URI: {offline_uri}")
     Path("/opt/ml/processing/offline_uri/uri.txt").write_text(offline_uri)
 
+    # 登録が成功した場合だけstateを反映する（失敗した場合は次回の前処理で同じ日を処理し直す）
+    if args.window_state_uri:
+        window_state = WindowState.load(args.window_state_dir)
+        if window_state is None:
+            logger.warning(f"No window state found in {args.window_state_dir}; {args.window_state_uri} is unchanged")
+        else:
+            window_state.save(args.window_state_uri)
+
     logger.info("Feature store ingestion completed successfully.")
@@ -0,0 +1,137 @@
+import json
+import logging
+from pathlib import Path
+from typing import Tuple, Union
+
+import numpy as np
+
+from power_usage_parser import SLOTS_PER_DAY
+
+logger = logging.getLogger()
+
+META_FILENAME = "meta.json"
+VALUES_FILENAME = "values.f32"
+DATES_FILENAME = "dates.i64"
+
+
+class IntradayStore:
+    """5分間隔の電力使用量を日数 × 288 のfloat32配列として保存する追記専用のストア
+    値と日付インデックスはそれぞれ生のバイナリファイルに保存し、読み込み時はメモリマップで参照する
+    日付範囲の切り出しはコピーせずにメモリマップのビューを返すため、CSVを再パースせずに日中の分析ができる
+    """
+
+    def __init__(self, root_dir: Union[str, Path], slots: int = SLOTS_PER_DAY) -> None:
+        """
+        Args:
+            root_dir (Union[str, Path]): ストアの保存先ディレクトリ
+            slots (int): 1日あたりの値の数
+        """
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.root_dir / META_FILENAME
+        self.values_path = self.root_dir / VALUES_FILENAME
+        self.dates_path = self.root_dir / DATES_FILENAME
+
+        self.slots = slots
+        self.days = 0
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text())
+            if meta["slots"] != slots:
+                msg = f"Intraday store slots mismatch: {meta['slots']} != {slots}"
+                raise ValueError(msg)
+            self.days = meta["days"]
+        self._values: Union[np.ndarray, None] = None
+        self._dates: Union[np.ndarray, None] = None
+
+    def __len__(self) -> int:
+        return self.days
+
+    @property
+    def values(self) -> np.ndarray:
+        """全期間の値（読み取り専用のメモリマップ, shape: 日数 × slots）"""
+        if self._values is None:
+            if self.days == 0:
+                return np.empty((0, self.slots), dtype=np.float32)
+            self._values = np.memmap(self.values_path, dtype=np.float32, mode="r", shape=(self.days, self.slots))
+        return self._values
+
+    @property
+    def dates(self) -> np.ndarray:
+        """日付インデックス（読み取り専用のメモリマップ, datetime64[D]）"""
+        if self._dates is None:
+            if self.days == 0:
+                return np.empty(0, dtype="datetime64[D]")
+            self._dates = np.memmap(self.dates_path, dtype="datetime64[D]", mode="r", shape=(self.days,))
+        return self._dates
+
+    @property
+    def last_date(self) -> Union[np.datetime64, None]:
+        """保存されている最後の日付（空の場合はNone）"""
+        return self.dates[-1] if self.days else None
+
+    def append(self, dates: np.ndarray, values: np.ndarray) -> int:
+        """日付順のデータを末尾に追記する
+        保存済みの最後の日付以前のデータは追記済みとみなしてスキップする
+
+        Args:
+            dates: 日付の配列（datetime64に変換できる値）
+            values: 5分間隔の値の配列（shape: 日数 × slots）
+
+        Returns:
+            int: 追記した日数
+
+        Raises:
+            ValueError: 配列の形が一致しない、または日付が昇順でない場合
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        values = np.asarray(values, dtype=np.float32)
+        if values.shape != (len(dates), self.slots):
+            msg = f"Expected values of shape ({len(dates)}, {self.slots}), got {values.shape}"
+            raise ValueError(msg)
+        if len(dates) > 1 and not (np.diff(dates) > np.timedelta64(0, "D")).all():
+            msg = "Dates must be strictly increasing"
+            raise ValueError(msg)
+
+        if self.days:
+            new = dates > self.last_date
+            dates, values = dates[new], values[new]
+        if len(dates) == 0:
+            return 0
+
+        # 前回の追記が途中で失敗した場合に備え、メタデータの日数までファイルを切り詰めてから追記する
+        for path, row_bytes in ((self.values_path, self.slots * 4), (self.dates_path, 8)):
+            with path.open("ab") as f:
+                f.truncate(self.days * row_bytes)
+        with self.values_path.open("ab") as f:
+            f.write(np.ascontiguousarray(values).tobytes())
+        with self.dates_path.open("ab") as f:
+            f.write(dates.astype("datetime64[D]").astype(np.int64).tobytes())
+
+        # メタデータの更新をもって追記を確定する
+        self.days += len(dates)
+        tmp_path = self.meta_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"slots": self.slots, "days": self.days, "dtype": "float32"}))
+        tmp_path.replace(self.meta_path)
+        self._values = None
+        self._dates = None
+        logger.info(f"Appended {len(dates)} days to intraday store (total {self.days} days)")
+        return len(dates)
+
+    def slice(
+        self,
+        start: Union[str, np.datetime64, None] = None,
+        end: Union[str, np.datetime64, None] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """日付範囲のデータをコピーせずに切り出す
+
+        Args:
+            start: 開始日（この日を含む、省略時は先頭から）
+            end: 終了日（この日を含む、省略時は末尾まで）
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 日付の配列と値の配列（shape: 日数 × slots）のビュー
+        """
+        dates = self.dates
+        lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start, "D"), side="left"))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(end, "D"), side="right"))
+        return dates[lo:hi], self.values[lo:hi]
@@ -0,0 +1,230 @@
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Union
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from lightgbm import LGBMRegressor
+
+from train import load_data, load_feature_names
+from warm_start import as_booster
+
+logger = logging.getLogger()
+
+COMPACTION_REPORT_FILENAME = "model_compaction.json"
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    引数をパースする
+
+    Returns:
+        argparse.Namespace: パースされた引数
+    """
+    parser = argparse.ArgumentParser(description="木の数・葉の数を減らしたモデルの精度と推論時間を比較する")
+    parser.add_argument("--model-dir", type=str, required=True, help="model.joblibとfeatures.txtのディレクトリ")
+    parser.add_argument("--train", type=str, required=True, help="train.parquetとfeatures.txtが入っているディレクトリ")
+    parser.add_argument("--test-path", type=str, required=True, help="test.parquetのパス")
+    parser.add_argument("--max-accuracy-loss", type=float, default=0.01, help="テストRMSEの悪化の許容割合")
+    parser.add_argument("--latency-target-us", type=float, default=0.0, help="1行の推論時間の上限（μs、0は無制限）")
+    parser.add_argument("--fractions", type=float, nargs="+", default=[0.1, 0.2, 0.3, 0.5, 0.7, 1.0])
+    parser.add_argument("--num-leaves", type=int, nargs="+", default=[7, 15], help="学習し直すモデルの葉の数")
+    parser.add_argument("--latency-rows", type=int, default=200, help="1行の推論時間の計測に使う行数")
+    parser.add_argument("--apply", action="store_true", help="選んだモデルでmodel.joblibを置き換える")
+    return parser.parse_args()
+
+
+def truncate(booster: lgb.Booster, num_iteration: int) -> lgb.Booster:
+    """先頭num_iteration回分の木だけを持つBoosterを作成する"""
+    return lgb.Booster(model_str=booster.model_to_string(num_iteration=num_iteration))
+
+
+def measure_latency(booster: lgb.Booster, X: np.ndarray, rows: int = 200) -> Tuple[float, float]:
+    """1行ずつ推論した場合と、まとめて推論した場合の1行あたりの推論時間（マイクロ秒）を計測する
+
+    Args:
+        booster: モデル
+        X: 推論に使う特徴量
+        rows: 1行ずつの推論に使う行数
+
+    Returns:
+        Tuple[float, float]: 1行ずつの推論時間の中央値、まとめて推論した場合の1行あたりの推論時間（3回の最小値）
+    """
+    single = []
+    for row in X[:rows]:
+        start = time.perf_counter()
+        booster.predict(row.reshape(1, -1))
+        single.append(time.perf_counter() - start)
+    batch = []
+    for _ in range(3):
+        start = time.perf_counter()
+        booster.predict(X)
+        batch.append(time.perf_counter() - start)
+    return float(np.median(single) * 1e6), float(min(batch) / len(X) * 1e6)
+
+
+def evaluate_candidate(
+    name: str,
+    booster: lgb.Booster,
+    X_test: np.ndarray,
+    y_test: np.ndarray,
+    latency_rows: int,
+) -> Dict[str, Any]:
+    """候補のモデルのテストRMSE・推論時間・大きさを求める"""
+    error = booster.predict(X_test) - y_test
+    single_us, batch_us = measure_latency(booster, X_test, latency_rows)
+    model_info = booster.dump_model()["tree_info"]
+    return {
+        "name": name,
+        "num_trees": booster.num_trees(),
+        "num_leaves": int(sum(tree["num_leaves"] for tree in model_info)),
+        "model_bytes": len(booster.model_to_string()),
+        "rmse": float(np.sqrt(np.mean(error**2))),
+        "single_row_us": single_us,
+        "batch_row_us": batch_us,
+    }
+
+
+def pareto_front(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """テストRMSEと1行の推論時間の両方で他の候補に劣らない候補を、推論時間の短い順に返す"""
+    front = []
+    for candidate in sorted(candidates, key=lambda c: (c["single_row_us"], c["rmse"])):
+        if not front or candidate["rmse"] < front[-1]["rmse"]:
+            front.append(candidate)
+    return front
+
+
+def compact(
+    model: Union[LGBMRegressor, lgb.Booster],
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    X_test: np.ndarray,
+    y_test: np.ndarray,
+    max_accuracy_loss: float = 0.01,
+    latency_target_us: float = 0.0,
+    fractions: Tuple[float, ...] = (0.1, 0.2, 0.3, 0.5, 0.7, 1.0),
+    num_leaves: Tuple[int, ...] = (7, 15),
+    latency_rows: int = 200,
+) -> Tuple[lgb.Booster, Dict[str, Any]]:
+    """木の数・葉の数を減らした候補のモデルを作成し、精度と推論時間の条件を満たす最も小さいモデルを選ぶ
+    候補は次のモデルのそれぞれで、先頭の木だけを残したもの（fractionsの割合）
+    - 元のモデル
+    - 葉の数をnum_leavesにして学習し直したモデル（目的変数で学習）
+    - 葉の数をnum_leavesにして元のモデルの予測値を学習した蒸留モデル
+    テストRMSEが元のモデルの(1 + max_accuracy_loss)倍以内で、1行の推論時間がlatency_target_us以内の候補のうち、
+    葉の合計数が最も少ないものを選ぶ（条件を満たす候補がない場合は元のモデル）
+
+    Args:
+        model: 学習済みのモデル
+        X_train: 学習データの特徴量（学習し直す・蒸留する場合に使う）
+        y_train: 学習データの目標値
+        X_test: テストデータの特徴量
+        y_test: テストデータの目標値
+        max_accuracy_loss: テストRMSEの悪化の許容割合
+        latency_target_us: 1行の推論時間の上限（マイクロ秒、0は無制限）
+        fractions: 残す木の数の割合
+        num_leaves: 学習し直すモデルの葉の数
+        latency_rows: 1行の推論時間の計測に使う行数
+
+    Returns:
+        Tuple[lgb.Booster, Dict[str, Any]]: 選んだモデルと、全候補・パレート最適な候補・選んだ候補の記録
+    """
+    booster = as_booster(model)
+    num_trees = booster.num_trees()
+    # 元のモデルのパラメータで、木の数と葉の数・深さだけを変えて学習し直す
+    params = {
+        **{
+            name: value
+            for name, value in booster.params.items()
+            if name not in {"num_iterations", "n_estimators", "num_leaves", "max_depth", "metric"}
+        },
+        "objective": "regression",
+        "verbose": -1,
+    }
+    bases = {"original": booster}
+    teacher = booster.predict(X_train)
+    for leaves in num_leaves:
+        leaf_params = {**params, "num_leaves": leaves}
+        bases[f"leaves{leaves}"] = lgb.train(leaf_params, lgb.Dataset(X_train, y_train), num_boost_round=num_trees)
+        bases[f"distilled{leaves}"] = lgb.train(leaf_params, lgb.Dataset(X_train, teacher), num_boost_round=num_trees)
+
+    candidates = []
+    models = {}
+    for base_name, base in bases.items():
+        for iterations in sorted({max(1, round(base.num_trees() * fraction)) for fraction in fractions}):
+            name = f"{base_name}@{iterations}"
+            models[name] = truncate(base, iterations) if iterations < base.num_trees() else base
+            candidates.append(evaluate_candidate(name, models[name], X_test, y_test, latency_rows))
+            logger.info(f"Candidate {candidates[-1]}")
+
+    baseline = next(c for c in candidates if c["name"] == f"original@{num_trees}")
+    for candidate in candidates:
+        candidate["accuracy_loss"] = candidate["rmse"] / baseline["rmse"] - 1
+        candidate["feasible"] = candidate["accuracy_loss"] <= max_accuracy_loss and (
+            not latency_target_us or candidate["single_row_us"] <= latency_target_us
+        )
+    feasible = [c for c in candidates if c["feasible"]]
+    selected = min(feasible, key=lambda c: (c["num_leaves"], c["rmse"])) if feasible else baseline
+    report = {
+        "max_accuracy_loss": max_accuracy_loss,
+        "latency_target_us": latency_target_us,
+        "baseline": baseline["name"],
+        "selected": selected["name"],
+        "pareto": [c["name"] for c in pareto_front(candidates)],
+        "candidates": candidates,
+    }
+    return models[selected["name"]], report
+
+
+def load_test_data(test_path: str, feature_names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """テストデータからモデルの特徴量と目標値を読み込む（feature_namesの先頭は目的変数）"""
+    data = pd.read_parquet(test_path, columns=feature_names)
+    return data.iloc[:, 1:].to_numpy(), data.iloc[:, 0].to_numpy()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    model_dir = Path(args.model_dir)
+    if not (model_dir / "model.joblib").exists():
+        msg = f"{model_dir} has no model.joblib (per-area models are not supported)"
+        raise ValueError(msg)
+    model = joblib.load(model_dir / "model.joblib")
+
+    # 特徴量を削減したモデルの場合もあるため、モデルと一緒に保存された特徴量名の列を使う
+    feature_names = load_feature_names(str(model_dir))
+    X_train, y_train = load_data(args.train)
+    train_feature_names = load_feature_names(args.train)
+    X_train = X_train[:, [train_feature_names.index(name) - 1 for name in feature_names[1:]]]
+    X_test, y_test = load_test_data(args.test_path, feature_names)
+
+    compact_model, report = compact(
+        model,
+        X_train,
+        y_train,
+        X_test,
+        y_test,
+        max_accuracy_loss=args.max_accuracy_loss,
+        latency_target_us=args.latency_target_us,
+        fractions=tuple(args.fractions),
+        num_leaves=tuple(args.num_leaves),
+        latency_rows=args.latency_rows,
+    )
+    with (model_dir / COMPACTION_REPORT_FILENAME).open("w") as f:
+        json.dump(report, f, indent=2)
+    selected = next(c for c in report["candidates"] if c["name"] == report["selected"])
+    baseline = next(c for c in report["candidates"] if c["name"] == report["baseline"])
+    logger.info(
+        f"Selected {selected['name']}: RMSE {baseline['rmse']:.2f} -> {selected['rmse']:.2f}, "
+        f"single-row {baseline['single_row_us']:.0f} -> {selected['single_row_us']:.0f} us, "
+        f"{baseline['num_leaves']} -> {selected['num_leaves']} leaves",
+    )
+    if args.apply and report["selected"] != report["baseline"]:
+        # 元のモデルは残し、推論で読み込むmodel.joblibを選んだモデルで置き換える
+        (model_dir / "model.joblib").replace(model_dir / "model_original.joblib")
+        joblib.dump(compact_model, model_dir / "model.joblib")
+        logger.info(f"Replaced {model_dir / 'model.joblib'} (original saved as model_original.joblib)")
@@ -0,0 +1,233 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Type, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+logger = logging.getLogger()
+
+# Feature Storeのレコードの識別子とイベント時刻の列
+RECORD_ID_COLUMN = "record_id"
+EVENT_TIME_COLUMN = "event_time"
+# 列を指定して読み込む場合にも常に読み込む列
+KEY_COLUMNS = [RECORD_ID_COLUMN, EVENT_TIME_COLUMN, "date"]
+# Feature Storeが追加するメタデータの列（OfflineストアのファイルとGlueテーブルの両方に含まれる）
+# 特徴量ではないため読み込まない（is_deletedは削除されたレコードを除くためにだけ使う）
+OFFLINE_STORE_METADATA_COLUMNS = ["write_time", "api_invocation_time", "is_deleted"]
+# レコードの削除（DeleteRecord）を表すメタデータの列。最新のレコードが削除の場合は、そのrecord_idを結果に含めない
+DELETED_COLUMN = "is_deleted"
+# Offlineストアのパーティション（イベント時刻の年・月・日・時）
+OFFLINE_STORE_PARTITION_COLUMNS = ["year", "month", "day", "hour"]
+# スナップショットのパーティション列（dateの年月, YYYY-MM）
+SNAPSHOT_PARTITION_COLUMN = "date_month"
+
+
+def unified_dataset(uri: str, partitioning: Union[ds.Partitioning, str, None] = "hive") -> ds.Dataset:
+    """ディレクトリ以下のParquetファイルを、全ファイルのスキーマを統合したデータセットとして開く
+    特徴量を追加する前に書き込まれたファイルも読めるように（不足する列は欠損値になる）スキーマを統合する
+
+    Args:
+        uri: S3のプレフィックスまたはローカルのディレクトリ
+        partitioning: パーティションの形式
+
+    Returns:
+        ds.Dataset: データセット
+    """
+    dataset = ds.dataset(uri, format="parquet", partitioning=partitioning)
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()])
+    if dataset.partitioning is not None:
+        schema = pa.unify_schemas([schema, dataset.partitioning.schema])
+    return ds.dataset(uri, schema=schema, format="parquet", partitioning=partitioning)
+
+
+def _project(names: List[str], columns: Union[List[str], None]) -> List[str]:
+    """読み込む列を決める（columnsがNoneの場合は全列、指定した場合はキーの列と指定した列）"""
+    if columns is None:
+        return names
+    return [name for name in names if name in KEY_COLUMNS or name in columns]
+
+
+def keep_latest(table: pa.Table, drop_deleted: bool = True) -> pa.Table:
+    """record_idごとにevent_timeが最新のレコードだけを残す
+    Athenaの ROW_NUMBER() OVER (PARTITION BY record_id ORDER BY event_time DESC) = 1 と同じ結果をソートだけで求める
+
+    Args:
+        table: record_id, event_time列（削除を反映する場合はis_deleted列も）を含むテーブル
+        drop_deleted: 最新のレコードが削除のrecord_idを除き、is_deleted列を削除するかどうか
+            （Falseの場合は削除のレコードも残す。スナップショットに後からマージする場合に使う）
+
+    Returns:
+        pa.Table: record_id順に並んだ重複のないテーブル
+    """
+    if table.num_rows > 0:
+        table = table.sort_by([(RECORD_ID_COLUMN, "ascending"), (EVENT_TIME_COLUMN, "ascending")])
+        record_ids = table[RECORD_ID_COLUMN].to_numpy(zero_copy_only=False)
+        # 次の行とrecord_idが異なる行が、各record_idの最新のレコード
+        is_last = np.append(record_ids[1:] != record_ids[:-1], True)
+        table = table.filter(pa.array(is_last))
+    if drop_deleted and DELETED_COLUMN in table.column_names:
+        deleted = pc.fill_null(table[DELETED_COLUMN], False)
+        table = table.filter(pc.invert(deleted)).drop_columns([DELETED_COLUMN])
+    return table
+
+
+class OfflineStoreReader(ABC):
+    """Offlineストアから期間内の最新のレコードを読み込むクラスの基底クラス"""
+
+    @abstractmethod
+    def read(self, start_date: str, end_date: str, columns: Union[List[str], None] = None) -> pd.DataFrame:
+        """期間内（両端を含む）の、record_idごとに最新のレコードを読み込む
+
+        Args:
+            start_date: 開始日（YYYY-MM-DD）
+            end_date: 終了日（YYYY-MM-DD）
+            columns: 読み込む列（省略時は全列。record_id, event_time, dateは常に読み込む）
+
+        Returns:
+            pd.DataFrame: record_id, event_time, date と特徴量の列を持つデータフレーム
+        """
+
+
+class AthenaReader(OfflineStoreReader):
+    """AthenaのクエリでGlueテーブルから最新のレコードを読み込むクラス"""
+
+    def __init__(
+        self,
+        glue_db: str,
+        glue_table: str,
+        region: str = "ap-northeast-1",
+        s3_output: str = "s3://power-forecast-athena-query-results-dev/",
+    ) -> None:
+        """
+        Args:
+            glue_db (str): Glueデータベース名
+            glue_table (str): Glueテーブル名
+            region (str): リージョン
+            s3_output (str): クエリ結果の出力先
+        """
+        self.glue_db = glue_db
+        self.glue_table = glue_table
+        self.region = region
+        self.s3_output = s3_output
+
+    def read(self, start_date: str, end_date: str, columns: Union[List[str], None] = None) -> pd.DataFrame:
+        # Athenaを使う場合のみ必要になるため、ここでインポートする
+        import awswrangler as wr
+        import boto3
+
+        select = "*" if columns is None else ", ".join(KEY_COLUMNS + [c for c in columns if c not in KEY_COLUMNS])
+        query = f"""
+            SELECT
+                {select}
+            FROM
+            (
+                SELECT
+                    *,
+                    ROW_NUMBER() OVER (PARTITION BY record_id ORDER BY event_time DESC) AS latest
+                FROM "{self.glue_db}"."{self.glue_table}"
+            )
+            WHERE date BETWEEN '{start_date}' AND '{end_date}' AND latest = 1 AND NOT {DELETED_COLUMN}
+        """  # noqa: S608
+
+        boto_session = boto3.Session(region_name=self.region)
+        df = wr.athena.read_sql_query(
+            query,
+            database=self.glue_db,
+            boto3_session=boto_session,
+            s3_output=self.s3_output,
+            ctas_approach=True,
+            workgroup="primary",
+        )
+        df = df.drop(columns=["latest", *OFFLINE_STORE_METADATA_COLUMNS], errors="ignore")
+        return df.sort_values(RECORD_ID_COLUMN).reset_index(drop=True)
+
+
+class ParquetReader(OfflineStoreReader):
+    """OfflineストアのParquetファイル（S3のプレフィックスまたはローカルのディレクトリ）を直接読み込むクラス
+    dateの条件はファイルの統計情報を使ったプッシュダウンで絞り込み、重複の除去はメモリ上のソートで行う
+    """
+
+    def __init__(self, uri: str) -> None:
+        """
+        Args:
+            uri (str): Offlineストアのデータのプレフィックス（s3://.../data）またはローカルのディレクトリ
+        """
+        self.uri = uri
+
+    def read(self, start_date: str, end_date: str, columns: Union[List[str], None] = None) -> pd.DataFrame:
+        dataset = unified_dataset(self.uri)
+        excluded = set(OFFLINE_STORE_METADATA_COLUMNS + OFFLINE_STORE_PARTITION_COLUMNS)
+        columns = _project([name for name in dataset.schema.names if name not in excluded], columns)
+        if DELETED_COLUMN in dataset.schema.names:
+            # 削除されたレコードを除くために読み込む（keep_latestで除いた後に列を削除する）
+            columns.append(DELETED_COLUMN)
+        # dateは文字列のため、Athenaの BETWEEN と同じく文字列として比較する
+        date = ds.field("date")
+        table = dataset.to_table(
+            columns=columns,
+            filter=(date >= start_date) & (date <= end_date),
+            use_threads=True,
+        )
+        table = keep_latest(table)
+        logger.info(f"Read {table.num_rows} latest records from {self.uri}")
+        return table.to_pandas()
+
+
+class SnapshotReader(OfflineStoreReader):
+    """compact_offline_store.pyが作成した最新レコードのスナップショットを読み込むクラス
+    スナップショットはrecord_idごとに1行だけを持つため、読み込み量は履歴の長さに比例する（取り込み回数に依存しない）
+    """
+
+    def __init__(self, uri: str) -> None:
+        """
+        Args:
+            uri (str): スナップショットのプレフィックス（s3://）またはローカルのディレクトリ
+        """
+        self.uri = uri
+
+    def read(self, start_date: str, end_date: str, columns: Union[List[str], None] = None) -> pd.DataFrame:
+        partitioning = ds.partitioning(pa.schema([(SNAPSHOT_PARTITION_COLUMN, pa.string())]), flavor="hive")
+        dataset = unified_dataset(self.uri, partitioning=partitioning)
+        columns = _project([name for name in dataset.schema.names if name != SNAPSHOT_PARTITION_COLUMN], columns)
+        # 年月のパーティションで対象外のファイルを読み飛ばしてから、dateで絞り込む
+        month = ds.field(SNAPSHOT_PARTITION_COLUMN)
+        date = ds.field("date")
+        table = dataset.to_table(
+            columns=columns,
+            filter=(month >= start_date[:7]) & (month <= end_date[:7]) & (date >= start_date) & (date <= end_date),
+            use_threads=True,
+        )
+        table = table.sort_by(RECORD_ID_COLUMN)
+        logger.info(f"Read {table.num_rows} records from snapshot {self.uri}")
+        return table.to_pandas()
+
+
+# バックエンド名と読み込みクラスの対応
+READERS: Dict[str, Type[OfflineStoreReader]] = {
+    "athena": AthenaReader,
+    "parquet": ParquetReader,
+    "snapshot": SnapshotReader,
+}
+
+
+def make_reader(backend: str, **kwargs: Union[str, List[str]]) -> OfflineStoreReader:
+    """バックエンド名から読み込みクラスのインスタンスを作成する
+
+    Args:
+        backend: バックエンド名（READERSのキー）
+        **kwargs: 読み込みクラスのコンストラクタの引数
+
+    Returns:
+        OfflineStoreReader: 読み込みクラスのインスタンス
+
+    Raises:
+        ValueError: 未知のバックエンド名の場合
+    """
+    if backend not in READERS:
+        msg = f"Unknown offline store backend: {backend} (choose from {list(READERS)})"
+        raise ValueError(msg)
+    return READERS[backend](**kwargs)
@@ -0,0 +1,77 @@
+from typing import List, Union
+
+import lightgbm as lgb
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class ParquetSequence(lgb.Sequence):
+    """Parquetファイルの特徴量を、一定行数のバッチごとにfloat32で読み込んでLightGBMに渡すクラス
+    LightGBMはDatasetの作成時に行を昇順にしか読まない（サンプリングとビンへの割り当ての2回）ため、
+    ファイルを先頭から順にバッチで読み、メモリには直近の1バッチだけを持つ（前の行が必要になった場合は先頭から読み直す）
+    """
+
+    def __init__(self, path: str, columns: List[str], batch_size: int = 4096) -> None:
+        """
+        Args:
+            path (str): Parquetファイルのパス
+            columns (List[str]): 特徴量の列（この順に並べる）
+            batch_size (int): 1回に読み込む行数
+        """
+        self.path = path
+        self.columns = columns
+        self.batch_size = batch_size
+        # 先読みのバッファを無効にする（有効な場合は読み込んだ列のデータがファイル全体分メモリに残る）
+        self.parquet_file = pq.ParquetFile(path, pre_buffer=False)
+        self.num_rows = self.parquet_file.metadata.num_rows
+        self._restart()
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @property
+    def shape(self) -> tuple:
+        return (self.num_rows, len(self.columns))
+
+    def _restart(self) -> None:
+        """先頭から読み直す"""
+        self._batches = self.parquet_file.iter_batches(batch_size=self.batch_size, columns=self.columns)
+        self._start = 0
+        self._batch = np.empty((0, len(self.columns)), dtype=np.float32)
+
+    def _to_array(self, batch: pa.RecordBatch) -> np.ndarray:
+        """バッチを行優先のfloat32の2次元配列に変換する（欠損値はNaN）"""
+        array = np.empty((batch.num_rows, len(self.columns)), dtype=np.float32)
+        for i, name in enumerate(self.columns):
+            array[:, i] = batch.column(name).to_numpy(zero_copy_only=False)
+        return array
+
+    def _seek(self, index: int) -> None:
+        """index行目を含むバッチを読み込む"""
+        if index < self._start:
+            self._restart()
+        while index >= self._start + len(self._batch):
+            self._start += len(self._batch)
+            self._batch = self._to_array(next(self._batches))
+            # 変換後のArrowのバッファはpyarrowのメモリプールに残り続けるため、バッチごとに解放する
+            pa.default_memory_pool().release_unused()
+
+    def __getitem__(self, idx: Union[int, slice]) -> np.ndarray:
+        if isinstance(idx, slice):
+            start, stop, _ = idx.indices(self.num_rows)
+            parts = []
+            while start < stop:
+                self._seek(start)
+                offset = start - self._start
+                rows = self._batch[offset : offset + stop - start]
+                parts.append(rows)
+                start += len(rows)
+            if not parts:
+                return np.empty((0, len(self.columns)), dtype=np.float32)
+            return parts[0] if len(parts) == 1 else np.concatenate(parts)
+        if idx < 0:
+            idx += self.num_rows
+        self._seek(idx)
+        # 1行ずつの読み込みはビンの境界を求めるためのサンプリングで使われ、LightGBMはfloat64を要求する
+        return self._batch[idx - self._start].astype(np.float64)
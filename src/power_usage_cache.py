@@ -0,0 +1,214 @@
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Union
+
+import pandas as pd
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+MANIFEST_FILENAME = "manifest.json"
+# キャッシュに保存する列（日付はYYYYMMDD形式の文字列、intradayは5分間隔値のリスト）
+CACHE_COLUMNS = ["date", "max_power", "intraday"]
+# キャッシュの形式のバージョン（CACHE_COLUMNSを変えた場合は上げる。バージョンが異なるエントリはキャッシュミスとする）
+# 1: date, max_power / 2: intradayを追加
+CACHE_SCHEMA_VERSION = 2
+
+
+def file_sha256(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """ファイル内容のSHA-256ハッシュを計算する
+
+    Args:
+        path: ファイルのパス
+        chunk_size: 一度に読み込むバイト数
+
+    Returns:
+        str: 16進数のハッシュ値
+    """
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PowerUsageCache:
+    """パース済みの電力使用量データをZIPファイルごとにParquetで保存するキャッシュ
+    キーはZIPファイルの内容のハッシュ（またはサイズと更新日時）で、内容が変わらない過去のファイルは再パースしない
+    合計サイズがmax_bytesを超えた場合は、最後に使用された日時が古いものから削除する（LRU）
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, key_mode: str = "hash") -> None:
+        """
+        Args:
+            cache_dir (str): キャッシュの保存先ディレクトリ
+            max_bytes (int): キャッシュの合計サイズの上限（バイト）
+            key_mode (str): キーの作り方（"hash": 内容のハッシュ, "stat": サイズと更新日時）
+        """
+        if key_mode not in {"hash", "stat"}:
+            msg = f"Unsupported key mode: {key_mode}"
+            raise ValueError(msg)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.key_mode = key_mode
+        self.manifest_path = self.cache_dir / MANIFEST_FILENAME
+        self.manifest: Dict[str, Dict] = {}
+        if self.manifest_path.exists():
+            self.manifest = json.loads(self.manifest_path.read_text())
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, zip_path: Union[str, Path]) -> str:
+        """ZIPファイルのキャッシュキーを作成する
+
+        Args:
+            zip_path: ZIPファイルのパス
+
+        Returns:
+            str: キャッシュキー
+        """
+        if self.key_mode == "stat":
+            stat = Path(zip_path).stat()
+            return f"{Path(zip_path).name}-{stat.st_size}-{stat.st_mtime_ns}"
+        return file_sha256(zip_path)
+
+    def get(self, key: str) -> Union[List[Dict], None]:
+        """キャッシュからパース済みのデータを取得する
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            Union[List[Dict], None]: 日付・最大電力・5分間隔値の辞書のリスト（キャッシュにない場合、
+                または形式が古い場合はNone）
+        """
+        entry = self.manifest.get(key)
+        if entry is None or not (self.cache_dir / entry["file"]).exists():
+            self.misses += 1
+            return None
+        if entry.get("schema_version") != CACHE_SCHEMA_VERSION:
+            # 列を追加する前に保存したエントリは読み込まず、パースし直して上書きする
+            logger.info(f"Stale power usage cache entry {key} (schema version {entry.get('schema_version')})")
+            self.misses += 1
+            return None
+        try:
+            df = pd.read_parquet(self.cache_dir / entry["file"], columns=CACHE_COLUMNS)
+        except (ValueError, KeyError) as e:
+            logger.info(f"Unreadable power usage cache entry {key}: {e}")
+            self.misses += 1
+            return None
+        entry["last_access"] = time.time()
+        self.hits += 1
+        return df.to_dict("records")
+
+    def put(self, key: str, records: List[Dict], source: str = "") -> None:
+        """パース済みのデータをキャッシュに保存する
+
+        Args:
+            key: キャッシュキー
+            records: 日付・最大電力・5分間隔値の辞書のリスト
+            source: 元のZIPファイル名（確認用）
+        """
+        filename = f"{key}.parquet"
+        pd.DataFrame(records, columns=CACHE_COLUMNS).to_parquet(self.cache_dir / filename, index=False)
+        self.manifest[key] = {
+            "file": filename,
+            "schema_version": CACHE_SCHEMA_VERSION,
+            "source": source,
+            "rows": len(records),
+            "bytes": (self.cache_dir / filename).stat().st_size,
+            "sha256": file_sha256(self.cache_dir / filename),
+            "last_access": time.time(),
+        }
+        self.evict()
+
+    def total_bytes(self) -> int:
+        """キャッシュの合計サイズ（バイト）を返す"""
+        return sum(entry["bytes"] for entry in self.manifest.values())
+
+    def evict(self) -> List[str]:
+        """合計サイズが上限を超えている間、最後に使用された日時が古いエントリから削除する
+
+        Returns:
+            List[str]: 削除したキャッシュキーのリスト
+        """
+        evicted = []
+        for key, entry in sorted(self.manifest.items(), key=lambda item: item[1]["last_access"]):
+            if self.total_bytes() <= self.max_bytes:
+                break
+            (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+            del self.manifest[key]
+            evicted.append(key)
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} power usage cache entries")
+        return evicted
+
+    def flush(self) -> None:
+        """マニフェストを保存する"""
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.manifest, ensure_ascii=False, indent=2))
+        tmp_path.replace(self.manifest_path)
+
+    def verify(self) -> List[str]:
+        """キャッシュの整合性を確認する
+        マニフェストのファイルが存在し、ハッシュ・行数・列が一致するか、マニフェストにないファイルがないかを確認する
+
+        Returns:
+            List[str]: 見つかった問題のリスト（問題がなければ空）
+        """
+        problems = []
+        for key, entry in self.manifest.items():
+            path = self.cache_dir / entry["file"]
+            if not path.exists():
+                problems.append(f"{key}: missing file {entry['file']}")
+                continue
+            if file_sha256(path) != entry["sha256"]:
+                problems.append(f"{key}: checksum mismatch for {entry['file']}")
+                continue
+            try:
+                df = pd.read_parquet(path)
+            except Exception as e:
+                problems.append(f"{key}: unreadable file {entry['file']} ({e})")
+                continue
+            # 形式が古いエントリは読み込み時にキャッシュミスとなり上書きされるため、列は確認しない
+            current = entry.get("schema_version") == CACHE_SCHEMA_VERSION
+            if (current and list(df.columns) != CACHE_COLUMNS) or len(df) != entry["rows"]:
+                problems.append(f"{key}: unexpected contents in {entry['file']}")
+
+        known = {entry["file"] for entry in self.manifest.values()}
+        problems += [f"orphan file {path.name}" for path in self.cache_dir.glob("*.parquet") if path.name not in known]
+        return problems
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    キャッシュ管理コマンドの引数をパースする
+
+    Returns:
+        argparse.Namespace: パースされた引数
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["verify", "stats"])
+    parser.add_argument("--cache-dir", type=str, required=True)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = PowerUsageCache(args.cache_dir)
+
+    if args.command == "stats":
+        logger.info(f"entries={len(cache.manifest)} bytes={cache.total_bytes()}")
+    else:
+        problems = cache.verify()
+        for problem in problems:
+            logger.info(problem)
+        logger.info(f"Verified {len(cache.manifest)} entries, {len(problems)} problems found")
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,140 @@
+"""
+東京電力パワーグリッド「でんき予報」の日別CSV（Shift-JIS）を読み込むパーサー
+ファイル全体をpandasでパースせず、5分間隔値のブロックだけをデコードしてNumPy配列に変換する
+
+DataLoader（SageMaker Processing）とEMRのETL（dags/etl_data.py）の両方から使用する
+ETLでは最大電力に加えて、5分間隔値から負荷形状の集計値（load_shape_aggregates）を計算して出力する
+EMRでは spark-submit の --py-files でこのファイルを渡す
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+# 5分間隔値のブロックのヘッダーに含まれる列名
+POWER_USAGE_COLUMN = "当日実績(５分間隔値)(万kW)"
+# 1日あたりの5分間隔値の数
+SLOTS_PER_DAY = 288
+
+_COLUMN_MARKER = POWER_USAGE_COLUMN.encode("shift-jis")
+
+
+class PowerUsageParseError(ValueError):
+    """電力使用量CSVの形式が想定と異なる場合のエラー"""
+
+
+def parse_intraday(content: bytes) -> np.ndarray:
+    """電力使用量CSVから5分間隔の実績値を読み込む
+
+    Args:
+        content: CSVファイルの内容（Shift-JISのバイト列）
+
+    Returns:
+        np.ndarray: 5分間隔の実績値（float32, 長さ288、未計測の時間帯は欠損値）
+
+    Raises:
+        PowerUsageParseError: 5分間隔値のブロックが見つからない、または値を読み込めない場合
+    """
+    marker_pos = content.find(_COLUMN_MARKER)
+    if marker_pos < 0:
+        msg = f"Column not found: {POWER_USAGE_COLUMN}"
+        raise PowerUsageParseError(msg)
+
+    # ヘッダー行から対象列の位置を求める
+    header_start = content.rfind(b"\n", 0, marker_pos) + 1
+    header_end = content.find(b"\n", marker_pos)
+    if header_end < 0:
+        header_end = len(content)
+    header = content[header_start:header_end].rstrip(b"\r").split(b",")
+    column = next((i for i, name in enumerate(header) if name.strip() == _COLUMN_MARKER), None)
+    if column is None:
+        msg = f"Malformed header: {header}"
+        raise PowerUsageParseError(msg)
+
+    # ヘッダーの直後から最大288行だけを切り出す（以降のブロックは読まない）
+    lines = content[header_end + 1 :].split(b"\n", SLOTS_PER_DAY)[:SLOTS_PER_DAY]
+    values = np.full(SLOTS_PER_DAY, np.nan, dtype=np.float32)
+    for i, line in enumerate(lines):
+        fields: List[bytes] = line.rstrip(b"\r").split(b",")
+        # 空行や別ブロックのヘッダーでブロックの終わりとみなす
+        if len(fields) <= column or not fields[0][:1].isdigit():
+            break
+        value = fields[column].strip()
+        if value:
+            try:
+                values[i] = float(value)
+            except ValueError as e:
+                msg = f"Invalid value at row {i}: {value!r}"
+                raise PowerUsageParseError(msg) from e
+
+    if np.isnan(values).all():
+        msg = "No 5-minute values found"
+        raise PowerUsageParseError(msg)
+    return values
+
+
+def parse_daily_max(content: bytes) -> float:
+    """電力使用量CSVから当日の最大電力（5分間隔値の最大値）を読み込む
+
+    Args:
+        content: CSVファイルの内容（Shift-JISのバイト列）
+
+    Returns:
+        float: 最大電力（万kW）
+
+    Raises:
+        PowerUsageParseError: 5分間隔値を読み込めない場合
+    """
+    return float(np.nanmax(parse_intraday(content)))
+
+
+# 日中の負荷形状の集計値の列名（max_powerに加えてETLの出力に含める）
+LOAD_SHAPE_COLUMNS = [
+    "power_mean",
+    "power_min",
+    "load_factor",
+    "peak_slot",
+    "morning_ramp",
+    "evening_ramp",
+    "power_p10",
+    "power_p50",
+    "power_p90",
+]
+_SLOTS_PER_HOUR = SLOTS_PER_DAY // 24
+
+
+def _hour_mean(values: np.ndarray, hour: int) -> np.ndarray:
+    """各日の指定した時間帯（1時間）の平均値を返す"""
+    return np.nanmean(values[:, hour * _SLOTS_PER_HOUR : (hour + 1) * _SLOTS_PER_HOUR], axis=1)
+
+
+def load_shape_aggregates(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """5分間隔値から日ごとの負荷形状の集計値をまとめて計算する（全日を一度にベクトル化して計算する）
+
+    - load_factor: 平均電力 / 最大電力
+    - peak_slot: 最大電力となった5分間隔の時間帯（0〜287）
+    - morning_ramp: 8時台の平均 - 5時台の平均
+    - evening_ramp: 18時台の平均 - 15時台の平均
+    - power_p10 / power_p50 / power_p90: 日中の値のパーセンタイル
+
+    Args:
+        values: 5分間隔値の配列（shape: 日数 × 288、各日に1つ以上の値があること）
+
+    Returns:
+        Dict[str, np.ndarray]: LOAD_SHAPE_COLUMNSの列名と、日ごとの値の配列の辞書
+    """
+    values = np.asarray(values, dtype=np.float64)
+    power_mean = np.nanmean(values, axis=1)
+    power_max = np.nanmax(values, axis=1)
+    p10, p50, p90 = np.nanpercentile(values, [10, 50, 90], axis=1)
+    return {
+        "power_mean": power_mean,
+        "power_min": np.nanmin(values, axis=1),
+        "load_factor": power_mean / power_max,
+        "peak_slot": np.nanargmax(values, axis=1),
+        "morning_ramp": _hour_mean(values, 8) - _hour_mean(values, 5),
+        "evening_ramp": _hour_mean(values, 18) - _hour_mean(values, 15),
+        "power_p10": p10,
+        "power_p50": p50,
+        "power_p90": p90,
+    }
@@ -3,7 +3,7 @@ import sys
 
 # 必要なパッケージをその場でインストール
 subprocess.run(
-    [sys.executable, "-m", "pip", "install", "--quiet", "holidays", "omegaconf", "category-encoders"],
+    [sys.executable, "-m", "pip", "install", "--quiet", "holidays", "omegaconf", "category-encoders", "pyarrow"],
     check=True,
 )
 sys.path.append("/opt/ml/processing/deps")
@@ -12,16 +12,28 @@ import logging
 import os
 from io import StringIO
 from pathlib import Path
+from typing import List, Union
 
 import holidays
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from omegaconf import DictConfig, OmegaConf
 
+from feature_dtypes import COMPACT_DTYPES, compact_dtypes
+from feature_registry import FeatureRegistry
+from window_state import WINDOW_AGGREGATIONS, WindowState, compute_window_features, verify_incremental
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+# EMRの出力から特徴量の作成に使用する列（負荷形状の集計値などの追加列は読み込まない）
+EMR_COLUMNS = ["max_temp", "min_temp", "weather", "max_power"]
+# Feature Storeに登録するエリア列の名前（configのarea_columnの列をこの名前で登録する）
+AREA_COL = "area"
+
 
 def parse_args() -> argparse.Namespace:
     """
@@ -37,36 +49,82 @@ def parse_args() -> argparse.Namespace:
         type=str,
         default=os.environ.get("SM_CHANNEL_INPUT", "/opt/ml/processing/input_data/"),
     )
+    parser.add_argument(
+        "--window-state-uri",
+        type=str,
+        default=os.environ.get("SM_WINDOW_STATE_URI", ""),
+        help="ラグ・移動窓特徴量のstateの読み込み元（ローカルのディレクトリまたはs3://。更新はingestステップで行う）",
+    )
+    parser.add_argument("--full-recompute", action="store_true", help="stateを使わずに全履歴から特徴量を再計算する")
+    parser.add_argument(
+        "--verify-window-state",
+        action="store_true",
+        help="インクリメンタルに計算した特徴量を全履歴からの再計算結果と比較する",
+    )
 
     return parser.parse_args()
 
 
-def load_emr_output(input_path: str) -> pd.DataFrame:
+def load_emr_output(
+    input_path: str,
+    start_date: Union[str, None] = None,
+    end_date: Union[str, None] = None,
+    columns: Union[List[str], None] = None,
+) -> pd.DataFrame:
     """EMRの出力ファイルを読み込む
     mwaaでの前処理後は以下のような形式で保存されている
     dt=2022-04-01/part-00000-xxxx.snappy.parquet
     dt=2022-04-02/part-00000-xxxx.snappy.parquet
     ⋮
 
+    dt=パーティションをdate型の列として認識し、start_date/end_dateの範囲外のパーティションは読み込まない
+    ファイル単位の逐次読み込みではなく、データセットとしてマルチスレッドでまとめてデコードする
+
     Args:
-        s3_dir: EMRの出力ファイルのパス
+        input_path: EMRの出力ファイルのパス
+        start_date: 読み込む期間の開始日（YYYY-MM-DD形式、省略時は制限なし）
+        end_date: 読み込む期間の終了日（YYYY-MM-DD形式、省略時は制限なし）
+        columns: 読み込むカラム（省略時は全カラム）
 
     Returns:
         pd.DataFrame: 読み込んだデータフレーム
     """
-    file_paths = list(Path(input_path).rglob("*.parquet"))
-    if not file_paths:
+    dataset = ds.dataset(
+        input_path,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("dt", pa.date32())]), flavor="hive"),
+        exclude_invalid_files=True,
+    )
+    if not dataset.files:
         msg = f"No parquet files found under {input_path}"
         raise ValueError(msg)
 
-    dfs = [pd.read_parquet(path) for path in file_paths]
-    logger.info(f"Loaded {len(dfs)} files from {input_path}")
-    return_df = pd.concat(dfs, ignore_index=True)
-    # dt列が追加されるので削除
-    if "dt" in return_df.columns:
-        return_df = return_df.drop(columns=["dt"])
+    # dt=パーティションがあればdate列はdtから復元し、ファイルからは読み込まない
+    has_partition = "dt" in dataset.schema.names
+    date_field = ds.field("dt") if has_partition else ds.field("date")
+    read_columns = ["dt" if has_partition else "date"]
+    read_columns += [c for c in (columns or dataset.schema.names) if c not in {"dt", "date"}]
+
+    # 対象期間外のパーティションを除外する
+    filters = []
+    if start_date:
+        filters.append(date_field >= pa.scalar(pd.Timestamp(start_date).date(), type=pa.date32()))
+    if end_date:
+        filters.append(date_field <= pa.scalar(pd.Timestamp(end_date).date(), type=pa.date32()))
+    filter_expr = None
+    for expr in filters:
+        filter_expr = expr if filter_expr is None else filter_expr & expr
+
+    table = dataset.to_table(columns=read_columns, filter=filter_expr, use_threads=True)
+    logger.info(f"Loaded {table.num_rows} rows from {len(dataset.files)} files under {input_path}")
+    if has_partition:
+        table = table.rename_columns([("date" if c == "dt" else c) for c in table.column_names])
+
+    # 変換後のテーブルを解放しながらpandasへ変換し、余分なコピーを作らない
+    return_df = table.to_pandas(self_destruct=True, split_blocks=True, date_as_object=False)
+    del table
     # 日付をdatetime型に変換
-    return_df["date"] = pd.to_datetime(return_df["date"], format="%Y-%m-%d")
+    return_df["date"] = pd.to_datetime(return_df["date"], format="%Y-%m-%d").astype("datetime64[ns]")
     buffer = StringIO()
     return_df.info(buf=buffer)
     logger.info(f"DataFrame info: {buffer.getvalue()}")
@@ -75,6 +133,12 @@ def load_emr_output(input_path: str) -> pd.DataFrame:
     return return_df
 
 
+# 特徴量のグループ（FeatureEngineeringの各メソッドで計算する特徴量）
+WEATHER_FEATURES = ["weather_category"]
+NUMERIC_FEATURES = ["avg", "rng", "cdd", "hdd", "hot", "cold"]
+CALENDAR_FEATURES = ["year", "month", "day", "dow", "dow_sin", "dow_cos", "mon_sin", "mon_cos", "weekend", "holiday"]
+
+
 def load_config(config_path: str) -> DictConfig:
     """設定ファイルを読み込む
 
@@ -91,10 +155,12 @@ def load_config(config_path: str) -> DictConfig:
 class FeatureEngineering:
     """特徴量エンジニアリングを行うクラス"""
 
-    def __init__(self, config: DictConfig = None) -> None:
+    def __init__(self, config: DictConfig = None, lean: Union[bool, None] = None) -> None:
         """
         Args:
             config (DictConfig): 設定情報（省略可能）
+            lean (bool): 省メモリモードにするか（省略時はconfigのlean_featuresに従う）
+                Trueの場合、入力データフレームをコピーせずに列を追加し、コンパクトな型で特徴量を保持する
         """
         self.config = config
         self.jp_holidays = holidays.Japan()  # type: ignore[attr-defined]
@@ -103,6 +169,77 @@ class FeatureEngineering:
         self.cold_day_threshold = thresholds.get("cold_day")
         self.cdd_base = thresholds.get("cdd_base")
         self.hdd_base = thresholds.get("hdd_base")
+        self.lean = self.config.get("lean_features", False) if lean is None else lean
+
+    def _prepare(self, df: pd.DataFrame) -> pd.DataFrame:
+        """各ステップで特徴量を追加するデータフレームを返す（省メモリモードではコピーしない）"""
+        return df if self.lean else df.copy()
+
+    def _cast(self, series: pd.Series, name: str) -> pd.Series:
+        """省メモリモードの場合、特徴量をコンパクトな型に変換する"""
+        if not self.lean or name not in COMPACT_DTYPES:
+            return series
+        return series.astype(COMPACT_DTYPES[name], copy=False)
+
+    def _cast_inputs(self, df: pd.DataFrame) -> None:
+        """省メモリモードの場合、入力データの列（最高・最低気温など）をコンパクトな型に変換する"""
+        if not self.lean:
+            return
+        for col in df.columns:
+            if col in COMPACT_DTYPES and not (COMPACT_DTYPES[col].startswith("int") and df[col].isna().any()):
+                df[col] = df[col].astype(COMPACT_DTYPES[col], copy=False)
+
+    def build_registry(self, date_col: str = "date", weather_col: str = "weather") -> FeatureRegistry:
+        """特徴量の定義をレジストリに登録する
+        各特徴量は入力となる列とベクトル化された計算関数を宣言し、必要な特徴量だけが依存関係を辿って計算される
+
+        Args:
+            date_col: 日付列の名前
+            weather_col: 天気列の名前
+
+        Returns:
+            FeatureRegistry: 特徴量の定義を登録したレジストリ
+        """
+        registry = FeatureRegistry()
+
+        # 天気カテゴリ
+        registry.register("weather_category", [weather_col], lambda df: self._categorize(df[weather_col]))
+
+        # 平均気温
+        registry.register("avg", ["max_temp", "min_temp"], lambda df: (df["max_temp"] + df["min_temp"]) / 2)
+        # 気温の日較差（最高気温と最低気温の差）
+        registry.register("rng", ["max_temp", "min_temp"], lambda df: df["max_temp"] - df["min_temp"])
+        # 冷房度日：平均気温がcdd_baseを超えた分だけ冷房が必要と考える指標
+        registry.register("cdd", ["avg"], lambda df: (df["avg"] - self.cdd_base).clip(lower=0))
+        # 暖房度日：平均気温がhdd_base未満の場合、暖房が必要と考える指標
+        registry.register("hdd", ["avg"], lambda df: (self.hdd_base - df["avg"]).clip(lower=0))
+        # 猛暑日フラグ（最高気温がhot_day_threshold以上か）
+        registry.register("hot", ["max_temp"], lambda df: (df["max_temp"] >= self.hot_day_threshold).astype(int))
+        # 冬日フラグ（最低気温がcold_day_threshold以下か）
+        registry.register("cold", ["min_temp"], lambda df: (df["min_temp"] <= self.cold_day_threshold).astype(int))
+
+        # 年、月、日
+        registry.register("year", [date_col], lambda df: df[date_col].dt.year)
+        registry.register("month", [date_col], lambda df: df[date_col].dt.month)
+        registry.register("day", [date_col], lambda df: df[date_col].dt.day)
+        # 曜日 (0-6: 月-日)
+        registry.register("dow", [date_col], lambda df: df[date_col].dt.weekday)
+        # 曜日の周期性をsin-cos変換で表現
+        registry.register("dow_sin", ["dow"], lambda df: np.sin(2 * np.pi * df["dow"] / 7))
+        registry.register("dow_cos", ["dow"], lambda df: np.cos(2 * np.pi * df["dow"] / 7))
+        # 月の周期性をsin-cos変換で表現
+        registry.register("mon_sin", ["month"], lambda df: np.sin(2 * np.pi * df["month"] / 12))
+        registry.register("mon_cos", ["month"], lambda df: np.cos(2 * np.pi * df["month"] / 12))
+        # 週末フラグ（土日か）
+        registry.register("weekend", ["dow"], lambda df: (df["dow"] >= 5).astype(int))
+        # 祝日フラグ
+        registry.register(
+            "holiday",
+            [date_col],
+            lambda df: df[date_col].apply(lambda x: int(x in self.jp_holidays)),
+        )
+
+        return registry
 
     def categorize_weather(self, weather_df: pd.DataFrame, weather_col: str = "weather") -> pd.DataFrame:
         """天気の文字列を基本的なカテゴリに分類する
@@ -114,15 +251,28 @@ class FeatureEngineering:
         Returns:
             pd.DataFrame: weather_category列が追加されたデータフレーム
         """
-        df = weather_df.copy()
-
-        df["weather_category"] = df[weather_col].apply(self._weather_check)
+        df = self._prepare(weather_df)
+        self.build_registry(weather_col=weather_col).compute(df, WEATHER_FEATURES, cast=self._cast)
 
         # 元の天気列は不要なので削除
-        df = df.drop(columns=[weather_col])
+        del df[weather_col]
 
         return df
 
+    def _categorize(self, weather: pd.Series) -> pd.Series:
+        """天気の列をカテゴリに分類する
+        天気の文字列は種類が少ないため、ユニークな値ごとに分類してから各行に展開する
+
+        Args:
+            weather: 天気の列
+
+        Returns:
+            pd.Series: 分類された天気カテゴリの列
+        """
+        codes, uniques = pd.factorize(weather)
+        categories = np.array([*(self._weather_check(w) for w in uniques), self._weather_check(np.nan)], dtype=object)
+        return pd.Series(categories[codes], index=weather.index)
+
     def _weather_check(self, weather: str) -> str:
         """天気の文字列を基本的なカテゴリに分類する関数
 
@@ -186,27 +336,9 @@ class FeatureEngineering:
         Returns:
             pd.DataFrame: 特徴量を追加したデータフレーム
         """
-        result_df = df.copy()
-
-        # 平均気温
-        result_df["avg"] = (df["max_temp"] + df["min_temp"]) / 2
-
-        # 気温の日較差（最高気温と最低気温の差）
-        result_df["rng"] = df["max_temp"] - df["min_temp"]
-
-        # 冷房度日：平均気温がcdd_baseを超えた分だけ冷房が必要と考える指標
-        result_df["cdd"] = (result_df["avg"] - self.cdd_base).clip(lower=0)
-
-        # 暖房度日：平均気温がhdd_base未満の場合、暖房が必要と考える指標
-        result_df["hdd"] = (self.hdd_base - result_df["avg"]).clip(lower=0)
-
-        # 猛暑日フラグ（最高気温がhot_day_threshold以上か）
-        result_df["hot"] = (df["max_temp"] >= self.hot_day_threshold).astype(int)
-
-        # 冬日フラグ（最低気温がcold_day_threshold以下か）
-        result_df["cold"] = (df["min_temp"] <= self.cold_day_threshold).astype(int)
-
-        return result_df
+        result_df = self._prepare(df)
+        self._cast_inputs(result_df)
+        return self.build_registry().compute(result_df, NUMERIC_FEATURES, cast=self._cast)
 
     def create_calendar_features(self, df: pd.DataFrame, date_col: str = "date") -> pd.DataFrame:
         """カレンダー系特徴量を作成する
@@ -218,36 +350,14 @@ class FeatureEngineering:
         Returns:
             pd.DataFrame: カレンダー特徴量を追加したデータフレーム
         """
-        result_df = df.copy()
-
-        # 年、月、日
-        result_df["year"] = df[date_col].dt.year
-        result_df["month"] = df[date_col].dt.month
-        result_df["day"] = df[date_col].dt.day
-
-        # 曜日 (0-6: 月-日)
-        result_df["dow"] = df[date_col].dt.weekday
-
-        # 曜日の周期性をsin-cos変換で表現
-        result_df["dow_sin"] = np.sin(2 * np.pi * result_df["dow"] / 7)
-        result_df["dow_cos"] = np.cos(2 * np.pi * result_df["dow"] / 7)
-
-        # 月の周期性をsin-cos変換で表現
-        result_df["mon_sin"] = np.sin(2 * np.pi * result_df["month"] / 12)
-        result_df["mon_cos"] = np.cos(2 * np.pi * result_df["month"] / 12)
-
-        # 週末フラグ（土日か）
-        result_df["weekend"] = (result_df["dow"] >= 5).astype(int)
-
-        # 祝日フラグ
-        result_df["holiday"] = result_df[date_col].apply(lambda x: int(x in self.jp_holidays))
-
-        return result_df
+        result_df = self._prepare(df)
+        return self.build_registry(date_col=date_col).compute(result_df, CALENDAR_FEATURES, cast=self._cast)
 
     def make_features(
         self,
         df: pd.DataFrame,
         date_col: str = "date",
+        features: Union[List[str], None] = None,
     ) -> pd.DataFrame:
         """
         データフレーム全体に対して特徴量を作成する
@@ -255,21 +365,63 @@ class FeatureEngineering:
         Args:
             df (pd.DataFrame): 入力データフレーム
             date_col (str): 日付カラム名
+            features (List[str]): 必要な特徴量名（省略時は全特徴量）
+                指定した場合は、その特徴量と依存する特徴量だけを計算する
 
         Returns:
             pd.DataFrame: 特徴量を追加したデータフレーム
         """
-        # 天気カテゴリ変換
-        df = self.categorize_weather(df)
+        registry = self.build_registry(date_col=date_col)
+        if features is not None:
+            unknown = [name for name in features if name not in registry and name not in df.columns]
+            if unknown:
+                logger.warning(f"Skipping features not provided by the registry: {unknown}")
+            features = [name for name in features if name not in unknown]
 
-        # 数値系特徴量作成
-        df = self.create_numeric_features(df)
+        df = self._prepare(df)
+        self._cast_inputs(df)
+        registry.compute(df, features, cast=self._cast)
 
-        # カレンダー特徴量作成
-        df = self.create_calendar_features(df, date_col=date_col)
+        # 元の天気列は不要なので削除
+        if "weather" in df.columns:
+            del df["weather"]
         return df
 
 
+def make_base_features(
+    feature_engineering: FeatureEngineering,
+    input_path: str,
+    config: DictConfig,
+    start_date: Union[str, None] = None,
+) -> pd.DataFrame:
+    """EMRの出力を読み込み、ラグ・移動窓特徴量以外の特徴量を作成する
+
+    Args:
+        feature_engineering: 特徴量エンジニアリングのインスタンス
+        input_path: EMRの出力ファイルのパス
+        config: 設定情報
+        start_date: 読み込む期間の開始日（省略時はconfigのstart_date）
+
+    Returns:
+        pd.DataFrame: 特徴量を追加したデータフレーム
+    """
+    area_column = config.get("area_column")
+    data = load_emr_output(
+        input_path,
+        start_date=start_date or config.get("start_date"),
+        end_date=config.get("end_date"),
+        columns=EMR_COLUMNS if area_column is None else [*EMR_COLUMNS, area_column],
+    )
+    if area_column is not None:
+        # エリアごとのレコードを区別できるよう、エリア列を文字列としてFeature Storeまで引き継ぐ
+        data[AREA_COL] = data.pop(area_column).astype(str)
+    features = config.get("features")
+    if features is not None:
+        # ラグ・移動窓特徴量の計算に必要な特徴量は常に作成する
+        features = [*features, *(name for name in WINDOW_AGGREGATIONS if name not in features)]
+    return feature_engineering.make_features(data, features=features)
+
+
 if __name__ == "__main__":
     logger.info("Starting processing data...")
 
@@ -279,10 +431,44 @@ if __name__ == "__main__":
     base_dir = "/opt/ml/processing"
 
     config = load_config("/opt/ml/processing/deps/config.yaml")
-    data = load_emr_output(input_path)
     feature_engineering = FeatureEngineering(config=config)
+    # WindowStateは単一系列のstateのため、複数エリアのデータは常に全履歴からエリアごとに計算する
+    multi_area = config.get("area_column") is not None
+    if multi_area and args.window_state_uri:
+        logger.warning("area_column is set; window state is not used and window features are fully recomputed")
+    window_state = None
+    if args.window_state_uri and not args.full_recompute and not multi_area:
+        window_state = WindowState.load(args.window_state_uri)
+
     # データの前処理
-    processed_data = feature_engineering.make_features(data)
+    if multi_area:
+        processed_data = make_base_features(feature_engineering, input_path, config)
+        window_features = compute_window_features(processed_data, group_col=AREA_COL)
+    elif window_state is None:
+        # stateがない場合は全履歴から特徴量を作成し、stateを初期化する
+        processed_data = make_base_features(feature_engineering, input_path, config)
+        window_features = compute_window_features(processed_data)
+        window_state = WindowState.from_history(processed_data)
+    else:
+        # stateの最終日より後の日だけを読み込み、stateをインクリメンタルに更新する
+        start_date = (window_state.last_date + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        start_date = max(start_date, str(config.get("start_date") or start_date))
+        logger.info(f"Updating window state incrementally from {start_date}")
+        processed_data = make_base_features(feature_engineering, input_path, config, start_date=start_date)
+        window_features = window_state.update(processed_data)
+
+    if feature_engineering.lean:
+        window_features = compact_dtypes(window_features)
+    processed_data = pd.concat([processed_data, window_features], axis=1)
+
+    if args.verify_window_state and not multi_area:
+        history = make_base_features(feature_engineering, input_path, config)
+        verify_incremental(history, processed_data[["date", *window_features.columns]])
+    # 更新したstateはステップの出力として保存し、Feature Storeへの登録が成功した後にwindow_state_uriへ反映する
+    # （登録に失敗した場合に、登録されていない日を次回の実行で処理済みとみなさないようにする）
+    if window_state is not None:
+        window_state.save(f"{base_dir}/window_state")
+
     buffer = StringIO()
     processed_data.info(buf=buffer)
     logger.info(f"Processed data info: {buffer.getvalue()}")
@@ -0,0 +1,159 @@
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+from train import load_data, load_dates, train
+from warm_start import decide_training_mode, make_training_state, recent_rows, to_days
+
+logger = logging.getLogger()
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    引数をパースする
+
+    Returns:
+        argparse.Namespace: パースされた引数
+    """
+    parser = argparse.ArgumentParser(description="過去のデータで追加学習と全期間の学習し直しを比較する")
+    parser.add_argument("--train", type=str, required=True, help="train.parquetとfeatures.txtが入っているディレクトリ")
+    parser.add_argument("--output-path", type=str, default="replay_report.json")
+    parser.add_argument("--replay-days", type=int, default=182, help="再現する期間の日数（学習データの末尾）")
+    parser.add_argument("--step-days", type=int, default=7, help="再学習の間隔の日数")
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--learning_rate", type=float, default=0.5)
+    parser.add_argument("--random_state", type=int, default=10)
+    parser.add_argument("--max_depth", type=int, default=-1)
+    parser.add_argument("--warm_start_trees", type=int, default=20)
+    parser.add_argument("--warm_start_window_days", type=int, default=90)
+    parser.add_argument("--full_retrain_days", type=int, default=28)
+    parser.add_argument("--drift_threshold", type=float, default=1.5)
+    return parser.parse_args()
+
+
+def replay(
+    X: np.ndarray,
+    y: np.ndarray,
+    dates: np.ndarray,
+    hyperparameters: Dict[str, Any],
+    replay_days: int = 182,
+    step_days: int = 7,
+    warm_start_trees: int = 20,
+    warm_start_window_days: int = 90,
+    full_retrain_days: int = 28,
+    drift_threshold: float = 1.5,
+) -> Dict[str, Any]:
+    """過去のデータで日々の再学習を再現し、追加学習（warm）と毎回の全期間の学習（full）の精度と学習時間を比較する
+    step_days日ごとに、それまでのデータで両方の方法で学習し、次のstep_days日の予測誤差を求める
+    追加学習の方法はtrain.pyと同じく、定期的な学習し直しとドリフトの検出で全期間の学習に切り替える
+
+    Args:
+        X: 特徴量（日付順）
+        y: 目標値
+        dates: 各行の日付（昇順）
+        hyperparameters: 全期間で学習する場合のハイパーパラメータ
+        replay_days: 再現する期間の日数
+        step_days: 再学習の間隔の日数
+        warm_start_trees: 追加学習で増やす木の数
+        warm_start_window_days: 追加学習に使う末尾の日数
+        full_retrain_days: 全期間で学習し直す間隔の日数
+        drift_threshold: ドリフトとみなす予測誤差の比率
+
+    Returns:
+        Dict[str, Any]: ステップごとの結果と、方法ごとの平均RMSE・合計学習時間
+    """
+    days = to_days(dates)
+    cutoffs = np.arange(days[-1] - np.timedelta64(replay_days - 1, "D"), days[-1] + 1, step_days)
+    model, state = None, None
+    steps = []
+    for cutoff in cutoffs:
+        n_rows = int(np.searchsorted(days, cutoff))
+        test = slice(n_rows, int(np.searchsorted(days, cutoff + np.timedelta64(step_days, "D"))))
+
+        start = time.perf_counter()
+        full_model = train(X[:n_rows], y[:n_rows], hyperparameters)
+        full_seconds = time.perf_counter() - start
+
+        # 全期間で学習する場合は、上で学習したモデルと同じになるためそのまま使う
+        mode, reason, new_error = decide_training_mode(
+            model,
+            state,
+            None,
+            None,
+            X[:n_rows],
+            y[:n_rows],
+            dates[:n_rows],
+            full_retrain_days=full_retrain_days,
+            drift_threshold=drift_threshold,
+        )
+        if mode == "warm":
+            start = time.perf_counter()
+            rows = recent_rows(dates[:n_rows], warm_start_window_days)
+            model = train(X[rows], y[rows], {**model.get_params(), "n_estimators": warm_start_trees}, init_model=model)
+            seconds = time.perf_counter() - start
+        elif mode == "reuse":
+            seconds = 0.0
+        else:
+            model, seconds = full_model, full_seconds
+        state = make_training_state(mode, reason, model, dates[:n_rows], state, new_error, seconds)
+
+        steps.append(
+            {
+                "cutoff": str(cutoff),
+                "mode": mode,
+                "reason": reason,
+                "num_trees": state["num_trees"],
+                "incremental_seconds": seconds,
+                "full_seconds": full_seconds,
+                "incremental_rmse": float(np.sqrt(np.mean((model.predict(X[test]) - y[test]) ** 2))),
+                "full_rmse": float(np.sqrt(np.mean((full_model.predict(X[test]) - y[test]) ** 2))),
+            },
+        )
+        logger.info(f"Replay step {steps[-1]}")
+
+    return {
+        "steps": steps,
+        "warm_starts": sum(step["mode"] == "warm" for step in steps),
+        "incremental_rmse_mean": float(np.mean([step["incremental_rmse"] for step in steps])),
+        "full_rmse_mean": float(np.mean([step["full_rmse"] for step in steps])),
+        "incremental_seconds_total": float(sum(step["incremental_seconds"] for step in steps)),
+        "full_seconds_total": float(sum(step["full_seconds"] for step in steps)),
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    X, y = load_data(args.train)
+    dates = load_dates(args.train)
+    if dates is None:
+        msg = f"{args.train} has no date column (train.parquet is required for replay)"
+        raise ValueError(msg)
+    report = replay(
+        X,
+        y,
+        dates,
+        {
+            "n_estimators": args.n_estimators,
+            "learning_rate": args.learning_rate,
+            "random_state": args.random_state,
+            "max_depth": args.max_depth,
+        },
+        replay_days=args.replay_days,
+        step_days=args.step_days,
+        warm_start_trees=args.warm_start_trees,
+        warm_start_window_days=args.warm_start_window_days,
+        full_retrain_days=args.full_retrain_days,
+        drift_threshold=args.drift_threshold,
+    )
+    with Path(args.output_path).open("w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(
+        f"Incremental: RMSE {report['incremental_rmse_mean']:.2f}, {report['incremental_seconds_total']:.1f} s "
+        f"({report['warm_starts']} warm starts) / Full: RMSE {report['full_rmse_mean']:.2f}, "
+        f"{report['full_seconds_total']:.1f} s",
+    )
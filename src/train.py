@@ -1,19 +1,42 @@
 import argparse
+import json
 import logging
 import os
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Callable, Dict, List, Tuple, Union
 
 import joblib
+import lightgbm as lgb
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from lightgbm import LGBMRegressor
 
+from cv_splits import time_series_splits
+from dataset_cache import DatasetCache
+from feature_pruning import IMPORTANCE_METHODS, prune_features
+from hyperparameter_search import successive_halving
+from parquet_sequence import ParquetSequence
+from training_profile import TrainingProfiler, effective_num_threads
+from warm_start import (
+    TRAINING_STATE_FILENAME,
+    as_booster,
+    decide_training_mode,
+    load_init_model,
+    make_training_state,
+    recent_rows,
+)
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+# エリアごとのモデルの一覧（エリア名、モデルのパス、学習データの行数・期間など）
+AREA_MANIFEST_FILENAME = "area_manifest.json"
+
 
 def parse_args() -> argparse.Namespace:
     """
@@ -33,12 +56,82 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--random_state", type=int, default=10)
     parser.add_argument("--max_depth", type=int, default=-1)
 
+    # 時系列交差検証（cv_folds=0の場合は行わない）
+    parser.add_argument("--cv_folds", type=int, default=0)
+    parser.add_argument("--cv_horizon", type=int, default=None, help="1つのfoldの検証期間の日数")
+    parser.add_argument("--cv_gap", type=int, default=0, help="学習期間と検証期間の間に空ける日数")
+    parser.add_argument("--cv_window", type=int, default=None, help="学習期間の日数（省略時は拡張ウィンドウ）")
+
+    # ハイパーパラメータ探索（search_trials=0の場合は行わない）
+    parser.add_argument("--search_trials", type=int, default=0, help="最初に試すハイパーパラメータの組数")
+    parser.add_argument("--search_time_budget", type=float, default=600.0, help="探索にかける時間の上限（秒）")
+    parser.add_argument("--search_workers", type=int, default=None, help="探索のプロセス数（省略時はCPU数）")
+    parser.add_argument("--search_min_rounds", type=int, default=50)
+    parser.add_argument("--search_max_rounds", type=int, default=2000)
+    parser.add_argument("--search_eta", type=int, default=3)
+    parser.add_argument("--search_valid_days", type=int, default=None, help="検証データの日数（省略時は全日数の1/5）")
+
+    # 複数エリアの学習（global: エリアの特徴量を含む1つのモデル、per_area: エリアごとのモデル）
+    parser.add_argument("--area_mode", type=str, choices=["global", "per_area"], default="global")
+    parser.add_argument("--area_workers", type=int, default=None, help="エリアごとの学習のプロセス数（省略時はCPU数）")
+
+    # 重要度の低い特徴量の削減（空の場合は行わない）
+    parser.add_argument("--prune_method", type=str, choices=["", *IMPORTANCE_METHODS], default="")
+    parser.add_argument("--prune_tolerance", type=float, default=0.01, help="検証RMSEの悪化の許容割合")
+    parser.add_argument("--prune_valid_days", type=int, default=None, help="検証データの日数（省略時は全日数の1/5）")
+
+    # ビン分割済みのDatasetのキャッシュ（空の場合は使わない。SageMakerではチェックポイントのディレクトリを指定する）
+    parser.add_argument("--dataset_cache_dir", type=str, default="", help="ビン分割済みのDatasetのキャッシュの保存先")
+
+    # 省メモリの学習（0より大きい場合はtrain.parquetをバッチごとにLightGBMに渡し、学習データ全体を読み込まない）
+    parser.add_argument("--memory_budget_mb", type=int, default=0, help="学習時のメモリ使用量の目安（MB）")
+
+    # 承認済みのモデルへの追加学習（init_model_uriが空の場合は全期間で学習する）
+    parser.add_argument("--init_model_uri", type=str, default="", help="承認済みのモデルのmodel.tar.gzのURI")
+    parser.add_argument("--warm_start_trees", type=int, default=20, help="追加学習で増やす木の数")
+    parser.add_argument("--warm_start_window_days", type=int, default=90, help="追加学習に使う末尾の日数")
+    parser.add_argument("--full_retrain_days", type=int, default=28, help="全期間で学習し直す間隔の日数")
+    parser.add_argument("--drift_threshold", type=float, default=1.5, help="ドリフトとみなす予測誤差の比率")
+
     return parser.parse_args()
 
 
+def load_feature_names(file_path: str) -> List[str]:
+    """dataprepが保存した特徴量名（先頭は目的変数）を読み込む
+
+    Args:
+        file_path (str): features.txtが入っているディレクトリ
+
+    Returns:
+        List[str]: 特徴量名のリスト
+    """
+    with Path(os.path.join(file_path, "features.txt")).open() as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def select_features(
+    X: np.ndarray,
+    feature_names: List[str],
+    selected: Union[List[str], None],
+) -> Union[np.ndarray, None]:
+    """学習データから、指定した特徴量の列だけを取り出す（特徴量を削減したモデルに追加学習する場合に使う）
+
+    Args:
+        X (np.ndarray): 特徴量
+        feature_names (List[str]): 学習データの特徴量名（先頭は目的変数）
+        selected (Union[List[str], None]): 取り出す特徴量名（先頭は目的変数）
+
+    Returns:
+        Union[np.ndarray, None]: 取り出した特徴量（学習データにない特徴量がある場合はNone）
+    """
+    if not selected or selected[0] != feature_names[0] or not set(selected) <= set(feature_names):
+        return None
+    return X[:, [feature_names.index(name) - 1 for name in selected[1:]]]
+
+
 def load_data(file_path: str) -> Tuple[np.ndarray, np.ndarray]:
     """
-    CSVファイルから学習データを読み込む
+    Parquetファイルから学習データを読み込む
 
     Args:
         file_path (str): データファイルのパス
@@ -48,31 +141,104 @@ def load_data(file_path: str) -> Tuple[np.ndarray, np.ndarray]:
     """
     logger.info(f"Loading data from {file_path}")
 
-    # ヘッダーなしCSVを読み込む（preprocess.pyの出力形式に合わせる）
-    data = pd.read_csv(os.path.join(file_path, "train.csv"), header=None)
+    parquet_path = os.path.join(file_path, "train.parquet")
+    if Path(parquet_path).exists():
+        # features.txtの列（目的変数と特徴量）だけをメモリマップで読み込む
+        data = pd.read_parquet(parquet_path, columns=load_feature_names(file_path), memory_map=True)
+    else:
+        # 以前の形式（ヘッダーなしCSV）
+        data = pd.read_csv(os.path.join(file_path, "train.csv"), header=None)
 
     # 最初の列が目的変数
-    y = data.iloc[:, 0].values
-    X = data.iloc[:, 1:].values
+    y = data.iloc[:, 0].to_numpy()
+    X = data.iloc[:, 1:].to_numpy()
 
     logger.info(f"Data shape: X={X.shape}, y={y.shape}")
     return X, y
 
 
-def train(X: np.ndarray, y: np.ndarray, hyperparameters: Dict[str, Any]) -> LGBMRegressor:
+def load_streaming_data(file_path: str, memory_budget_mb: int) -> Tuple[ParquetSequence, np.ndarray]:
+    """train.parquetの特徴量をバッチごとに読み込むSequenceと、目標値を作成する
+    LightGBMのDatasetはビン分割後の値（1特徴量あたり1バイト程度）だけを持つため、メモリ使用量は元のデータの数分の一になる
+
+    Args:
+        file_path (str): train.parquetとfeatures.txtが入っているディレクトリ
+        memory_budget_mb (int): メモリ使用量の目安（MB）。その1/64を1バッチ（float32）の大きさにする
+
+    Returns:
+        Tuple[ParquetSequence, np.ndarray]: 特徴量のSequenceと目標値
+    """
+    parquet_path = os.path.join(file_path, "train.parquet")
+    names = load_feature_names(file_path)
+    y = pd.read_parquet(parquet_path, columns=names[:1])[names[0]].to_numpy()
+    batch_size = max(1024, memory_budget_mb * 2**20 // 64 // (4 * (len(names) - 1)))
+    X = ParquetSequence(parquet_path, names[1:], batch_size=batch_size)
+
+    # ビン分割後のDatasetの大きさの目安（1特徴量あたり1バイト）がメモリの目安を超える場合は警告する
+    binned_mb = X.shape[0] * X.shape[1] / 2**20
+    if binned_mb > memory_budget_mb:
+        logger.warning(f"Binned dataset (~{binned_mb:.0f} MB) may exceed the memory budget ({memory_budget_mb} MB)")
+    logger.info(f"Streaming data from {parquet_path}: X={X.shape}, batch_size={batch_size}")
+    return X, y
+
+
+def load_dates(file_path: str) -> Union[np.ndarray, None]:
+    """学習データの各行の日付を読み込む（日付の列がない以前の形式の場合はNone）
+
+    Args:
+        file_path (str): データファイルのパス
+
+    Returns:
+        Union[np.ndarray, None]: 各行の日付
+    """
+    parquet_path = os.path.join(file_path, "train.parquet")
+    if not Path(parquet_path).exists():
+        return None
+    return pd.read_parquet(parquet_path, columns=["date"], memory_map=True)["date"].to_numpy()
+
+
+def load_areas(file_path: str) -> Union[np.ndarray, None]:
+    """学習データの各行のエリアを読み込む（エリアの列がない1エリアのデータの場合はNone）
+
+    Args:
+        file_path (str): データファイルのパス
+
+    Returns:
+        Union[np.ndarray, None]: 各行のエリア
+    """
+    parquet_path = os.path.join(file_path, "train.parquet")
+    if not Path(parquet_path).exists() or "area" not in pq.read_schema(parquet_path).names:
+        return None
+    return pd.read_parquet(parquet_path, columns=["area"], memory_map=True)["area"].astype(str).to_numpy()
+
+
+def train(
+    X: np.ndarray,
+    y: np.ndarray,
+    hyperparameters: Dict[str, Any],
+    init_model: Union[LGBMRegressor, None] = None,
+    callbacks: Union[List[Callable], None] = None,
+) -> LGBMRegressor:
     """LightGBMモデルをトレーニングする
 
     Args:
         X (np.ndarray): 特徴量
         y (np.ndarray): 目標値
         hyperparameters (Dict[str, Any]): モデルのハイパーパラメータ
+        init_model (Union[LGBMRegressor, None]): 追加学習する場合の元のモデル（n_estimators本の木を追加する）
+        callbacks (Union[List[Callable], None]): LightGBMのコールバック（プロファイルの記録に使う）
 
     Returns:
         LGBMRegressor: トレーニング後のモデル
     """
     logger.info("Starting model training")
 
-    # ハイパーパラメータを設定してモデルを作成
+    # ハイパーパラメータを設定してモデルを作成（探索で求めたその他のパラメータもそのまま渡す）
+    extra_params = {
+        name: value
+        for name, value in hyperparameters.items()
+        if name not in {"n_estimators", "learning_rate", "random_state", "max_depth", "objective", "metric"}
+    }
     model = LGBMRegressor(
         n_estimators=hyperparameters.get("n_estimators", 500),
         learning_rate=hyperparameters.get("learning_rate", 0.1),
@@ -80,41 +246,231 @@ def train(X: np.ndarray, y: np.ndarray, hyperparameters: Dict[str, Any]) -> LGBM
         max_depth=hyperparameters.get("max_depth", -1),
         objective="regression",
         metric="rmse",
+        **extra_params,
     )
 
     # モデルのトレーニング
-    model.fit(X, y)
+    model.fit(X, y, init_model=init_model.booster_ if init_model is not None else None, callbacks=callbacks)
 
     return model
 
 
-def save_model(model: LGBMRegressor, model_dir: str, train_dir: str) -> None:
+def _train_area(
+    area: str,
+    X: np.ndarray,
+    y: np.ndarray,
+    hyperparameters: Dict[str, Any],
+) -> Tuple[str, LGBMRegressor, float]:
+    """1つのエリアのモデルを学習する（プロセスプールのワーカーで実行する）"""
+    start = time.perf_counter()
+    model = train(X, y, hyperparameters)
+    return area, model, time.perf_counter() - start
+
+
+def train_per_area(
+    X: np.ndarray,
+    y: np.ndarray,
+    areas: np.ndarray,
+    hyperparameters: Dict[str, Any],
+    dates: Union[np.ndarray, None] = None,
+    max_workers: Union[int, None] = None,
+) -> Tuple[Dict[str, LGBMRegressor], Dict[str, Dict[str, Any]]]:
+    """エリアごとのモデルをプロセスプールで並列に学習する
+    ワーカーごとのスレッド数をCPU数/ワーカー数に制限し、エリアの学習どうしでCPUを取り合わないようにする
+    行数の多いエリアから順に投入し、最後に大きなエリアだけが残って待ち時間が長くなるのを避ける
+
+    Args:
+        X (np.ndarray): 特徴量
+        y (np.ndarray): 目標値
+        areas (np.ndarray): 各行のエリア
+        hyperparameters (Dict[str, Any]): モデルのハイパーパラメータ
+        dates (Union[np.ndarray, None]): 各行の日付（エリアごとの学習期間の記録に使う）
+        max_workers (Union[int, None]): プロセス数（省略時はCPU数。エリア数より多くはしない）
+
+    Returns:
+        Tuple[Dict[str, LGBMRegressor], Dict[str, Dict[str, Any]]]: エリアごとのモデルと、学習の記録
+    """
+    names, counts = np.unique(areas, return_counts=True)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(names))
+    num_threads = max(1, (os.cpu_count() or 1) // max_workers)
+    params = {**hyperparameters, "n_jobs": num_threads}
+    logger.info(f"Training {len(names)} area models with {max_workers} workers x {num_threads} threads")
+
+    models, stats = {}, {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for area in names[np.argsort(-counts, kind="stable")]:
+            rows = np.flatnonzero(areas == area)
+            futures.append(executor.submit(_train_area, str(area), X[rows], y[rows], params))
+            stats[str(area)] = {
+                "rows": len(rows),
+                "start_date": str(dates[rows[0]]) if dates is not None else None,
+                "end_date": str(dates[rows[-1]]) if dates is not None else None,
+            }
+        for future in as_completed(futures):
+            area, model, seconds = future.result()
+            models[area] = model
+            stats[area].update({"train_seconds": seconds, "num_trees": model.booster_.num_trees()})
+            logger.info(f"Trained area {area}: {stats[area]}")
+    return models, stats
+
+
+def booster_params(hyperparameters: Dict[str, Any]) -> Dict[str, Any]:
+    """ハイパーパラメータから、LGBMRegressorと同じ設定で学習するlgb.trainのパラメータを作成する"""
+    return {
+        "objective": "regression",
+        "metric": "rmse",
+        "verbose": -1,
+        **{name: value for name, value in hyperparameters.items() if name not in {"n_estimators", "random_state"}},
+        "seed": hyperparameters.get("random_state", 10),
+    }
+
+
+def train_streaming(
+    X: ParquetSequence,
+    y: np.ndarray,
+    hyperparameters: Dict[str, Any],
+    callbacks: Union[List[Callable], None] = None,
+) -> lgb.Booster:
+    """Parquetファイルからバッチごとに読み込みながらLightGBMモデルをトレーニングする
+    LGBMRegressorは配列しか受け付けないため、lgb.trainで学習したBoosterを返す（予測・変数重要度は同じように使える）
+
+    Args:
+        X (ParquetSequence): 特徴量のSequence
+        y (np.ndarray): 目標値
+        hyperparameters (Dict[str, Any]): モデルのハイパーパラメータ
+        callbacks (Union[List[Callable], None]): LightGBMのコールバック（プロファイルの記録に使う）
+
+    Returns:
+        lgb.Booster: トレーニング後のモデル
+    """
+    logger.info("Starting model training (streaming)")
+    params = booster_params(hyperparameters)
+    dataset = lgb.Dataset(X, y, params=params)
+    return lgb.train(params, dataset, num_boost_round=hyperparameters.get("n_estimators", 500), callbacks=callbacks)
+
+
+def cross_validate(
+    X: Union[np.ndarray, ParquetSequence],
+    y: np.ndarray,
+    dates: np.ndarray,
+    hyperparameters: Dict[str, Any],
+    n_splits: int,
+    horizon: Union[int, None] = None,
+    gap: int = 0,
+    window: Union[int, None] = None,
+    dataset_cache: Union[DatasetCache, None] = None,
+) -> Dict[str, Any]:
+    """ローリングオリジン方式の時系列交差検証を行う
+    ビン分割済みのDatasetを一度だけ作成し、各foldではインデックスで部分集合を取り出して学習する（データをコピーしない）
+
+    Args:
+        X (Union[np.ndarray, ParquetSequence]): 特徴量（日付順）
+        y (np.ndarray): 目標値
+        dates (np.ndarray): 各行の日付（昇順）
+        hyperparameters (Dict[str, Any]): モデルのハイパーパラメータ
+        n_splits (int): fold数
+        horizon (Union[int, None]): 1つのfoldの検証期間の日数
+        gap (int): 学習期間と検証期間の間に空ける日数
+        window (Union[int, None]): 学習期間の日数（省略時は拡張ウィンドウ）
+        dataset_cache (Union[DatasetCache, None]): ビン分割済みのDatasetのキャッシュ
+
+    Returns:
+        Dict[str, Any]: foldごとの評価指標と、その平均・標準偏差
+    """
+    params = booster_params(hyperparameters)
+    if dataset_cache is not None:
+        dataset, _ = dataset_cache.get(X, y, params)
+    else:
+        # Sequenceの場合は元のデータを持たない（foldごとの部分集合はビン分割済みのデータから作る）
+        dataset = lgb.Dataset(X, y, params=params, free_raw_data=isinstance(X, ParquetSequence)).construct()
+
+    folds = []
+    for fold, (train_index, valid_index) in enumerate(time_series_splits(dates, n_splits, horizon, gap, window)):
+        booster = lgb.train(
+            params,
+            dataset.subset(train_index),
+            num_boost_round=hyperparameters.get("n_estimators", 500),
+        )
+        # 検証期間は連続した行のため、スライスで取り出す（Sequenceの場合も検証期間の行だけを読み込む）
+        error = booster.predict(X[valid_index[0] : valid_index[-1] + 1]) - y[valid_index]
+        folds.append(
+            {
+                "fold": fold,
+                "train_rows": len(train_index),
+                "valid_rows": len(valid_index),
+                "valid_start": str(dates[valid_index[0]]),
+                "valid_end": str(dates[valid_index[-1]]),
+                "rmse": float(np.sqrt(np.mean(error**2))),
+                "mae": float(np.mean(np.abs(error))),
+            },
+        )
+        logger.info(f"CV fold {fold}: {folds[-1]}")
+
+    rmse = np.array([fold["rmse"] for fold in folds])
+    mae = np.array([fold["mae"] for fold in folds])
+    return {
+        "folds": folds,
+        "rmse_mean": float(rmse.mean()),
+        "rmse_std": float(rmse.std()),
+        "mae_mean": float(mae.mean()),
+        "mae_std": float(mae.std()),
+    }
+
+
+def save_model(
+    model: Union[LGBMRegressor, lgb.Booster, Dict[str, LGBMRegressor]],
+    model_dir: str,
+    train_dir: str,
+    training_state: Union[Dict[str, Any], None] = None,
+    area_stats: Union[Dict[str, Dict[str, Any]], None] = None,
+    feature_names: Union[List[str], None] = None,
+) -> None:
     """
     モデルを保存する
 
     Args:
-        model (LGBMRegressor): 保存するモデル
+        model (Union[LGBMRegressor, lgb.Booster, Dict[str, LGBMRegressor]]): 保存するモデル（エリアごとの場合は辞書）
         model_dir (str): モデルの保存先ディレクトリ
-        train_dir (str): train.csvが入っているディレクトリ
+        train_dir (str): 学習データが入っているディレクトリ
+        training_state (Union[Dict[str, Any], None]): 次回の追加学習で使う学習状態
+        area_stats (Union[Dict[str, Dict[str, Any]], None]): エリアごとの学習の記録（マニフェストに含める）
+        feature_names (Union[List[str], None]): モデルの特徴量名（先頭は目的変数）。
+            特徴量を削減した場合に指定し、学習データのfeatures.txtの代わりに保存する
     """
 
-    # モデルを保存
-    model_path = os.path.join(model_dir, "model.joblib")
-    joblib.dump(model, model_path)
-
-    # train.csvが保存されているディレクトリにあるencoders.pklとreatures.txtをコピー
-    encoders_path = os.path.join(train_dir, "encoders.pkl")
-    features_path = os.path.join(train_dir, "features.txt")
-    if Path(encoders_path).exists():
-        shutil.copy(encoders_path, os.path.join(model_dir, "encoders.pkl"))
-    if Path(features_path).exists():
-        shutil.copy(features_path, os.path.join(model_dir, "features.txt"))
+    # モデルを保存（エリアごとのモデルは areas/<エリア>/model.joblib に保存し、一覧をマニフェストに書き出す）
+    if isinstance(model, dict):
+        manifest = {"mode": "per_area", "areas": {}}
+        for area, area_model in model.items():
+            relative_path = os.path.join("areas", area, "model.joblib")
+            Path(os.path.join(model_dir, "areas", area)).mkdir(parents=True, exist_ok=True)
+            joblib.dump(area_model, os.path.join(model_dir, relative_path))
+            manifest["areas"][area] = {"model": relative_path, **(area_stats or {}).get(area, {})}
+        with Path(os.path.join(model_dir, AREA_MANIFEST_FILENAME)).open("w") as f:
+            json.dump(manifest, f, indent=2)
+    else:
+        joblib.dump(model, os.path.join(model_dir, "model.joblib"))
+    if training_state is not None:
+        with Path(os.path.join(model_dir, TRAINING_STATE_FILENAME)).open("w") as f:
+            json.dump(training_state, f, indent=2)
+
+    # 学習データが保存されているディレクトリにあるencoders.pkl, features.txt, window_state.jsonをコピー
+    for filename in ["encoders.pkl", "features.txt", "window_state.json"]:
+        file_path = os.path.join(train_dir, filename)
+        if Path(file_path).exists():
+            shutil.copy(file_path, os.path.join(model_dir, filename))
+    if feature_names is not None:
+        with Path(os.path.join(model_dir, "features.txt")).open("w") as f:
+            f.writelines(f"{name}\n" for name in feature_names)
 
     logger.info("Model and related files saved successfully")
 
 
 if __name__ == "__main__":
     args = parse_args()
+    # 段階ごとの時間・メモリとブースティングの1回ごとの時間を記録し、モデルと一緒に保存する
+    profiler = TrainingProfiler()
 
     # ハイパーパラメータの設定
     hyperparameters = {
@@ -124,11 +480,172 @@ if __name__ == "__main__":
         "max_depth": args.max_depth,
     }
 
-    # データの読み込み
-    X_train, y_train = load_data(args.train)
-
-    # モデルの学習
-    model = train(X_train, y_train, hyperparameters)
-
-    # モデルの保存
-    save_model(model, args.model_dir, args.train)
+    # エリアごとに学習する場合は、学習データにエリアの列が必要
+    per_area = args.area_mode == "per_area"
+    areas = load_areas(args.train) if per_area else None
+    if per_area and areas is None:
+        msg = f"{args.train} has no area column (set area_column in config.yaml for per-area training)"
+        raise ValueError(msg)
+
+    # データの読み込み（メモリの目安を指定した場合は、全体を読み込まずにバッチごとに読み込む）
+    profiler.start("load_data")
+    streaming = args.memory_budget_mb > 0 and Path(os.path.join(args.train, "train.parquet")).exists()
+    if streaming and per_area:
+        logger.info("Skipped streaming training: not supported in per-area training")
+        streaming = False
+    if streaming:
+        X_train, y_train = load_streaming_data(args.train, args.memory_budget_mb)
+    else:
+        X_train, y_train = load_data(args.train)
+    dates = load_dates(args.train)
+
+    # 承認済みのモデルに追加学習するか、全期間で学習し直すかを決める
+    profiler.start("training_mode")
+    init_model, prev_state, new_error = None, None, None
+    # 特徴量を削減した場合（削減したモデルに追加学習する場合を含む）のモデルの特徴量名
+    model_feature_names = None
+    mode, reason = "full", "incremental training disabled"
+    if streaming:
+        reason = "streaming training"
+    elif per_area:
+        reason = "per-area training"
+    elif args.init_model_uri and dates is not None:
+        init_model, prev_state, prev_feature_names = load_init_model(args.init_model_uri)
+        train_feature_names = load_feature_names(args.train)
+        # 前回のモデルが特徴量を削減している場合は、同じ特徴量の列で追加学習できるか判定する
+        X_init = select_features(X_train, train_feature_names, prev_feature_names)
+        mode, reason, new_error = decide_training_mode(
+            init_model,
+            prev_state,
+            prev_feature_names,
+            prev_feature_names if X_init is not None else train_feature_names,
+            X_init if X_init is not None else X_train,
+            y_train,
+            dates,
+            full_retrain_days=args.full_retrain_days,
+            drift_threshold=args.drift_threshold,
+        )
+        if mode in ("warm", "reuse") and X_init is not None:
+            X_train, model_feature_names = X_init, prev_feature_names
+    logger.info(f"Training mode: {mode} ({reason})")
+    dataset_cache = DatasetCache(args.dataset_cache_dir) if args.dataset_cache_dir and not streaming else None
+
+    # ハイパーパラメータ探索（最良のパラメータと全試行の記録をモデルと一緒に保存する）
+    profiler.start("search")
+    if args.search_trials and mode == "full":
+        if streaming or per_area:
+            logger.info(f"Skipped hyperparameter search: not supported in {reason}")
+        elif dates is None:
+            logger.info("Skipped hyperparameter search: train data has no date column")
+        else:
+            best_params, search_log = successive_halving(
+                X_train,
+                y_train,
+                dates,
+                n_trials=args.search_trials,
+                min_rounds=args.search_min_rounds,
+                max_rounds=args.search_max_rounds,
+                eta=args.search_eta,
+                valid_days=args.search_valid_days,
+                time_budget=args.search_time_budget,
+                max_workers=args.search_workers,
+                seed=args.random_state,
+                dataset_path=dataset_cache.get(X_train, y_train, {})[1] if dataset_cache is not None else None,
+            )
+            hyperparameters.update(best_params)
+            with Path(os.path.join(args.model_dir, "best_params.json")).open("w") as f:
+                json.dump(hyperparameters, f, indent=2)
+            with Path(os.path.join(args.model_dir, "search_trials.json")).open("w") as f:
+                json.dump(search_log, f, indent=2)
+
+    # 重要度の低い特徴量の削減（削減後の特徴量名をfeatures.txtとして保存し、推論時は削除した特徴量を作らない）
+    profiler.start("pruning")
+    if args.prune_method and mode == "full":
+        if streaming or per_area:
+            logger.info(f"Skipped feature pruning: not supported in {reason}")
+        elif dates is None:
+            logger.info("Skipped feature pruning: train data has no date column")
+        else:
+            train_feature_names = load_feature_names(args.train)
+            keep, pruning_report = prune_features(
+                X_train,
+                y_train,
+                dates,
+                train_feature_names[1:],
+                booster_params(hyperparameters),
+                hyperparameters["n_estimators"],
+                method=args.prune_method,
+                tolerance=args.prune_tolerance,
+                valid_days=args.prune_valid_days,
+                seed=args.random_state,
+            )
+            X_train = X_train[:, keep]
+            model_feature_names = [train_feature_names[0], *pruning_report["kept"]]
+            with Path(os.path.join(args.model_dir, "pruned_features.json")).open("w") as f:
+                json.dump(pruning_report, f, indent=2, ensure_ascii=False)
+            logger.info(
+                f"Pruned {len(pruning_report['dropped'])} of {len(keep) + len(pruning_report['dropped'])} features "
+                f"(validation RMSE {pruning_report['baseline_rmse']:.2f} -> {pruning_report['pruned_rmse']:.2f})",
+            )
+
+    # 時系列交差検証（結果はモデルと一緒に保存し、評価ステップで使用する）
+    profiler.start("cross_validation")
+    if args.cv_folds and mode == "full":
+        if per_area:
+            logger.info("Skipped cross validation: not supported in per-area training")
+        elif dates is None:
+            logger.info("Skipped cross validation: train data has no date column")
+        else:
+            cv_results = cross_validate(
+                X_train,
+                y_train,
+                dates,
+                hyperparameters,
+                n_splits=args.cv_folds,
+                horizon=args.cv_horizon,
+                gap=args.cv_gap,
+                window=args.cv_window,
+                dataset_cache=dataset_cache,
+            )
+            with Path(os.path.join(args.model_dir, "cv_results.json")).open("w") as f:
+                json.dump(cv_results, f, indent=2)
+            logger.info(f"CV RMSE: {cv_results['rmse_mean']:.2f} ± {cv_results['rmse_std']:.2f}")
+
+    # モデルの学習（追加学習の場合は元のモデルと同じパラメータで、末尾の期間に木を追加する）
+    profiler.start("train")
+    profiler.info.update({"mode": mode, "rows": len(y_train), "features": X_train.shape[1]})
+    start = time.perf_counter()
+    area_stats = None
+    if per_area:
+        model, area_stats = train_per_area(X_train, y_train, areas, hyperparameters, dates, args.area_workers)
+        profiler.info["area_workers"] = min(args.area_workers or os.cpu_count() or 1, len(model))
+    elif mode == "reuse":
+        # 新しい日付がない場合は学習せず、前回のモデルをそのまま保存する
+        model = init_model
+    elif mode == "warm":
+        rows = recent_rows(dates, args.warm_start_window_days)
+        warm_params = {**init_model.get_params(), "n_estimators": args.warm_start_trees}
+        profiler.info.update({"rows": len(rows), **effective_num_threads(warm_params)})
+        model = train(X_train[rows], y_train[rows], warm_params, init_model=init_model, callbacks=profiler.callbacks())
+    elif streaming:
+        profiler.info.update(effective_num_threads(hyperparameters))
+        model = train_streaming(X_train, y_train, hyperparameters, callbacks=profiler.callbacks())
+    else:
+        profiler.info.update(effective_num_threads(hyperparameters))
+        model = train(X_train, y_train, hyperparameters, callbacks=profiler.callbacks())
+    train_seconds = time.perf_counter() - start
+
+    # モデルの保存（エリアごとのモデルは追加学習に対応していないため、学習状態は保存しない）
+    profiler.start("save")
+    training_state = None
+    if per_area:
+        logger.info(f"Trained {len(model)} area models in {train_seconds:.1f} seconds")
+    else:
+        if mode == "reuse":
+            logger.info(f"Reused the previous model ({as_booster(model).num_trees()} trees)")
+        else:
+            logger.info(f"Trained {mode} model in {train_seconds:.1f} seconds ({as_booster(model).num_trees()} trees)")
+        if dates is not None:
+            training_state = make_training_state(mode, reason, model, dates, prev_state, new_error, train_seconds)
+    save_model(model, args.model_dir, args.train, training_state, area_stats, model_feature_names)
+    profiler.save(args.model_dir)
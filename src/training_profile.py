@@ -0,0 +1,220 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Union
+
+import numpy as np
+
+logger = logging.getLogger()
+
+PROFILE_FILENAME = "training_profile.json"
+# 比較する指標と、値が大きいほど良いかどうか
+COMPARED_METRICS = {
+    "total_seconds": False,
+    "dataset_construction_seconds": False,
+    "boosting_seconds": False,
+    "iteration_seconds_p50": False,
+    "peak_rss_mb": False,
+    "row_iterations_per_second": True,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    引数をパースする
+
+    Returns:
+        argparse.Namespace: パースされた引数
+    """
+    parser = argparse.ArgumentParser(description="2つの学習のプロファイル（training_profile.json）を比較する")
+    parser.add_argument("base", type=str, help="比較元のtraining_profile.json（またはモデルのディレクトリ）")
+    parser.add_argument("target", type=str, help="比較先のtraining_profile.json（またはモデルのディレクトリ）")
+    parser.add_argument("--threshold", type=float, default=0.1, help="悪化とみなす変化の割合")
+    parser.add_argument("--min-seconds", type=float, default=0.1, help="悪化とみなす時間の増加量の下限（秒）")
+    return parser.parse_args()
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """最大常駐メモリ（MB）を返す（Linuxのru_maxrssはKB単位）"""
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def effective_num_threads(params: Dict[str, Any]) -> Dict[str, Any]:
+    """LightGBMが実際に使うスレッド数を求める
+    num_threads（n_jobs）が正の値の場合はその値、それ以外はOpenMPの既定値（OMP_NUM_THREADSまたはCPU数）を使う
+
+    Args:
+        params: LightGBMのパラメータ
+
+    Returns:
+        Dict[str, Any]: スレッド数と、その値の出どころ
+    """
+    for name in ["num_threads", "n_jobs"]:
+        if (params.get(name) or 0) > 0:
+            return {"num_threads": int(params[name]), "num_threads_source": name}
+    if os.environ.get("OMP_NUM_THREADS"):
+        return {"num_threads": int(os.environ["OMP_NUM_THREADS"]), "num_threads_source": "OMP_NUM_THREADS"}
+    return {"num_threads": os.cpu_count() or 1, "num_threads_source": "cpu_count"}
+
+
+class TrainingProfiler:
+    """学習の各段階の時間・メモリと、ブースティングの1回ごとの時間を記録するクラス
+    段階はstartを呼んだ時点で前の段階を終わらせる（学習スクリプトの処理の順に呼ぶ）
+    """
+
+    def __init__(self) -> None:
+        self.started_at = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()  # noqa: UP017
+        self.phases: List[Dict[str, Any]] = []
+        self.info: Dict[str, Any] = {}
+        self.iteration_seconds: List[float] = []
+        self._phase: Union[Dict[str, Any], None] = None
+        self._fit_start: Union[float, None] = None
+        self._first_iteration_start: Union[float, None] = None
+        self._iteration_start = 0.0
+
+    def start(self, name: str) -> None:
+        """段階を開始する（実行中の段階は終わらせる）"""
+        self.stop()
+        self._phase = {"name": name, "start": time.perf_counter()}
+
+    def stop(self) -> None:
+        """実行中の段階を終わらせ、経過時間とそれまでの最大常駐メモリを記録する"""
+        if self._phase is None:
+            return
+        self.phases.append(
+            {
+                "name": self._phase["name"],
+                "seconds": time.perf_counter() - self._phase["start"],
+                "peak_rss_mb": peak_rss_mb(),
+            },
+        )
+        logger.info(f"Phase {self.phases[-1]}")
+        self._phase = None
+
+    def callbacks(self) -> List[Callable]:
+        """ブースティングの1回ごとの時間を記録するLightGBMのコールバックを返す（fitの直前に呼ぶ）
+        最初の回の開始までの時間を、Datasetの作成（ビン分割）の時間とみなす
+        """
+        self._fit_start = time.perf_counter()
+        self._first_iteration_start = None
+        self.iteration_seconds = []
+
+        def before_iteration(env: Any) -> None:  # noqa: ARG001
+            self._iteration_start = time.perf_counter()
+            if self._first_iteration_start is None:
+                self._first_iteration_start = self._iteration_start
+
+        def after_iteration(env: Any) -> None:  # noqa: ARG001
+            self.iteration_seconds.append(time.perf_counter() - self._iteration_start)
+
+        before_iteration.before_iteration = True
+        before_iteration.order = 0
+        after_iteration.before_iteration = False
+        after_iteration.order = 0
+        return [before_iteration, after_iteration]
+
+    def report(self) -> Dict[str, Any]:
+        """プロファイルを辞書で返す"""
+        self.stop()
+        iterations = np.array(self.iteration_seconds)
+        construction = None
+        if self._fit_start is not None and self._first_iteration_start is not None:
+            construction = self._first_iteration_start - self._fit_start
+        boosting = float(iterations.sum()) if len(iterations) else None
+        rows = self.info.get("rows")
+        report = {
+            "started_at": self.started_at,
+            "cpu_count": os.cpu_count(),
+            **self.info,
+            "total_seconds": float(sum(phase["seconds"] for phase in self.phases)),
+            "phases": self.phases,
+            "peak_rss_mb": peak_rss_mb(),
+            "children_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "dataset_construction_seconds": construction,
+            "boosting_seconds": boosting,
+            "iterations": len(iterations),
+            "iteration_seconds_p50": float(np.median(iterations)) if len(iterations) else None,
+            "iteration_seconds_p95": float(np.percentile(iterations, 95)) if len(iterations) else None,
+            "iteration_seconds_max": float(iterations.max()) if len(iterations) else None,
+            "row_iterations_per_second": rows * len(iterations) / boosting if rows and boosting else None,
+            "iteration_seconds": [round(seconds, 6) for seconds in self.iteration_seconds],
+        }
+        train_phase = next((phase for phase in self.phases if phase["name"] == "train"), None)
+        if rows and train_phase is not None:
+            report["train_rows_per_second"] = rows / train_phase["seconds"]
+        return report
+
+    def save(self, model_dir: str) -> None:
+        """プロファイルをモデルと一緒にJSONで保存する"""
+        with Path(os.path.join(model_dir, PROFILE_FILENAME)).open("w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def load_profile(path: str) -> Dict[str, Any]:
+    """training_profile.jsonを読み込む（ディレクトリの場合はその中のtraining_profile.json）"""
+    profile_path = Path(path) / PROFILE_FILENAME if Path(path).is_dir() else Path(path)
+    return json.loads(profile_path.read_text())
+
+
+def compare_profiles(
+    base: Dict[str, Any],
+    target: Dict[str, Any],
+    threshold: float = 0.1,
+    min_seconds: float = 0.1,
+) -> List[Dict[str, Any]]:
+    """2つの学習のプロファイルの指標と段階ごとの時間を比較する
+    時間の指標は、増加量がmin_seconds未満の場合は悪化とみなさない（行っていない段階などのごく短い時間の揺らぎを除く）
+
+    Args:
+        base: 比較元のプロファイル
+        target: 比較先のプロファイル
+        threshold: 悪化とみなす変化の割合
+        min_seconds: 悪化とみなす時間の増加量の下限（秒）
+
+    Returns:
+        List[Dict[str, Any]]: 指標ごとの値・変化の割合・悪化したかどうか
+    """
+    metrics = {name: (base.get(name), target.get(name), higher) for name, higher in COMPARED_METRICS.items()}
+    base_phases = {phase["name"]: phase["seconds"] for phase in base.get("phases", [])}
+    for phase in target.get("phases", []):
+        metrics[f"phase:{phase['name']}"] = (base_phases.get(phase["name"]), phase["seconds"], False)
+
+    rows = []
+    for name, (base_value, target_value, higher_is_better) in metrics.items():
+        change = None
+        if base_value and target_value is not None:
+            change = target_value / base_value - 1
+        regressed = change is not None and (-change if higher_is_better else change) > threshold
+        if regressed and ("seconds" in name or name.startswith("phase:")):
+            regressed = target_value - base_value >= min_seconds
+        rows.append(
+            {"metric": name, "base": base_value, "target": target_value, "change": change, "regressed": regressed},
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler())
+    args = parse_args()
+    base, target = load_profile(args.base), load_profile(args.target)
+    for key in ["num_threads", "rows", "features", "mode"]:
+        if base.get(key) != target.get(key):
+            logger.info(f"Note: {key} differs ({base.get(key)} -> {target.get(key)})")
+
+    rows = compare_profiles(base, target, args.threshold, args.min_seconds)
+    logger.info(f"{'metric':<36}{'base':>14}{'target':>14}{'change':>12}")
+    for row in rows:
+        base_value = f"{row['base']:.3f}" if row["base"] is not None else "-"
+        target_value = f"{row['target']:.3f}" if row["target"] is not None else "-"
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+        mark = "  REGRESSION" if row["regressed"] else ""
+        logger.info(f"{row['metric']:<36}{base_value:>14}{target_value:>14}{change:>12}{mark}")
+    # 悪化した指標がある場合は終了コード1で終わる（CIで使えるようにする）
+    sys.exit(1 if any(row["regressed"] for row in rows) else 0)
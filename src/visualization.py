@@ -10,34 +10,35 @@ subprocess.run(
         "install",
         "--quiet",
         "seaborn",
-        "lightgbm",
         "matplotlib",
         "japanize-matplotlib",
-        "scikit-learn",
+        "pyarrow",
     ],
     check=True,
 )
 import argparse
+import json
 import logging
 import os
-import tarfile
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Union
+from typing import Dict, List, Tuple, Union
 
 import japanize_matplotlib  # noqa: F401
-import joblib
-import lightgbm as lgb
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
-from scipy.sparse import spmatrix
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+# 評価ステップの成果物（evaluate.pyと同じ名前）
+PREDICTIONS_FILENAME = "predictions.parquet"
+FEATURE_IMPORTANCE_FILENAME = "feature_importance.csv"
+# 可視化する評価指標（evaluation.jsonのregression_metricsの順）
+METRIC_NAMES = ["rmse", "mse", "mae", "r2"]
+
 
 def parse_args() -> argparse.Namespace:
     """
@@ -50,14 +51,15 @@ def parse_args() -> argparse.Namespace:
 
     # 必須のSageMaker引数
     parser.add_argument(
-        "--model-path",
+        "--evaluation-path",
         type=str,
-        default=os.environ.get("SM_MODEL_PATH", "/opt/ml/processing/model/model.tar.gz"),
+        default=os.environ.get("SM_EVALUATION_PATH", "/opt/ml/processing/evaluation"),
+        help="評価ステップの出力（evaluation.json・予測値・特徴量重要度）のディレクトリ",
     )
     parser.add_argument(
         "--test-path",
         type=str,
-        default=os.environ.get("SM_CHANNEL_TEST", "/opt/ml/processing/test/test.csv"),
+        default=os.environ.get("SM_CHANNEL_TEST", "/opt/ml/processing/test/test.parquet"),
     )
     parser.add_argument(
         "--feature-names-path",
@@ -76,14 +78,14 @@ def parse_args() -> argparse.Namespace:
 class Visualizer:
     """モデルの評価や特徴量の可視化を行うクラス"""
 
-    def __init__(self, output_dir: str, model: Any, feature_names_path: str) -> None:
+    def __init__(self, output_dir: str, feature_names_path: str) -> None:
         """
         Args:
             output_dir: 出力ディレクトリ
+            feature_names_path: 特徴量名（features.txt）のパス
         """
         self.output_dir = output_dir
         Path(self.output_dir).mkdir(parents=True, exist_ok=True)
-        self.model = model
         self.feature_names_path = feature_names_path
         self.feature_names = self.get_feature_names(feature_names_path)
 
@@ -101,30 +103,16 @@ class Visualizer:
         Returns:
             Tuple[pd.DataFrame, pd.Series]: 特徴量データと目的変数データ
         """
-        test_data = pd.read_csv(test_data_path, names=self.feature_names, header=None)
+        if Path(test_data_path).suffix == ".csv":
+            # 以前の形式（ヘッダーなしCSV）
+            test_data = pd.read_csv(test_data_path, names=self.feature_names, header=None)
+        else:
+            # features.txtの列だけをメモリマップで読み込む（日付などの列は読まない）
+            test_data = pd.read_parquet(test_data_path, columns=self.feature_names, memory_map=True)
         X_test = test_data.drop(columns=[target_col])
         y_true = test_data[target_col]
         return X_test, y_true
 
-    def evaluate(self, y_true: pd.Series, y_pred: Union[np.ndarray, pd.Series, spmatrix]) -> Dict[str, float]:
-        """モデルを評価する
-
-        Args:
-            y_true: 実際の値
-            y_pred: 予測値
-
-        Returns:
-            Dict[str, float]: 評価メトリクスの辞書
-        """
-        metrics = {
-            "rmse": np.sqrt(mean_squared_error(y_true, y_pred)),
-            "mse": mean_squared_error(y_true, y_pred),
-            "mae": mean_absolute_error(y_true, y_pred),
-            "r2": r2_score(y_true, y_pred),
-        }
-
-        return metrics
-
     def get_feature_names(self, feature_name_path: str) -> List[str]:
         """モデルの特徴量名を取得する
 
@@ -135,24 +123,6 @@ class Visualizer:
             feature_names = [line.strip() for line in f if line.strip()]
         return feature_names
 
-    def get_feature_importance(self) -> pd.DataFrame:
-        """特徴量重要度を取得する
-        使用するlightgbmのインターフェースによって異なるため、条件分岐で取得する
-
-        Returns:
-            pd.DataFrame: 特徴量と重要度を含むデータフレーム
-        """
-        if hasattr(self.model, "feature_name_") and hasattr(self.model, "feature_importances_"):
-            importances = self.model.feature_importances_
-        elif hasattr(self.model, "feature_name") and hasattr(self.model, "feature_importance"):
-            importances = self.model.feature_importance()
-        else:
-            msg = "モデルの特徴量取得に失敗しました"
-            raise ValueError(msg)
-        # 特徴量名の先頭は目的変数のため除外して渡す
-        df_importance = pd.DataFrame({"feature": self.feature_names[1:], "importance": importances})
-        return df_importance.sort_values("importance", ascending=False)
-
     def plot_feature_importance(
         self,
         feature_importance_df: pd.DataFrame,
@@ -360,22 +330,62 @@ class Visualizer:
         plt.close()
 
 
-def load_model(model_tar_path: str) -> lgb.Booster:
-    """model.tar.gz から model.pickle を取り出してモデルを返す
+def load_metrics(evaluation_path: str) -> Dict[str, float]:
+    """評価ステップのevaluation.jsonから評価指標を読み込む（条件ステップの判定と同じ値を可視化する）
+
+    Args:
+        evaluation_path: 評価ステップの出力のディレクトリ
+
+    Returns:
+        Dict[str, float]: 評価指標の辞書
+    """
+    with (Path(evaluation_path) / "evaluation.json").open() as f:
+        regression_metrics = json.load(f)["regression_metrics"]
+    return {name: regression_metrics[name]["value"] for name in METRIC_NAMES if name in regression_metrics}
+
+
+def load_predictions(evaluation_path: str, rows: int) -> pd.DataFrame:
+    """評価ステップが保存した予測値（actual・predicted列と、ある場合はdate・area列）を読み込む
+
     Args:
-        model_tar_path (str): モデルのtar.gzファイルのパス
+        evaluation_path: 評価ステップの出力のディレクトリ
+        rows: テストデータの行数
+
     Returns:
-        lgb.Booster: 学習済みモデル
+        pd.DataFrame: 予測値のデータフレーム
+
+    Raises:
+        ValueError: 予測値の列が足りないか、行数がテストデータと一致しない場合
     """
-    # 解凍
-    extract_dir = "/tmp/model"  # noqa: S108
-    Path(extract_dir).mkdir(exist_ok=True)
-    with tarfile.open(model_tar_path, "r:gz") as tar:
-        tar.extractall(path=extract_dir)
+    predictions = pd.read_parquet(Path(evaluation_path) / PREDICTIONS_FILENAME)
+    missing = {"actual", "predicted"} - set(predictions.columns)
+    if missing:
+        msg = f"{PREDICTIONS_FILENAME} has no columns {sorted(missing)}"
+        raise ValueError(msg)
+    if len(predictions) != rows:
+        msg = f"{PREDICTIONS_FILENAME} has {len(predictions)} rows but the test data has {rows}"
+        raise ValueError(msg)
+    return predictions
+
 
-    model_path = next(Path(extract_dir).rglob("model.joblib"))
+def load_feature_importance(evaluation_path: str) -> pd.DataFrame:
+    """評価ステップが保存した特徴量重要度（feature・importance列）を読み込む"""
+    return pd.read_csv(Path(evaluation_path) / FEATURE_IMPORTANCE_FILENAME)
 
-    return joblib.load(model_path)
+
+def resolve_feature_names_path(feature_names_path: str, evaluation_path: str) -> str:
+    """評価ステップが出力した特徴量名（モデルと一緒に保存されたfeatures.txt）がある場合はそのパスを返す
+    特徴量を削減したモデルは、学習データのfeatures.txtより特徴量が少ない
+
+    Args:
+        feature_names_path (str): 学習データの特徴量名のパス
+        evaluation_path (str): 評価ステップの出力のディレクトリ
+
+    Returns:
+        str: 使用する特徴量名のパス
+    """
+    path = Path(evaluation_path) / "features.txt"
+    return str(path) if path.exists() else feature_names_path
 
 
 if __name__ == "__main__":
@@ -383,26 +393,21 @@ if __name__ == "__main__":
 
     args = parse_args()
     # コマンドライン引数の取得
-    model_path = args.model_path
+    evaluation_path = args.evaluation_path
     test_data_path = args.test_path
-    feature_names_path = args.feature_names_path
     output_path = args.output_path
-
-    # モデルのロード
-    model = load_model(model_path)
+    feature_names_path = resolve_feature_names_path(args.feature_names_path, evaluation_path)
 
     # 可視化の実行
-    visualizer = Visualizer(output_dir=output_path, model=model, feature_names_path=feature_names_path)
+    visualizer = Visualizer(output_dir=output_path, feature_names_path=feature_names_path)
 
-    # テストデータのロード
-    X_test, y_true = visualizer.load_test_data(test_data_path)
+    # テストデータのロード（特徴量の分布・相関の可視化に使う）
+    X_test, _ = visualizer.load_test_data(test_data_path)
 
-    # 予測と評価
-    y_pred = model.predict(X_test)
-    metrics = visualizer.evaluate(y_true, y_pred)
-
-    # 特徴量重要度の取得
-    feature_importance = visualizer.get_feature_importance()
+    # 評価ステップの予測値・評価指標・特徴量重要度を使う（モデルの読み込みと予測をし直さない）
+    predictions = load_predictions(evaluation_path, rows=len(X_test))
+    metrics = load_metrics(evaluation_path)
+    feature_importance = load_feature_importance(evaluation_path)
 
     # 特徴量重要度の可視化
     visualizer.plot_feature_importance(
@@ -412,18 +417,17 @@ if __name__ == "__main__":
     )
 
     # 予実の比較
-    # dateカラムを作成
-    X_test["date"] = pd.to_datetime(
-        {
-            "year": X_test["year"],
-            "month": X_test["month"],
-            "day": X_test["day"],
-        },
-    )
+    # 日付はテストデータの日付の列を使う（日付の列がない以前の形式の場合は年月日の列から作成する）
+    if "date" in predictions.columns:
+        dates = pd.to_datetime(predictions["date"])
+    elif {"year", "month", "day"} <= set(X_test.columns):
+        dates = pd.to_datetime({"year": X_test["year"], "month": X_test["month"], "day": X_test["day"]})
+    else:
+        dates = None
     visualizer.plot_prediction_vs_actual(
-        y_true,
-        y_pred,
-        dates=X_test["date"],
+        predictions["actual"],
+        predictions["predicted"].to_numpy(),
+        dates=dates,
         save_name="prediction_vs_actual",
     )
     # 評価メトリクスの可視化
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import shutil
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Union
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+from lightgbm import LGBMRegressor
+
+logger = logging.getLogger()
+
+# モデルと一緒に保存する学習状態（学習方法、学習データの最終日、予測誤差の履歴など）
+TRAINING_STATE_FILENAME = "training_state.json"
+# 学習状態に残す予測誤差の履歴の件数
+MAX_ERROR_HISTORY = 30
+# ドリフトの検出で直近とみなす予測誤差の件数（1日分の誤差はばらつきが大きいため、直近の複数回分で判定する）
+DRIFT_WINDOW = 7
+
+
+def to_days(dates: np.ndarray) -> np.ndarray:
+    """日付の配列（文字列・datetime64）を日単位のdatetime64に変換する"""
+    return np.asarray(dates).astype("datetime64[D]")
+
+
+def as_booster(model: Union[LGBMRegressor, lgb.Booster]) -> lgb.Booster:
+    """モデルのBoosterを返す（省メモリの学習ではBoosterをそのまま保存している）"""
+    return model.booster_ if isinstance(model, LGBMRegressor) else model
+
+
+def load_init_model(
+    uri: str,
+    extract_dir: str = "/tmp/init_model",  # noqa: S108
+) -> Tuple[Union[LGBMRegressor, lgb.Booster, None], Union[Dict[str, Any], None], Union[List[str], None]]:
+    """承認済みのモデルのアーティファクト（model.tar.gz）から、モデルと学習状態・特徴量名を読み込む
+
+    Args:
+        uri: model.tar.gzのS3 URI、ローカルのパス、または展開済みのディレクトリ
+        extract_dir: 展開先のディレクトリ
+
+    Returns:
+        Tuple[Union[LGBMRegressor, lgb.Booster, None], Union[Dict[str, Any], None], Union[List[str], None]]:
+            モデル（エリアごとのモデルの場合はNone）、学習状態（以前のモデルにはない）、特徴量名（先頭は目的変数）
+    """
+    if Path(uri).is_dir():
+        model_dir = Path(uri)
+    else:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        Path(extract_dir).mkdir(parents=True)
+        tar_path = uri
+        if uri.startswith("s3://"):
+            # S3から取得する場合のみ必要になるため、ここでインポートする
+            import boto3
+
+            bucket, key = uri[len("s3://") :].split("/", 1)
+            tar_path = os.path.join(extract_dir, "model.tar.gz")
+            boto3.client("s3").download_file(bucket, key, tar_path)
+        with tarfile.open(tar_path, "r:gz") as tar:
+            tar.extractall(path=extract_dir)
+        model_dir = Path(extract_dir)
+
+    if not (model_dir / "model.joblib").exists():
+        # エリアごとのモデル（areas/<エリア>/model.joblib）には追加学習しない
+        logger.info(f"No single model in {uri} (per-area models are not used for incremental training)")
+        return None, None, None
+    model = joblib.load(model_dir / "model.joblib")
+    state_path = model_dir / TRAINING_STATE_FILENAME
+    state = json.loads(state_path.read_text()) if state_path.exists() else None
+    features_path = model_dir / "features.txt"
+    feature_names = None
+    if features_path.exists():
+        feature_names = [line.strip() for line in features_path.read_text().splitlines() if line.strip()]
+    logger.info(f"Loaded init model from {uri} ({as_booster(model).num_trees()} trees, state: {state})")
+    return model, state, feature_names
+
+
+def rmse(model: LGBMRegressor, X: np.ndarray, y: np.ndarray) -> float:
+    """モデルのRMSEを求める"""
+    return float(np.sqrt(np.mean((model.predict(X) - y) ** 2)))
+
+
+def decide_training_mode(
+    model: Union[LGBMRegressor, lgb.Booster, None],
+    state: Union[Dict[str, Any], None],
+    prev_feature_names: Union[List[str], None],
+    feature_names: List[str],
+    X: np.ndarray,
+    y: np.ndarray,
+    dates: np.ndarray,
+    full_retrain_days: int = 28,
+    drift_threshold: float = 1.5,
+) -> Tuple[str, str, Union[float, None]]:
+    """前回のモデルに追加学習するか（warm）、全期間で学習し直すか（full）、そのまま使うか（reuse）を決める
+    前回のモデルが学習していない新しい日付がない場合は、学習せずに前回のモデルをそのまま使う
+    次の場合は全期間で学習し直す
+    - 前回のモデルがない、学習状態がない、または特徴量が変わった
+    - 前回の全期間の学習からfull_retrain_days日以上経過した（定期的な学習し直し）
+    - 直近DRIFT_WINDOW回の予測誤差（RMS）が、それ以前の予測誤差（RMS）のdrift_threshold倍を超えた（ドリフト）
+      直近の予測誤差がすべて前回の全期間の学習以降のモデルのものになるまでは判定しない（同じドリフトで続けて学習し直さない）
+
+    Args:
+        model: 前回のモデル
+        state: 前回のモデルの学習状態
+        prev_feature_names: 前回のモデルの特徴量名
+        feature_names: 今回の学習データの特徴量名
+        X: 特徴量（日付順）
+        y: 目標値
+        dates: 各行の日付（昇順）
+        full_retrain_days: 全期間で学習し直す間隔の日数
+        drift_threshold: ドリフトとみなす予測誤差の比率
+
+    Returns:
+        Tuple[str, str, Union[float, None]]:
+            学習方法（"warm"、"full"または"reuse"）、その理由、新しい日付に対する前回のモデルの予測誤差
+    """
+    if model is None or state is None:
+        return "full", "no previous model", None
+    if not isinstance(model, LGBMRegressor):
+        # 省メモリの学習で作成したBoosterには、追加学習に使うLGBMRegressorのパラメータがない
+        return "full", "previous model is not an LGBMRegressor", None
+    if prev_feature_names != feature_names:
+        return "full", "feature set changed", None
+
+    days = to_days(dates)
+    last_train_date = np.datetime64(state["last_train_date"], "D")
+    elapsed = int((days[-1] - np.datetime64(state["last_full_retrain_date"], "D")).astype(int))
+    if elapsed >= full_retrain_days:
+        return "full", f"{elapsed} days since last full retrain", None
+
+    # 前回のモデルが学習していない新しい日付に対する予測誤差（アウトオブサンプル）でドリフトを検出する
+    new_rows = days > last_train_date
+    if not new_rows.any():
+        # 同じデータで再実行した場合に、木を増やさないようにする
+        return "reuse", "no new dates", None
+    new_error = rmse(model, X[new_rows], y[new_rows])
+    errors = np.array([*state.get("forecast_errors", []), new_error])
+    errors_since_full = state.get("warm_starts_since_full", 0) + 1
+    if errors_since_full >= DRIFT_WINDOW and len(errors) >= 2 * DRIFT_WINDOW:
+        recent = float(np.sqrt(np.mean(errors[-DRIFT_WINDOW:] ** 2)))
+        baseline = float(np.sqrt(np.mean(errors[:-DRIFT_WINDOW] ** 2)))
+        if recent > drift_threshold * baseline:
+            reason = f"drift detected (recent RMSE {recent:.2f} > {drift_threshold} x baseline {baseline:.2f})"
+            return "full", reason, new_error
+    return "warm", f"RMSE on new dates {new_error:.2f}", new_error
+
+
+def recent_rows(dates: np.ndarray, window_days: int) -> np.ndarray:
+    """末尾window_days日分の行の位置を返す（追加学習に使うデータ）"""
+    days = to_days(dates)
+    return np.flatnonzero(days > days[-1] - np.timedelta64(window_days, "D"))
+
+
+def make_training_state(
+    mode: str,
+    reason: str,
+    model: Union[LGBMRegressor, lgb.Booster],
+    dates: np.ndarray,
+    prev_state: Union[Dict[str, Any], None],
+    new_error: Union[float, None],
+    train_seconds: float,
+) -> Dict[str, Any]:
+    """モデルと一緒に保存する学習状態を作成する
+
+    Args:
+        mode: 学習方法（"warm"、"full"または"reuse"）
+        reason: 学習方法を決めた理由
+        model: 学習したモデル
+        dates: 学習データの各行の日付
+        prev_state: 前回のモデルの学習状態
+        new_error: 新しい日付に対する前回のモデルの予測誤差
+        train_seconds: 学習にかかった秒数
+
+    Returns:
+        Dict[str, Any]: 学習状態
+    """
+    last_train_date = str(to_days(dates)[-1])
+    prev_state = prev_state or {}
+    history = prev_state.get("forecast_errors", []) + ([new_error] if new_error is not None else [])
+    return {
+        "mode": mode,
+        "reason": reason,
+        "last_train_date": last_train_date,
+        "last_full_retrain_date": last_train_date if mode == "full" else prev_state["last_full_retrain_date"],
+        "warm_starts_since_full": 0
+        if mode == "full"
+        else prev_state.get("warm_starts_since_full", 0) + int(mode == "warm"),
+        "num_trees": as_booster(model).num_trees(),
+        "forecast_errors": history[-MAX_ERROR_HISTORY:],
+        "train_seconds": train_seconds,
+    }
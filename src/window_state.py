@@ -0,0 +1,280 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger()
+
+# ラグ・移動窓特徴量の対象となる系列と集計方法
+# 各系列はリングバッファで直近max(WINDOWS)日分だけ保持する
+WINDOW_AGGREGATIONS: Dict[str, List[str]] = {
+    "max_power": ["mean", "max"],
+    "max_temp": ["mean", "max"],
+    "cdd": ["sum"],
+    "hdd": ["sum"],
+}
+WINDOWS = [7, 28]
+LAG_FEATURES = ["max_power_lag1"]
+WINDOW_FEATURES = LAG_FEATURES + [
+    f"{series}_{agg}_{window}" for series, aggs in WINDOW_AGGREGATIONS.items() for window in WINDOWS for agg in aggs
+]
+STATE_FILENAME = "window_state.json"
+
+
+def compute_window_features(
+    df: pd.DataFrame,
+    date_col: str = "date",
+    group_col: Union[str, None] = None,
+) -> pd.DataFrame:
+    """全履歴からラグ・移動窓特徴量を計算する（初回計算やインクリメンタル計算の検証に使用する）
+    各日の特徴量はその日より前の観測日だけから計算する（当日の値は含まない）
+
+    Args:
+        df: date列と対象系列の列を含むデータフレーム
+        date_col: 日付列の名前
+        group_col: 系列を分ける列の名前（エリアごとなど）。指定した場合はグループごとに計算する
+
+    Returns:
+        pd.DataFrame: 入力と同じインデックスを持つラグ・移動窓特徴量のデータフレーム
+    """
+    if group_col is not None:
+        groups = [compute_window_features(group, date_col) for _, group in df.groupby(group_col, sort=False)]
+        return pd.concat(groups).reindex(df.index) if groups else compute_window_features(df, date_col)
+    sorted_df = df.sort_values(date_col, kind="stable")
+    features = {"max_power_lag1": sorted_df["max_power"].astype("float64").shift(1)}
+    for series, aggs in WINDOW_AGGREGATIONS.items():
+        shifted = sorted_df[series].astype("float64").shift(1)
+        for window in WINDOWS:
+            rolling = shifted.rolling(window, min_periods=1)
+            for agg in aggs:
+                features[f"{series}_{agg}_{window}"] = getattr(rolling, agg)()
+    return pd.DataFrame(features, index=sorted_df.index)[WINDOW_FEATURES].reindex(df.index)
+
+
+def _split_s3_uri(uri: str) -> Tuple[str, str]:
+    """s3://bucket/key形式のURIをバケット名とキーに分割する"""
+    bucket, _, key = uri[len("s3://") :].partition("/")
+    return bucket, key
+
+
+class WindowState:
+    """系列ごとのリングバッファで直近の観測値を保持し、ラグ・移動窓特徴量を日単位で更新するクラス
+    日次の前処理では新しい日だけでstateを更新し（O(新しい日数)）、推論時も同じstateから特徴量を作成する
+    """
+
+    def __init__(self, capacity: int = max(WINDOWS)) -> None:
+        """
+        Args:
+            capacity (int): リングバッファに保持する日数
+        """
+        self.capacity = capacity
+        self.series = list(WINDOW_AGGREGATIONS)
+        self.buffer = np.full((len(self.series), capacity), np.nan)
+        # 次に書き込む位置と保持している日数
+        self.position = 0
+        self.count = 0
+        self.last_date: Union[pd.Timestamp, None] = None
+
+    def _recent(self, window: int) -> np.ndarray:
+        """直近window日分の値を新しい順に返す（shape: 系列数 × 日数）"""
+        size = min(window, self.count)
+        index = (self.position - 1 - np.arange(size)) % self.capacity
+        return self.buffer[:, index]
+
+    def current_features(self) -> Dict[str, float]:
+        """最後に更新した日の翌日に対するラグ・移動窓特徴量を返す
+
+        Returns:
+            Dict[str, float]: 特徴量名と値の辞書
+        """
+        features = {"max_power_lag1": self._recent(1)[0, 0] if self.count else np.nan}
+        for window in WINDOWS:
+            recent = self._recent(window)
+            for i, series in enumerate(self.series):
+                values = recent[i][~np.isnan(recent[i])]
+                for agg in WINDOW_AGGREGATIONS[series]:
+                    features[f"{series}_{agg}_{window}"] = getattr(np, agg)(values) if values.size else np.nan
+        return {name: features[name] for name in WINDOW_FEATURES}
+
+    def push(self, date: pd.Timestamp, values: Dict[str, float]) -> None:
+        """1日分の観測値をリングバッファに追加する
+
+        Args:
+            date: 観測日
+            values: 系列名と値の辞書（存在しない系列は欠損値として扱う）
+        """
+        self.buffer[:, self.position] = [values.get(series, np.nan) for series in self.series]
+        self.position = (self.position + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.last_date = pd.Timestamp(date)
+
+    def update(self, df: pd.DataFrame, date_col: str = "date") -> pd.DataFrame:
+        """新しい日のデータでstateを更新し、各日のラグ・移動窓特徴量を返す
+        最後に更新した日以前のデータは処理済みとして無視する
+
+        Args:
+            df: date列と対象系列の列を含むデータフレーム
+            date_col: 日付列の名前
+
+        Returns:
+            pd.DataFrame: 新しい日の行に対するラグ・移動窓特徴量（インデックスは入力と同じ）
+        """
+        new_df = df if self.last_date is None else df[df[date_col] > self.last_date]
+        if len(new_df) < len(df):
+            logger.info(f"Skipped {len(df) - len(new_df)} rows already included in the window state")
+        new_df = new_df.sort_values(date_col, kind="stable")
+
+        columns = [series for series in self.series if series in new_df.columns]
+        rows = []
+        for date, *values in new_df[[date_col, *columns]].itertuples(index=False):
+            rows.append(self.current_features())
+            self.push(date, dict(zip(columns, values, strict=True)))
+        return pd.DataFrame(rows, index=new_df.index, columns=WINDOW_FEATURES, dtype="float64")
+
+    def features_for_dates(self, dates: pd.Series) -> pd.DataFrame:
+        """推論用に、各行の日付に対するラグ・移動窓特徴量を返す
+        stateから正しく計算できるのは最終日の翌日の特徴量だけのため、それ以外の日付の行は欠損値にして警告を出す
+
+        Args:
+            dates: 各行の日付
+
+        Returns:
+            pd.DataFrame: ラグ・移動窓特徴量のデータフレーム（インデックスはdatesと同じ）
+        """
+        features = pd.DataFrame(np.nan, index=dates.index, columns=WINDOW_FEATURES, dtype="float64")
+        if self.last_date is None:
+            logger.warning("Window state is empty; window features are left missing")
+            return features
+        next_date = self.last_date + pd.Timedelta(days=1)
+        matched = pd.to_datetime(dates).dt.normalize() == next_date
+        if matched.any():
+            current = self.current_features()
+            features.loc[matched, WINDOW_FEATURES] = [current[name] for name in WINDOW_FEATURES]
+        if not matched.all():
+            other_dates = sorted({str(date)[:10] for date in dates[~matched]})
+            logger.warning(
+                f"Window features are only available for {next_date:%Y-%m-%d} (state last date + 1); "
+                f"left missing for {other_dates}",
+            )
+        return features
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame, date_col: str = "date") -> "WindowState":
+        """全履歴の末尾からstateを作成する
+
+        Args:
+            df: date列と対象系列の列を含むデータフレーム
+            date_col: 日付列の名前
+
+        Returns:
+            WindowState: 作成したstate
+        """
+        state = cls()
+        tail = df.sort_values(date_col, kind="stable").tail(state.capacity)
+        state.update(tail, date_col=date_col)
+        return state
+
+    def to_dict(self) -> Dict:
+        """stateを辞書に変換する（古い順に並べ替えて保存する）"""
+        ordered = self._recent(self.capacity)[:, ::-1]
+        return {
+            "capacity": self.capacity,
+            "series": self.series,
+            "last_date": None if self.last_date is None else self.last_date.strftime("%Y-%m-%d"),
+            "values": [[None if np.isnan(v) else float(v) for v in row] for row in ordered],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "WindowState":
+        """辞書からstateを復元する"""
+        state = cls(capacity=data["capacity"])
+        if data["series"] != state.series:
+            msg = f"Window state series mismatch: {data['series']} != {state.series}"
+            raise ValueError(msg)
+        values = np.array([[np.nan if v is None else v for v in row] for row in data["values"]], dtype="float64")
+        state.count = values.shape[1]
+        state.buffer[:, : state.count] = values
+        state.position = state.count % state.capacity
+        state.last_date = None if data["last_date"] is None else pd.Timestamp(data["last_date"])
+        return state
+
+    def save(self, uri: str) -> None:
+        """stateをJSONで保存する
+
+        Args:
+            uri: 保存先（ローカルのディレクトリまたはs3://で始まるプレフィックス）
+        """
+        body = json.dumps(self.to_dict())
+        if uri.startswith("s3://"):
+            # S3を使う場合のみboto3が必要になるため、ここでインポートする
+            import boto3
+
+            bucket, key = _split_s3_uri(uri.rstrip("/") + f"/{STATE_FILENAME}")
+            boto3.client("s3").put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"))
+        else:
+            Path(uri).mkdir(parents=True, exist_ok=True)
+            (Path(uri) / STATE_FILENAME).write_text(body)
+        logger.info(f"Saved window state up to {self.last_date} to {uri}")
+
+    @classmethod
+    def load(cls, uri: str) -> Union["WindowState", None]:
+        """保存されたstateを読み込む
+
+        Args:
+            uri: 保存先（ローカルのディレクトリまたはs3://で始まるプレフィックス）
+
+        Returns:
+            Union[WindowState, None]: 読み込んだstate（存在しない場合はNone）
+        """
+        if uri.startswith("s3://"):
+            import boto3
+
+            bucket, key = _split_s3_uri(uri.rstrip("/") + f"/{STATE_FILENAME}")
+            s3_client = boto3.client("s3")
+            try:
+                body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+            except s3_client.exceptions.NoSuchKey:
+                return None
+        else:
+            path = Path(uri) / STATE_FILENAME
+            if not path.exists():
+                return None
+            body = path.read_text()
+        return cls.from_dict(json.loads(body))
+
+
+def verify_incremental(
+    history_df: pd.DataFrame,
+    incremental_features: pd.DataFrame,
+    date_col: str = "date",
+    tolerance: float = 1e-6,
+) -> float:
+    """インクリメンタルに計算した特徴量を全履歴からの再計算結果と比較する
+
+    Args:
+        history_df: 全履歴のデータフレーム（incremental_featuresの行を含む）
+        incremental_features: インクリメンタルに計算した特徴量（history_dfと同じdate列を持つ）
+        date_col: 日付列の名前
+        tolerance: 許容する差の最大値
+
+    Returns:
+        float: 特徴量の差の最大値
+
+    Raises:
+        ValueError: 差がtoleranceを超えた場合
+    """
+    full = compute_window_features(history_df, date_col=date_col)
+    full.index = history_df[date_col].to_numpy()
+    incremental = incremental_features.set_index(date_col)[WINDOW_FEATURES]
+    expected = full.loc[incremental.index, WINDOW_FEATURES]
+    diff = np.abs(expected.to_numpy() - incremental.to_numpy())
+    both_nan = np.isnan(expected.to_numpy()) & np.isnan(incremental.to_numpy())
+    max_diff = float(np.nanmax(np.where(both_nan, 0.0, np.where(np.isnan(diff), np.inf, diff)), initial=0.0))
+    logger.info(f"Window features max abs diff against full recompute: {max_diff}")
+    if max_diff > tolerance:
+        msg = f"Incremental window features differ from full recompute (max abs diff: {max_diff})"
+        raise ValueError(msg)
+    return max_diff
@@ -36,6 +36,10 @@ resource "aws_glue_catalog_table" "feature_table" {
       name = "date"
       type = "string"
     }
+    columns {
+      name = "area"
+      type = "string"
+    }
     columns {
       name = "weather_category"
       type = "string"
@@ -116,6 +120,72 @@ resource "aws_glue_catalog_table" "feature_table" {
       name = "holiday"
       type = "int"
     }
+    columns {
+      name = "max_power_lag1"
+      type = "double"
+    }
+    columns {
+      name = "max_power_mean_7"
+      type = "double"
+    }
+    columns {
+      name = "max_power_max_7"
+      type = "double"
+    }
+    columns {
+      name = "max_power_mean_28"
+      type = "double"
+    }
+    columns {
+      name = "max_power_max_28"
+      type = "double"
+    }
+    columns {
+      name = "max_temp_mean_7"
+      type = "double"
+    }
+    columns {
+      name = "max_temp_max_7"
+      type = "double"
+    }
+    columns {
+      name = "max_temp_mean_28"
+      type = "double"
+    }
+    columns {
+      name = "max_temp_max_28"
+      type = "double"
+    }
+    columns {
+      name = "cdd_sum_7"
+      type = "double"
+    }
+    columns {
+      name = "cdd_sum_28"
+      type = "double"
+    }
+    columns {
+      name = "hdd_sum_7"
+      type = "double"
+    }
+    columns {
+      name = "hdd_sum_28"
+      type = "double"
+    }
+
+    # Feature Storeが追加するメタデータの列
+    columns {
+      name = "write_time"
+      type = "timestamp"
+    }
+    columns {
+      name = "api_invocation_time"
+      type = "timestamp"
+    }
+    columns {
+      name = "is_deleted"
+      type = "boolean"
+    }
   }
 
   parameters = {
@@ -147,6 +217,10 @@ resource "aws_sagemaker_feature_group" "power_features" {
     feature_name = "date"
     feature_type = "String"
   }
+  feature_definition {
+    feature_name = "area"
+    feature_type = "String"
+  }
   feature_definition {
     feature_name = "max_temp"
     feature_type = "Fractional"
@@ -227,6 +301,58 @@ resource "aws_sagemaker_feature_group" "power_features" {
     feature_name = "holiday"
     feature_type = "Integral"
   }
+  feature_definition {
+    feature_name = "max_power_lag1"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "max_power_mean_7"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "max_power_max_7"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "max_power_mean_28"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "max_power_max_28"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "max_temp_mean_7"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "max_temp_max_7"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "max_temp_mean_28"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "max_temp_max_28"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "cdd_sum_7"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "cdd_sum_28"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "hdd_sum_7"
+    feature_type = "Fractional"
+  }
+  feature_definition {
+    feature_name = "hdd_sum_28"
+    feature_type = "Fractional"
+  }
   # ... 特徴量を追加したら足していく ...
 
   # ===== オフラインストア設定 =====
@@ -0,0 +1,376 @@
+# noqa: INP001
+"""
+オフラインパイプラインの主要な処理の実行時間と最大メモリを、合成データの複数の規模で計測するベンチマーク
+ネットワークやAWSに接続せずに、test/synthetic_data.pyで作成したデータでローカルに実行できる
+
+- 処理（ケース）と規模（日数）の組ごとに新しいプロセスで計測する（前のケースのメモリやキャッシュの影響を受けない）
+- 計測する処理より前の段階（データの読み込み・特徴量の作成など）は計測の外で準備する
+- 結果は履歴のJSONに追記し、同じ設定の直前の結果と比べて悪化した場合は終了コード1で終わる
+
+Examples:
+    python test/benchmark.py --days 365 1825 3650
+    python test/benchmark.py --cases train evaluate_model --repeats 5 --threshold 0.3
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT_DIR / "src"
+sys.path.append(str(SRC_DIR))
+
+from training_profile import peak_rss_mb
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+# 計測する処理（パイプラインの順）
+CASES = [
+    "load_power_usage_data",
+    "load_emr_output",
+    "make_features",
+    "apply_encoders",
+    "train_test_split",
+    "train",
+    "evaluate_model",
+]
+# 悪化を判定する指標と、増加量の下限の引数名
+GATED_METRICS = {"seconds": "min_seconds", "peak_increase_mb": "min_mb"}
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    引数をパースする
+
+    Returns:
+        argparse.Namespace: パースされた引数
+    """
+    parser = argparse.ArgumentParser(description="オフラインパイプラインの処理の実行時間と最大メモリを計測する")
+    parser.add_argument("--days", type=int, nargs="+", default=[365, 1825, 3650], help="合成データの日数（規模）")
+    parser.add_argument("--areas", type=str, nargs="+", default=["tokyo"], help="合成データのエリア")
+    parser.add_argument("--cases", type=str, nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--repeats", type=int, default=5, help="1つのケースを繰り返す回数")
+    parser.add_argument("--n-estimators", type=int, default=200, help="trainケースの木の数")
+    parser.add_argument("--seed", type=int, default=0, help="合成データの乱数シード")
+    parser.add_argument("--work-dir", type=str, default="/tmp/power-forecasting-benchmark", help="合成データの保存先")  # noqa: S108
+    parser.add_argument("--history", type=str, default=str(ROOT_DIR / "test" / "benchmark_history.json"))
+    parser.add_argument("--threshold", type=float, default=0.2, help="悪化とみなす変化の割合")
+    parser.add_argument("--min-seconds", type=float, default=0.1, help="悪化とみなす時間の増加量の下限（秒）")
+    parser.add_argument("--min-mb", type=float, default=10.0, help="悪化とみなすメモリの増加量の下限（MB）")
+    parser.add_argument("--no-record", action="store_true", help="結果を履歴に追記しない")
+    return parser.parse_args()
+
+
+def reset_peak_rss() -> bool:
+    """最大常駐メモリ（VmHWM）を現在の常駐メモリに戻す（Linux以外など、戻せない場合はFalse）"""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        return False
+    return True
+
+
+def rss_mb() -> Tuple[float, float]:
+    """現在の常駐メモリと最大常駐メモリ（MB）を返す（/procがない場合はどちらもru_maxrss）"""
+    try:
+        status = Path("/proc/self/status").read_text()
+    except OSError:
+        return peak_rss_mb(), peak_rss_mb()
+    values = {}
+    for line in status.splitlines():
+        name, _, value = line.partition(":")
+        if name in {"VmRSS", "VmHWM"}:
+            values[name] = int(value.split()[0]) / 1024
+    return values["VmRSS"], values["VmHWM"]
+
+
+def generate_data(work_dir: Path, days: int, areas: List[str], seed: int) -> Path:
+    """合成データを作成する（同じ設定のデータがある場合は作り直さない）"""
+    data_dir = work_dir / f"days{days}_{'-'.join(areas)}_seed{seed}"
+    if not (data_dir / "_SUCCESS").exists():
+        subprocess.run(
+            [
+                sys.executable,
+                str(ROOT_DIR / "test" / "synthetic_data.py"),
+                "--output-dir",
+                str(data_dir),
+                "--days",
+                str(days),
+                "--areas",
+                *areas,
+                "--seed",
+                str(seed),
+            ],
+            check=True,
+        )
+        (data_dir / "_SUCCESS").touch()
+    return data_dir
+
+
+def load_config(areas: List[str]) -> Any:
+    """src/config.yamlを読み込む（複数エリアの場合はエリアの列をエンコードして学習データに残す）"""
+    from omegaconf import OmegaConf
+
+    from preprocess import load_config as load_yaml
+
+    config = load_yaml(str(SRC_DIR / "config.yaml"))
+    if len(areas) > 1:
+        config.area_column = "area"
+        config.encoders = [*OmegaConf.to_container(config.encoders), {"name": "Ordinal", "columns": ["area"]}]
+    return config
+
+
+def prepare(
+    case: str,
+    data_dir: Path,
+    areas: List[str],
+    n_estimators: int,
+) -> Tuple[Callable[[], Any], Callable[[Any], Any], int]:
+    """ケースの処理と、その処理に渡すデータを準備する（ケースより前の段階はここで実行する）
+    入力を書き換える処理があるため、繰り返すたびに入力をコピーする関数も返す（コピーの時間は計測に含めない）
+
+    Args:
+        case: ケース名
+        data_dir: 合成データのディレクトリ
+        areas: エリア
+        n_estimators: trainケースの木の数
+
+    Returns:
+        Tuple[Callable[[], Any], Callable[[Any], Any], int]: 入力を作成する関数、処理を実行する関数、処理する行数
+    """
+    if case == "load_power_usage_data":
+        from data_loader import DataLoader
+
+        loaders = [
+            DataLoader(str(data_dir / area / "weather_data.csv"), str(data_dir / area / "power_usage"))
+            for area in areas
+        ]
+        return lambda: loaders, lambda inputs: [loader.load_power_usage_data(max_workers=1) for loader in inputs], 0
+
+    from preprocess import EMR_COLUMNS, FeatureEngineering, load_emr_output
+
+    columns = [*EMR_COLUMNS, "area"] if len(areas) > 1 else EMR_COLUMNS
+    if case == "load_emr_output":
+        return lambda: str(data_dir / "emr"), lambda path: load_emr_output(path, columns=columns), 0
+
+    from window_state import compute_window_features
+
+    config = load_config(areas)
+    feature_engineering = FeatureEngineering(config)
+    data = load_emr_output(str(data_dir / "emr"), columns=columns)
+    if case == "make_features":
+        return data.copy, feature_engineering.make_features, len(data)
+
+    from dataprep_from_future_store import add_area_key, apply_encoders, train_test_split
+
+    features = feature_engineering.make_features(data)
+    group_col = "area" if len(areas) > 1 else None
+    features = pd.concat([features, compute_window_features(features, group_col=group_col)], axis=1)
+    if case == "apply_encoders":
+        return features.copy, lambda df: apply_encoders(df, config), len(features)
+
+    encoded = add_area_key(features, apply_encoders(features.copy(), config)[0], config.get("area_column"))
+    if case == "train_test_split":
+        return encoded.copy, lambda df: train_test_split(df, test_size=config.get("test_ratio", 0.2)), len(encoded)
+
+    from train import train
+
+    train_data, test_data = train_test_split(encoded, test_size=config.get("test_ratio", 0.2))
+    # dataprepのfeatures.txtと同じ列（先頭は目的変数。日付・エリアの列は除く）
+    feature_names = [name for name in train_data.columns if name not in {"date", "area"}]
+    X_train = train_data[feature_names[1:]].to_numpy()
+    y_train = train_data[feature_names[0]].to_numpy()
+    hyperparameters = {"n_estimators": n_estimators, "learning_rate": 0.1, "verbose": -1}
+    if case == "train":
+        return lambda: (X_train, y_train), lambda data: train(*data, hyperparameters), len(X_train)
+
+    from evaluate import evaluate_model, predict
+
+    booster = train(X_train, y_train, hyperparameters).booster_
+    X_test, y_true = test_data[feature_names[1:]], test_data[feature_names[0]]
+    output_path = str(data_dir / "evaluation")
+
+    def predict_and_evaluate(model: Any) -> None:
+        evaluate_model(y_true, predict(model, X_test, None), output_path)
+
+    return lambda: booster, predict_and_evaluate, len(X_test)
+
+
+def run_case(case: str, data_dir: str, areas: List[str], n_estimators: int, repeats: int) -> Dict[str, Any]:
+    """1つのケースを繰り返し実行し、実行時間と最大メモリを計測する（新しいプロセスで実行する）
+
+    Args:
+        case: ケース名
+        data_dir: 合成データのディレクトリ
+        areas: エリア
+        n_estimators: trainケースの木の数
+        repeats: 繰り返す回数
+
+    Returns:
+        Dict[str, Any]: 計測結果（時間は最小値と中央値、メモリは繰り返しの中の最大値）
+    """
+    logging.disable(logging.INFO)
+    make_input, run, rows = prepare(case, Path(data_dir), areas, n_estimators)
+    seconds = []
+    peak_increase = 0.0
+    peak = 0.0
+    for _ in range(repeats):
+        inputs = make_input()
+        reset_peak_rss()
+        before, _ = rss_mb()
+        start = time.perf_counter()
+        run(inputs)
+        seconds.append(time.perf_counter() - start)
+        _, repeat_peak = rss_mb()
+        peak = max(peak, repeat_peak)
+        peak_increase = max(peak_increase, repeat_peak - before)
+        del inputs
+    return {
+        "rows": rows,
+        "seconds": min(seconds),
+        "seconds_median": float(np.median(seconds)),
+        "seconds_max": max(seconds),
+        "peak_rss_mb": peak,
+        "peak_increase_mb": peak_increase,
+    }
+
+
+def find_baseline(history: List[Dict[str, Any]], settings: Dict[str, Any]) -> Union[Dict[str, Any], None]:
+    """同じ設定で実行した直前の結果を返す（ない場合はNone）"""
+    return next((run for run in reversed(history) if run["settings"] == settings), None)
+
+
+def compare_runs(
+    base: Dict[str, Any],
+    target: Dict[str, Any],
+    threshold: float = 0.2,
+    min_seconds: float = 0.1,
+    min_mb: float = 10.0,
+) -> List[Dict[str, Any]]:
+    """2回の実行のケース・規模ごとの時間とメモリの増加量を比較する
+    変化の割合がthresholdを超え、かつ増加量が下限以上の場合に悪化とみなす（ごく短い処理の揺らぎを除く）
+    時間は最小値で比べ、比較元の繰り返しの最大値以下の場合も悪化とみなさない（CPUの速さの揺らぎの範囲内とみなす）
+
+    Args:
+        base: 比較元の実行結果
+        target: 比較先の実行結果
+        threshold: 悪化とみなす変化の割合
+        min_seconds: 悪化とみなす時間の増加量の下限（秒）
+        min_mb: 悪化とみなすメモリの増加量の下限（MB）
+
+    Returns:
+        List[Dict[str, Any]]: ケース・規模・指標ごとの値・変化の割合・悪化したかどうか
+    """
+    minimums = {"min_seconds": min_seconds, "min_mb": min_mb}
+    base_results = {(result["case"], result["days"]): result for result in base["results"]}
+    rows = []
+    for result in target["results"]:
+        base_result = base_results.get((result["case"], result["days"]))
+        if base_result is None:
+            continue
+        for metric, minimum in GATED_METRICS.items():
+            base_value, target_value = base_result[metric], result[metric]
+            change = target_value / base_value - 1 if base_value else None
+            regressed = change is not None and change > threshold and target_value - base_value >= minimums[minimum]
+            if metric == "seconds":
+                regressed = regressed and target_value > base_result["seconds_max"]
+            rows.append(
+                {
+                    "case": result["case"],
+                    "days": result["days"],
+                    "metric": metric,
+                    "base": base_value,
+                    "target": target_value,
+                    "change": change,
+                    "regressed": regressed,
+                },
+            )
+    return rows
+
+
+def git_commit() -> Union[str, None]:
+    """現在のコミットのハッシュを返す（gitがない場合はNone）"""
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)  # noqa: S607
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # 比較できるのは同じ設定・同じCPU数で実行した結果だけ
+    settings = {
+        "days": args.days,
+        "areas": args.areas,
+        "cases": args.cases,
+        "repeats": args.repeats,
+        "n_estimators": args.n_estimators,
+        "seed": args.seed,
+        "cpu_count": os.cpu_count(),
+    }
+    run_result = {
+        "started_at": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),  # noqa: UP017
+        "commit": git_commit(),
+        "settings": settings,
+        "results": [],
+    }
+
+    # 各ケースを新しいプロセス（spawn）で実行し、前のケースのメモリを引き継がないようにする
+    context = multiprocessing.get_context("spawn")
+    for days in args.days:
+        data_dir = generate_data(Path(args.work_dir), days, args.areas, args.seed)
+        for case in args.cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(
+                    run_case,
+                    case,
+                    str(data_dir),
+                    args.areas,
+                    args.n_estimators,
+                    args.repeats,
+                ).result()
+            run_result["results"].append({"case": case, "days": days, **result})
+            logger.info(
+                f"{case:<24}{days:>7} days  {result['seconds']:>9.3f} s  "
+                f"peak {result['peak_rss_mb']:>8.1f} MB (+{result['peak_increase_mb']:.1f} MB)",
+            )
+
+    history_path = Path(args.history)
+    history = json.loads(history_path.read_text()) if history_path.exists() else []
+    baseline = find_baseline(history, settings)
+    rows = []
+    if baseline is None:
+        logger.info("No previous run with the same settings; nothing to compare")
+    else:
+        logger.info(f"Comparing with the run at {baseline['started_at']} (commit {baseline['commit']})")
+        rows = compare_runs(baseline, run_result, args.threshold, args.min_seconds, args.min_mb)
+        logger.info(f"{'case':<24}{'days':>7}{'metric':>18}{'base':>12}{'target':>12}{'change':>10}")
+        for row in rows:
+            change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+            mark = "  REGRESSION" if row["regressed"] else ""
+            logger.info(
+                f"{row['case']:<24}{row['days']:>7}{row['metric']:>18}"
+                f"{row['base']:>12.3f}{row['target']:>12.3f}{change:>10}{mark}",
+            )
+
+    if not args.no_record:
+        history.append(run_result)
+        history_path.write_text(json.dumps(history, indent=2))
+        logger.info(f"Appended the results to {history_path}")
+    # 悪化した指標がある場合は終了コード1で終わる（CIで使えるようにする）
+    sys.exit(1 if any(row["regressed"] for row in rows) else 0)
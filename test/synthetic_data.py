@@ -0,0 +1,279 @@
+# noqa: INP001
+"""
+規模を変えた検証用に、実データと同じ形式の合成データを作成するスクリプト
+ネットワークに接続せずに、乱数シードを固定して任意の期間・エリア数のデータを再現性のある形で作成できる
+
+出力（output_dir以下）
+- <エリア>/weather_data.csv: 気象庁のダウンロード形式のCSV（Shift-JIS、DataLoader.load_weather_dataで読み込める）
+- <エリア>/power_usage/YYYYMM_power_usage.zip: でんき予報の日別CSV（5分間隔値を含む）を月ごとにまとめたZIP
+- emr/dt=YYYY-MM-DD/part-0.snappy.parquet: EMRの出力と同じ形式（preprocess.load_emr_outputで読み込める）
+  エリアが複数の場合はarea列を含める（config.yamlのarea_columnに指定する）
+
+Examples:
+    python test/synthetic_data.py --output-dir /tmp/synthetic --start-date 2000-01-01 --days 9125 --areas tokyo kansai
+"""
+
+import argparse
+import logging
+import sys
+import zipfile
+from pathlib import Path
+from typing import Dict, List
+
+import holidays
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from power_usage_parser import SLOTS_PER_DAY, load_shape_aggregates
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+# 天気概況の文字列（晴れ・曇り・雨の系統ごと。先頭ほど出現しやすい）
+WEATHER_STRINGS = {
+    "sunny": ["晴", "快晴", "晴後曇", "晴時々曇", "晴一時曇", "薄曇", "晴後一時雨", "晴、雷を伴う", "晴一時雨"],
+    "cloudy": ["曇", "曇時々晴", "曇後晴", "曇一時雨", "曇後雨", "曇時々雨", "霧", "曇、雷を伴う", "曇一時雪"],
+    "rainy": ["雨", "大雨", "雨時々曇", "雨後曇", "雨後晴", "雷雨", "雨、雷を伴う", "みぞれ", "雪", "大雪"],
+}
+# 天気の系統の遷移確率（前日の系統 → 当日の系統。晴れ・曇り・雨の順）
+WEATHER_TRANSITIONS = np.array([[0.6, 0.3, 0.1], [0.35, 0.4, 0.25], [0.3, 0.35, 0.35]])
+# エリアごとの年平均気温（℃）と電力需要の規模（万kW）。未定義のエリアは東京の値を使う
+AREA_PROFILES = {
+    "tokyo": {"temp": 16.5, "scale": 3200.0},
+    "kansai": {"temp": 17.0, "scale": 1700.0},
+    "chubu": {"temp": 16.0, "scale": 1500.0},
+    "tohoku": {"temp": 12.5, "scale": 900.0},
+    "kyushu": {"temp": 17.5, "scale": 1000.0},
+    "hokkaido": {"temp": 9.0, "scale": 450.0},
+}
+# でんき予報の日別CSVで5分間隔値のヘッダーがある行（0始まり）。元のDataLoaderはskiprows=54で読み込んでいた
+POWER_USAGE_HEADER_ROW = 54
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    引数をパースする
+
+    Returns:
+        argparse.Namespace: パースされた引数
+    """
+    parser = argparse.ArgumentParser(description="気象データ・電力使用量・EMRの出力と同じ形式の合成データを作成する")
+    parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument("--start-date", type=str, default="2022-01-01")
+    parser.add_argument("--days", type=int, default=1095)
+    parser.add_argument("--areas", type=str, nargs="+", default=["tokyo"], help="エリア名（複数指定可）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seasonal-amplitude", type=float, default=10.0, help="気温の季節変動の振幅（℃）")
+    parser.add_argument("--annual-growth", type=float, default=0.0, help="電力需要の年間の増加率")
+    parser.add_argument("--holiday-factor", type=float, default=0.85, help="土日祝日の電力需要の比率")
+    parser.add_argument("--weather-variety", type=int, default=5, help="天気の系統ごとに使う天気概況の文字列の数")
+    parser.add_argument("--missing-weather-rate", type=float, default=0.0, help="天気概況が欠損する日の割合")
+    parser.add_argument(
+        "--outputs",
+        type=str,
+        nargs="+",
+        choices=["weather", "power_usage", "emr"],
+        default=["weather", "power_usage", "emr"],
+    )
+    return parser.parse_args()
+
+
+def generate_area(
+    area: str,
+    dates: pd.DatetimeIndex,
+    rng: np.random.Generator,
+    seasonal_amplitude: float = 10.0,
+    annual_growth: float = 0.0,
+    holiday_factor: float = 0.85,
+    weather_variety: int = 5,
+    missing_weather_rate: float = 0.0,
+) -> Dict[str, np.ndarray]:
+    """1つのエリアの日ごとの気象データと5分間隔の電力使用量を作成する
+    - 気温: 年周期の季節変動 + 前日と相関のある揺らぎ。雨の日は日較差が小さい
+    - 天気: 晴れ・曇り・雨の系統をマルコフ連鎖で遷移させ、系統ごとの文字列から選ぶ
+    - 電力需要: 冷房・暖房需要（気温の18℃からの差） x 曜日・祝日 x 年間の増加率。朝・夕のピークを持つ日内変動
+
+    Args:
+        area: エリア名
+        dates: 日付
+        rng: 乱数生成器
+        seasonal_amplitude: 気温の季節変動の振幅（℃）
+        annual_growth: 電力需要の年間の増加率
+        holiday_factor: 土日祝日の電力需要の比率
+        weather_variety: 天気の系統ごとに使う天気概況の文字列の数
+        missing_weather_rate: 天気概況が欠損する日の割合
+
+    Returns:
+        Dict[str, np.ndarray]: max_temp, min_temp, weather, intraday（日数 x 288）の辞書
+    """
+    profile = AREA_PROFILES.get(area, AREA_PROFILES["tokyo"])
+    n = len(dates)
+    day_of_year = dates.dayofyear.to_numpy()
+
+    # 天気の系統（0: 晴れ、1: 曇り、2: 雨）
+    states = np.empty(n, dtype=np.int64)
+    state = 0
+    draws = rng.random(n)
+    cumulative = WEATHER_TRANSITIONS.cumsum(axis=1)
+    for i in range(n):
+        state = int(np.searchsorted(cumulative[state], draws[i]))
+        states[i] = state
+    choices = {key: strings[:weather_variety] for key, strings in WEATHER_STRINGS.items()}
+    weights = {key: 1 / np.arange(1, len(strings) + 1) for key, strings in choices.items()}
+    weather = np.empty(n, dtype=object)
+    for index, key in enumerate(WEATHER_STRINGS):
+        rows = np.flatnonzero(states == index)
+        weather[rows] = rng.choice(choices[key], size=len(rows), p=weights[key] / weights[key].sum())
+    weather[rng.random(n) < missing_weather_rate] = None
+
+    # 気温（前日と相関のある揺らぎを加える）
+    noise = rng.normal(0, 2.0, n)
+    for i in range(1, n):
+        noise[i] += 0.6 * noise[i - 1]
+    mean_temp = profile["temp"] - seasonal_amplitude * np.cos(2 * np.pi * (day_of_year - 20) / 365.25) + noise
+    temp_range = np.where(states == 2, 4.0, np.where(states == 1, 6.5, 9.0)) + rng.normal(0, 1.0, n)
+    max_temp = np.round(mean_temp + temp_range / 2, 1)
+    min_temp = np.round(mean_temp - temp_range / 2, 1)
+
+    # 日ごとの電力需要の水準
+    jp_holidays = holidays.Japan(years=range(dates.year.min(), dates.year.max() + 1))  # type: ignore[attr-defined]
+    off_day = (dates.dayofweek >= 5) | np.array([date in jp_holidays for date in dates.date])
+    years = (dates - dates[0]).days.to_numpy() / 365.25
+    level = (
+        profile["scale"]
+        * (1 + 0.012 * np.maximum(max_temp - 18, 0) ** 1.4 + 0.018 * np.maximum(18 - mean_temp, 0) ** 1.2)
+        * np.where(off_day, holiday_factor, 1.0)
+        * (1 + annual_growth) ** years
+    )
+
+    # 日内変動（朝・夕のピークと夜間の谷）。夏は昼、冬は夕方のピークが高い
+    hours = np.arange(SLOTS_PER_DAY) / (SLOTS_PER_DAY / 24)
+    morning = np.exp(-(((hours - 10) / 3) ** 2))
+    evening = np.exp(-(((hours - 18) / 2.5) ** 2))
+    summer = (np.cos(2 * np.pi * (day_of_year - 210) / 365.25)[:, None] + 1) / 2
+    shape = 0.65 + 0.3 * (summer * morning + (1 - summer) * evening) + 0.1 * morning
+    intraday = level[:, None] * shape * (1 + rng.normal(0, 0.01, (n, SLOTS_PER_DAY)))
+    return {"max_temp": max_temp, "min_temp": min_temp, "weather": weather, "intraday": intraday.astype(np.float32)}
+
+
+def weather_csv(area: str, dates: pd.DatetimeIndex, data: Dict[str, np.ndarray]) -> bytes:
+    """気象庁のダウンロード形式（ヘッダー6行、値・品質情報・均質番号の列）のCSVを作成する"""
+    lines = [
+        # 同じ引数で同じファイルになるように、ダウンロード時刻は最終日の翌日にする
+        f"ダウンロードした時刻：{dates[-1] + pd.Timedelta(days=1):%Y/%m/%d} 00:00:00",
+        "",
+        "," + ",".join([area] * 8),
+        "年月日,最高気温(℃),最高気温(℃),最高気温(℃),最低気温(℃),最低気温(℃),最低気温(℃),"
+        "天気概況(昼：06時〜18時),天気概況(昼：06時〜18時)",
+        ",,品質情報,均質番号,,品質情報,均質番号,,品質情報",
+        ",,,,,,,,",
+    ]
+    rows = zip(dates, data["max_temp"], data["min_temp"], data["weather"], strict=True)
+    for date, max_temp, min_temp, weather in rows:
+        lines.append(f"{date.year}/{date.month}/{date.day},{max_temp},8,1,{min_temp},8,1,{weather or ''},8")
+    return ("\r\n".join(lines) + "\r\n").encode("shift-jis")
+
+
+def power_usage_csv(date: pd.Timestamp, intraday: np.ndarray) -> bytes:
+    """でんき予報の日別CSV（供給力・予想最大電力・1時間値・5分間隔値のブロック）を作成する"""
+    hourly = intraday.reshape(24, -1).mean(axis=1)
+    peak = int(intraday.max())
+    lines = [
+        f"{date:%Y/%m/%d} 23:55 UPDATE",
+        "ピーク時供給力(万kW),時台,供給力情報更新日,供給力情報更新時刻",
+        f"{int(peak * 1.15)},{int(intraday.argmax()) // 12}:00,{date.month}/{date.day},8:30",
+        "",
+        "予想最大電力(万kW),時台,予想最大電力情報更新日,予想最大電力情報更新時刻",
+        f"{peak},{int(intraday.argmax()) // 12}:00,{date.month}/{date.day},8:30",
+        "",
+        "使用率ピーク時供給力(万kW),時台,使用率(%),供給力情報更新日,供給力情報更新時刻",
+        f"{int(peak * 1.15)},{int(intraday.argmax()) // 12}:00,{int(100 / 1.15)},{date.month}/{date.day},8:30",
+        "",
+        "DATE,TIME,当日実績(万kW),予測値(万kW),使用率(%),供給力(万kW)",
+    ]
+    date_str = f"{date.year}/{date.month}/{date.day}"
+    lines += [
+        f"{date_str},{hour}:00,{int(value)},{int(value)},{int(value / peak / 1.15 * 100)},{int(peak * 1.15)}"
+        for hour, value in enumerate(hourly)
+    ]
+    # 実データでは1時間値と5分間隔値の間に別のブロックがあるため、空行で5分間隔値のヘッダーを同じ行にそろえる
+    lines += [""] * (POWER_USAGE_HEADER_ROW - len(lines))
+    lines += ["DATE,TIME,当日実績(５分間隔値)(万kW),太陽光発電実績(５分間隔値)(万kW)"]
+    lines += [f"{date_str},{i // 12}:{i % 12 * 5:02d},{int(value)},0" for i, value in enumerate(intraday)]
+    return ("\r\n".join(lines) + "\r\n").encode("shift-jis")
+
+
+def write_power_usage_zips(output_dir: Path, dates: pd.DatetimeIndex, intraday: np.ndarray) -> int:
+    """月ごとのZIPファイル（YYYYMM_power_usage.zip に YYYYMMDD_power_usage.csv をまとめたもの）を書き出す"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    months = dates.strftime("%Y%m")
+    for month in np.unique(months):
+        with zipfile.ZipFile(output_dir / f"{month}_power_usage.zip", "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for i in np.flatnonzero(months == month):
+                zip_file.writestr(f"{dates[i]:%Y%m%d}_power_usage.csv", power_usage_csv(dates[i], intraday[i]))
+    return len(np.unique(months))
+
+
+def write_emr_output(output_dir: Path, dates: pd.DatetimeIndex, areas: List[str], data: List[Dict]) -> None:
+    """EMRの出力と同じ形式（dt=パーティション、最大電力と負荷形状の集計値）のParquetを書き出す"""
+    frames = []
+    for area, area_data in zip(areas, data, strict=True):
+        frame = pd.DataFrame(
+            {
+                "date": dates.date,
+                "max_temp": area_data["max_temp"],
+                "min_temp": area_data["min_temp"],
+                "weather": area_data["weather"],
+                "max_power": np.nanmax(area_data["intraday"], axis=1).astype("int64"),
+                **load_shape_aggregates(area_data["intraday"]),
+            },
+        )
+        if len(areas) > 1:
+            frame["area"] = area
+        frames.append(frame)
+    df = pd.concat(frames, ignore_index=True)
+    df["dt"] = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
+    ds.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        output_dir,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("dt", pa.string())]), flavor="hive"),
+        basename_template="part-{i}.snappy.parquet",
+        existing_data_behavior="delete_matching",
+        max_partitions=len(dates) + 1,
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    output_dir = Path(args.output_dir)
+    dates = pd.date_range(args.start_date, periods=args.days, freq="D")
+    rng = np.random.default_rng(args.seed)
+
+    data = []
+    for area in args.areas:
+        area_data = generate_area(
+            area,
+            dates,
+            rng,
+            seasonal_amplitude=args.seasonal_amplitude,
+            annual_growth=args.annual_growth,
+            holiday_factor=args.holiday_factor,
+            weather_variety=args.weather_variety,
+            missing_weather_rate=args.missing_weather_rate,
+        )
+        data.append(area_data)
+        if "weather" in args.outputs:
+            (output_dir / area).mkdir(parents=True, exist_ok=True)
+            (output_dir / area / "weather_data.csv").write_bytes(weather_csv(area, dates, area_data))
+        if "power_usage" in args.outputs:
+            n_zips = write_power_usage_zips(output_dir / area / "power_usage", dates, area_data["intraday"])
+            logger.info(f"Wrote {n_zips} power usage ZIP files for {area}")
+    if "emr" in args.outputs:
+        write_emr_output(output_dir / "emr", dates, args.areas, data)
+    logger.info(f"Generated {args.days} days x {len(args.areas)} areas ({', '.join(args.outputs)}) under {output_dir}")
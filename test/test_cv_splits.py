@@ -0,0 +1,87 @@
+import sys
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pytest
+from sklearn.model_selection import TimeSeriesSplit
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from cv_splits import time_series_splits
+
+
+def make_dates(n_days: int, rows_per_date: int = 1) -> np.ndarray:
+    """昇順に並んだ日付（1日あたりrows_per_date行。複数エリアのデータを想定）を作成する"""
+    return np.repeat(np.datetime64("2024-01-01") + np.arange(n_days), rows_per_date)
+
+
+def test_fold_boundaries() -> None:
+    dates = make_dates(20, rows_per_date=2)
+
+    folds = list(time_series_splits(dates, n_splits=3, horizon=4, gap=1))
+
+    assert len(folds) == 3
+    for fold, (train_index, valid_index) in enumerate(folds):
+        # 検証期間は末尾から4日ずつ並び、学習期間は先頭から検証期間の1日前（gap）までの拡張ウィンドウ
+        valid_start = 8 + fold * 4
+        np.testing.assert_array_equal(train_index, np.arange(0, (valid_start - 1) * 2))
+        np.testing.assert_array_equal(valid_index, np.arange(valid_start * 2, (valid_start + 4) * 2))
+
+
+def test_rolling_window_boundaries() -> None:
+    dates = make_dates(20)
+
+    folds = list(time_series_splits(dates, n_splits=2, horizon=5, gap=2, window=6))
+
+    np.testing.assert_array_equal(folds[0][0], np.arange(2, 8))
+    np.testing.assert_array_equal(folds[0][1], np.arange(10, 15))
+    np.testing.assert_array_equal(folds[1][0], np.arange(7, 13))
+    np.testing.assert_array_equal(folds[1][1], np.arange(15, 20))
+
+
+@pytest.mark.parametrize("gap", [0, 3])
+def test_no_leakage(gap: int) -> None:
+    dates = make_dates(60, rows_per_date=3)
+
+    for train_index, valid_index in time_series_splits(dates, n_splits=4, horizon=7, gap=gap):
+        train_dates, valid_dates = dates[train_index], dates[valid_index]
+        # 同じ日付の行（複数エリア）が学習と検証の両方に入らない
+        assert np.intersect1d(train_dates, valid_dates).size == 0
+        # 学習期間の最終日と検証期間の初日の間にgap日空いている
+        assert (valid_dates.min() - train_dates.max()).astype(int) == gap + 1
+        # 同じ日付の行はすべて同じ側に入る
+        assert np.isin(dates, valid_dates).sum() == len(valid_index)
+
+
+@pytest.mark.parametrize(
+    ("n_splits", "horizon", "gap", "window"),
+    [(5, None, 0, None), (3, 10, 0, None), (4, 5, 2, None), (3, 7, 1, 30)],
+)
+def test_matches_sklearn_time_series_split(
+    n_splits: int,
+    horizon: Union[int, None],
+    gap: int,
+    window: Union[int, None],
+) -> None:
+    # 1日1行の場合は、行単位で分割するsklearnのTimeSeriesSplitと同じ分割になる
+    dates = make_dates(100)
+    expected = TimeSeriesSplit(n_splits=n_splits, test_size=horizon, gap=gap, max_train_size=window).split(dates)
+
+    for (train_index, valid_index), (expected_train, expected_valid) in zip(
+        time_series_splits(dates, n_splits=n_splits, horizon=horizon, gap=gap, window=window),
+        expected,
+        strict=True,
+    ):
+        np.testing.assert_array_equal(train_index, expected_train)
+        np.testing.assert_array_equal(valid_index, expected_valid)
+
+
+def test_rejects_unsorted_dates() -> None:
+    with pytest.raises(ValueError, match="ascending"):
+        list(time_series_splits(make_dates(30)[::-1]))
+
+
+def test_rejects_too_few_dates() -> None:
+    with pytest.raises(ValueError, match="Not enough dates"):
+        list(time_series_splits(make_dates(10), n_splits=3, horizon=3, gap=2))
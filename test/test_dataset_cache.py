@@ -0,0 +1,130 @@
+import sys
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import lightgbm as lgb
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataset_cache import DatasetCache
+
+PARAMS = {"objective": "regression", "learning_rate": 0.1, "max_bin": 63}
+
+
+def make_data(n_rows: int = 500, n_features: int = 4, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """学習データ（特徴量と目標値）を作成する"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features))
+    return X, X.sum(axis=1) + rng.normal(size=n_rows)
+
+
+def entry_for(cache: DatasetCache, path: str) -> Dict[str, Any]:
+    """キャッシュの一覧から、ファイルに対応するエントリを取り出す"""
+    return next(entry for entry in cache.load_index() if entry["file"] == Path(path).name)
+
+
+def test_same_data_and_bin_params_hit(tmp_path: Path) -> None:
+    cache = DatasetCache(str(tmp_path))
+    X, y = make_data()
+    _, path = cache.get(X, y, PARAMS)
+    modified = Path(path).stat().st_mtime_ns
+
+    # ビン分割に関係しないパラメータが変わってもキャッシュを使う
+    dataset, hit_path = cache.get(X.copy(), y.copy(), {**PARAMS, "learning_rate": 0.05, "min_child_samples": 5})
+
+    assert hit_path == path
+    assert Path(path).stat().st_mtime_ns == modified
+    assert len(cache.load_index()) == 1
+    assert dataset.num_data() == len(X)
+
+
+def test_changed_data_misses(tmp_path: Path) -> None:
+    cache = DatasetCache(str(tmp_path))
+    X, y = make_data()
+    _, path = cache.get(X, y, PARAMS)
+
+    X_changed = X.copy()
+    X_changed[10, 2] += 1.0
+    _, changed_path = cache.get(X_changed, y, PARAMS)
+    y_changed = y.copy()
+    y_changed[-1] += 1.0
+    _, target_changed_path = cache.get(X, y_changed, PARAMS)
+
+    assert len({path, changed_path, target_changed_path}) == 3
+    assert len(cache.load_index()) == 3
+
+
+@pytest.mark.parametrize("bin_params", [{"max_bin": 31}, {"min_data_in_bin": 10}, {"use_missing": False}])
+def test_changed_bin_params_miss(tmp_path: Path, bin_params: Dict[str, Any]) -> None:
+    cache = DatasetCache(str(tmp_path))
+    X, y = make_data()
+    _, path = cache.get(X, y, PARAMS)
+
+    _, changed_path = cache.get(X, y, {**PARAMS, **bin_params})
+
+    assert changed_path != path
+    assert entry_for(cache, changed_path)["params_key"] != entry_for(cache, path)["params_key"]
+    # ビン分割のパラメータが異なるキャッシュのビンの境界は使わない
+    assert entry_for(cache, changed_path)["bins_rows"] == len(X)
+
+
+def test_appended_rows_reuse_base_bins(tmp_path: Path) -> None:
+    cache = DatasetCache(str(tmp_path))
+    X, y = make_data(600)
+    _, base_path = cache.get(X[:500], y[:500], PARAMS)
+    # 追加した行は元の範囲の外の値を持ち、目標値はその範囲の値で大きく変わる
+    X_appended = X.copy()
+    X_appended[500:] *= 10
+    y_appended = y + 10 * (X_appended[:, 0] > 8)
+
+    dataset, path = cache.get(X_appended, y_appended, PARAMS)
+
+    entry = entry_for(cache, path)
+    assert path != base_path
+    assert entry["n_rows"] == len(X_appended)
+    assert entry["bins_rows"] == entry_for(cache, base_path)["bins_rows"] == 500
+    assert dataset.num_data() == len(X_appended)
+    # 元のデータから求めたビンの境界を使うため、分割の閾値は元のデータの範囲に収まる
+    booster = lgb.train({**PARAMS, "verbose": -1}, dataset, num_boost_round=20)
+    assert booster.trees_to_dataframe()["threshold"].max() <= X[:500].max()
+
+
+def test_appended_rows_with_changed_prefix_rebuild_bins(tmp_path: Path) -> None:
+    cache = DatasetCache(str(tmp_path))
+    X, y = make_data(600)
+    cache.get(X[:500], y[:500], PARAMS)
+
+    # 先頭部分が前回の学習データと異なる場合は、前回のビンの境界を使わない
+    X_changed = X.copy()
+    X_changed[0, 0] += 1.0
+    _, path = cache.get(X_changed, y, PARAMS)
+
+    assert entry_for(cache, path)["bins_rows"] == len(X)
+
+
+def test_too_many_appended_rows_rebuild_bins(tmp_path: Path) -> None:
+    cache = DatasetCache(str(tmp_path), max_append_ratio=0.2)
+    X, y = make_data(700)
+    cache.get(X[:500], y[:500], PARAMS)
+
+    # 追加した行がビンの境界を求めたときの行数の2割を超える場合は、境界を求め直す
+    _, path = cache.get(X, y, PARAMS)
+
+    assert entry_for(cache, path)["bins_rows"] == len(X)
+
+
+def test_max_entries_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = DatasetCache(str(tmp_path), max_entries=2)
+    (X_a, y_a), (X_b, y_b), (X_c, y_c) = (make_data(seed=seed) for seed in range(3))
+    _, path_a = cache.get(X_a, y_a, PARAMS)
+    _, path_b = cache.get(X_b, y_b, PARAMS)
+    # Aを使ったため、次に追加したときはBが最も古いものとして削除される
+    cache.get(X_a, y_a, PARAMS)
+    _, path_c = cache.get(X_c, y_c, PARAMS)
+
+    assert [entry["file"] for entry in cache.load_index()] == [Path(path_a).name, Path(path_c).name]
+    assert Path(path_a).exists()
+    assert Path(path_c).exists()
+    assert not Path(path_b).exists()
@@ -0,0 +1,140 @@
+import sys
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from offline_store import EVENT_TIME_COLUMN, RECORD_ID_COLUMN, OfflineStoreReader, ParquetReader
+
+# 取り込みごとのイベント時刻と、取り込んだ日付の範囲（日次の取り込みで過去の日付も取り込み直す）
+INGESTS = [
+    ("2025-01-10T00:00:00Z", "2025-01-01", 10),
+    ("2025-01-11T00:00:00Z", "2025-01-05", 7),
+    ("2025-01-12T00:00:00Z", "2025-01-08", 5),
+]
+
+
+def write_offline_store(root: Path) -> pd.DataFrame:
+    """Offlineストアと同じ形式（イベント時刻のhiveパーティション、メタデータ列あり）のParquetを書き出す
+
+    Args:
+        root: 書き出すディレクトリ
+
+    Returns:
+        pd.DataFrame: 書き出した全レコード
+    """
+    frames = []
+    for number, (event_time, start_date, days) in enumerate(INGESTS):
+        dates = pd.date_range(start_date, periods=days).strftime("%Y-%m-%d")
+        frame = pd.DataFrame(
+            {
+                RECORD_ID_COLUMN: dates,
+                EVENT_TIME_COLUMN: event_time,
+                "date": dates,
+                "max_power": [1000 * (number + 1) + i for i in range(days)],
+                "write_time": pd.Timestamp(event_time).tz_localize(None),
+                "api_invocation_time": pd.Timestamp(event_time).tz_localize(None),
+                "is_deleted": False,
+            },
+        )
+        if number == len(INGESTS) - 1:
+            # 後から追加した特徴量（以前のファイルにはない列）
+            frame["cdd"] = 1.5
+        timestamp = pd.Timestamp(event_time)
+        partition = root / f"year={timestamp:%Y}/month={timestamp:%m}/day={timestamp:%d}/hour={timestamp:%H}"
+        partition.mkdir(parents=True)
+        # 1回の取り込みが複数のファイルに分かれる場合も再現する
+        half = len(frame) // 2
+        pq.write_table(pa.Table.from_pandas(frame.iloc[:half], preserve_index=False), partition / "part-0.parquet")
+        pq.write_table(pa.Table.from_pandas(frame.iloc[half:], preserve_index=False), partition / "part-1.parquet")
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_deletes(root: Path, event_time: str, dates: List[str]) -> pd.DataFrame:
+    """DeleteRecordでOfflineストアに書き込まれる削除のレコード（is_deleted=true）を書き出す
+
+    Args:
+        root: 書き出すディレクトリ
+        event_time: 削除のイベント時刻
+        dates: 削除するレコードの日付（record_id）
+
+    Returns:
+        pd.DataFrame: 書き出したレコード
+    """
+    frame = pd.DataFrame(
+        {
+            RECORD_ID_COLUMN: dates,
+            EVENT_TIME_COLUMN: event_time,
+            "date": dates,
+            "max_power": 0,
+            "write_time": pd.Timestamp(event_time).tz_localize(None),
+            "api_invocation_time": pd.Timestamp(event_time).tz_localize(None),
+            "is_deleted": True,
+        },
+    )
+    timestamp = pd.Timestamp(event_time)
+    partition = root / f"year={timestamp:%Y}/month={timestamp:%m}/day={timestamp:%d}/hour={timestamp:%H}"
+    partition.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), partition / "part-delete.parquet")
+    return frame
+
+
+def athena_latest(records: pd.DataFrame, start_date: str, end_date: str) -> pd.DataFrame:
+    """Athenaの ROW_NUMBER() OVER (PARTITION BY record_id ORDER BY event_time DESC) = 1 AND NOT is_deleted の結果を
+    pandasで求める
+    """
+    latest = records.sort_values(EVENT_TIME_COLUMN, ascending=False).drop_duplicates(RECORD_ID_COLUMN)
+    latest = latest[(latest["date"] >= start_date) & (latest["date"] <= end_date) & ~latest["is_deleted"]]
+    return latest.sort_values(RECORD_ID_COLUMN).reset_index(drop=True)
+
+
+def test_offline_store_reader_is_abstract() -> None:
+    with pytest.raises(TypeError):
+        OfflineStoreReader()
+
+
+@pytest.mark.parametrize(("start_date", "end_date"), [("2025-01-01", "2025-01-31"), ("2025-01-04", "2025-01-09")])
+def test_parquet_reader_keeps_latest_record(tmp_path: Path, start_date: str, end_date: str) -> None:
+    records = write_offline_store(tmp_path)
+
+    df = ParquetReader(str(tmp_path)).read(start_date, end_date)
+
+    expected = athena_latest(records, start_date, end_date)
+    assert df[RECORD_ID_COLUMN].is_unique
+    assert df[RECORD_ID_COLUMN].tolist() == expected[RECORD_ID_COLUMN].tolist()
+    assert df[EVENT_TIME_COLUMN].tolist() == expected[EVENT_TIME_COLUMN].tolist()
+    assert df["max_power"].tolist() == expected["max_power"].tolist()
+    # メタデータ列とパーティション列は読み込まない
+    assert {"write_time", "is_deleted", "year", "hour"}.isdisjoint(df.columns)
+    # 以前のファイルにない列は欠損値になる
+    assert df["cdd"].isna().tolist() == expected["cdd"].isna().tolist()
+
+
+def test_parquet_reader_reads_selected_columns(tmp_path: Path) -> None:
+    write_offline_store(tmp_path)
+
+    df = ParquetReader(str(tmp_path)).read("2025-01-01", "2025-01-31", columns=["max_power"])
+
+    assert list(df.columns) == [RECORD_ID_COLUMN, EVENT_TIME_COLUMN, "date", "max_power"]
+
+
+def test_parquet_reader_drops_deleted_records(tmp_path: Path) -> None:
+    records = write_offline_store(tmp_path)
+    # 2025-01-02は最新のレコードが削除、2025-01-09は削除の後に取り込み直したレコード
+    deletes = write_deletes(tmp_path, "2025-01-11T12:00:00Z", ["2025-01-02", "2025-01-09"])
+    records = pd.concat([records, deletes], ignore_index=True)
+
+    df = ParquetReader(str(tmp_path)).read("2025-01-01", "2025-01-31")
+
+    expected = athena_latest(records, "2025-01-01", "2025-01-31")
+    assert "2025-01-02" not in df[RECORD_ID_COLUMN].tolist()
+    assert "2025-01-09" in df[RECORD_ID_COLUMN].tolist()
+    assert df[RECORD_ID_COLUMN].tolist() == expected[RECORD_ID_COLUMN].tolist()
+    assert df["max_power"].tolist() == expected["max_power"].tolist()
+    assert "is_deleted" not in df.columns
@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+from typing import Union
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from power_usage_cache import CACHE_SCHEMA_VERSION, PowerUsageCache
+
+RECORDS = [{"date": "20240101", "max_power": 3000.0, "intraday": [2900.0, 3000.0]}]
+
+
+def write_entry(cache: PowerUsageCache, key: str, df: pd.DataFrame, schema_version: Union[int, None]) -> None:
+    """put()を使わずに、指定した形式のエントリをキャッシュに書き込む"""
+    df.to_parquet(cache.cache_dir / f"{key}.parquet", index=False)
+    cache.manifest[key] = {"file": f"{key}.parquet", "rows": len(df), "bytes": 0, "sha256": "", "last_access": 0}
+    if schema_version is not None:
+        cache.manifest[key]["schema_version"] = schema_version
+
+
+def test_get_returns_put_records(tmp_path: Path) -> None:
+    cache = PowerUsageCache(str(tmp_path))
+    cache.put("key", RECORDS)
+
+    records = cache.get("key")
+
+    assert records is not None
+    assert records[0]["max_power"] == RECORDS[0]["max_power"]
+    assert list(records[0]["intraday"]) == RECORDS[0]["intraday"]
+    assert cache.manifest["key"]["schema_version"] == CACHE_SCHEMA_VERSION
+
+
+def test_old_schema_entry_is_a_miss(tmp_path: Path) -> None:
+    cache = PowerUsageCache(str(tmp_path))
+    # intradayを追加する前の形式（schema_versionなし）のエントリ
+    write_entry(cache, "key", pd.DataFrame({"date": ["20240101"], "max_power": [3000.0]}), None)
+
+    assert cache.get("key") is None
+    assert cache.misses == 1
+    # パースし直したデータで上書きした後はヒットする
+    cache.put("key", RECORDS)
+    assert cache.get("key") is not None
+
+
+def test_entry_missing_column_is_a_miss(tmp_path: Path) -> None:
+    cache = PowerUsageCache(str(tmp_path))
+    write_entry(cache, "key", pd.DataFrame({"date": ["20240101"], "max_power": [3000.0]}), CACHE_SCHEMA_VERSION)
+
+    assert cache.get("key") is None
+    assert cache.misses == 1
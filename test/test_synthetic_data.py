@@ -0,0 +1,27 @@
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent))
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from synthetic_data import POWER_USAGE_HEADER_ROW, power_usage_csv
+
+from power_usage_parser import POWER_USAGE_COLUMN, SLOTS_PER_DAY, parse_daily_max, parse_intraday
+
+
+def test_power_usage_csv_matches_original_layout() -> None:
+    """元のDataLoaderと同じ読み込み方（skiprows=54）で5分間隔値を読み込めることを確認する"""
+    intraday = np.linspace(2500, 4000, SLOTS_PER_DAY).round()
+    content = power_usage_csv(pd.Timestamp("2024-07-01"), intraday)
+
+    df = pd.read_csv(io.BytesIO(content), encoding="shift-jis", skiprows=POWER_USAGE_HEADER_ROW)
+
+    assert POWER_USAGE_HEADER_ROW == 54
+    assert len(df) == SLOTS_PER_DAY
+    np.testing.assert_array_equal(df[POWER_USAGE_COLUMN].to_numpy(), intraday)
+    np.testing.assert_array_equal(parse_intraday(content), intraday)
+    assert parse_daily_max(content) == df[POWER_USAGE_COLUMN].max()
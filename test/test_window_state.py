@@ -0,0 +1,95 @@
+import sys
+from itertools import pairwise
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from window_state import WINDOW_FEATURES, WindowState, compute_window_features, verify_incremental
+
+
+def make_history(n_days: int = 120, seed: int = 0) -> pd.DataFrame:
+    """ラグ・移動窓特徴量の対象の系列を持つ日次の履歴（欠損値と観測のない日を含む）を作成する"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=n_days, freq="D")
+    df = pd.DataFrame(
+        {
+            "date": dates,
+            "max_power": rng.integers(2500, 4500, n_days).astype("int64"),
+            "max_temp": rng.normal(20, 8, n_days),
+            "cdd": rng.uniform(0, 10, n_days),
+            "hdd": rng.uniform(0, 10, n_days),
+        },
+    )
+    df.loc[[5, 50, 51], "max_temp"] = np.nan
+    # 観測のない日（EMRの出力に行がない日）
+    return df.drop(index=[30, 75]).reset_index(drop=True)
+
+
+def test_incremental_updates_match_full_recompute(tmp_path: Path) -> None:
+    history = make_history()
+    # 40日分の初回計算の後に、1日・3日・7日などの幅で日次の取り込みを繰り返す
+    bounds = [40, 41, 44, 51, 70, 100, len(history)]
+    initial = history.iloc[: bounds[0]]
+    increments = [history.iloc[start:end] for start, end in pairwise(bounds)]
+
+    # 初回は全履歴から計算してstateを作成し、以降は日次の取り込みのようにstateを保存・読み込みしながら更新する
+    window_state = WindowState.from_history(initial)
+    features = [compute_window_features(initial).assign(date=initial["date"])]
+    for increment in increments:
+        window_state.save(str(tmp_path))
+        window_state = WindowState.load(str(tmp_path))
+        features.append(window_state.update(increment).assign(date=increment["date"]))
+
+    incremental = pd.concat(features)
+    assert len(incremental) == len(history)
+    assert verify_incremental(history, incremental) <= 1e-6
+    assert window_state.last_date == history["date"].iloc[-1]
+
+
+def test_update_skips_processed_dates() -> None:
+    history = make_history()
+    window_state = WindowState.from_history(history.iloc[:60])
+
+    # 処理済みの日を含む範囲で更新しても、新しい日だけを処理する
+    features = window_state.update(history.iloc[50:70])
+
+    assert features.index.tolist() == history.index[60:70].tolist()
+    verify_incremental(history, features.assign(date=history["date"].iloc[60:70]))
+
+
+def test_verify_incremental_detects_mismatch() -> None:
+    history = make_history()
+    features = compute_window_features(history).assign(date=history["date"])
+    features.loc[features.index[-1], "max_power_mean_7"] += 1.0
+
+    with pytest.raises(ValueError, match="differ from full recompute"):
+        verify_incremental(history, features)
+
+
+def test_features_for_dates_only_fills_next_date() -> None:
+    history = make_history()
+    window_state = WindowState.from_history(history.iloc[:-1])
+    next_date = window_state.last_date + pd.Timedelta(days=1)
+    dates = pd.Series([next_date, next_date + pd.Timedelta(days=1), window_state.last_date, next_date])
+
+    features = window_state.features_for_dates(dates)
+
+    # 最終日の翌日の行は全履歴から計算した特徴量と一致し、それ以外の日付の行は欠損値になる
+    expected = compute_window_features(history).iloc[-1][WINDOW_FEATURES].to_numpy(dtype="float64")
+    np.testing.assert_allclose(features.iloc[0].to_numpy(), expected)
+    np.testing.assert_allclose(features.iloc[3].to_numpy(), expected)
+    assert features.iloc[[1, 2]].isna().all().all()
+    assert features.index.tolist() == dates.index.tolist()
+
+
+def test_features_for_dates_with_empty_state() -> None:
+    dates = pd.Series(pd.to_datetime(["2024-05-01", "2024-05-02"]))
+
+    features = WindowState().features_for_dates(dates)
+
+    assert list(features.columns) == WINDOW_FEATURES
+    assert features.isna().all().all()